@@ -1,58 +1,445 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, session, jsonify, g,
+                   has_request_context, make_response, stream_with_context)
+import bisect
+import click
+import csv
+import gzip
+import shutil
 import sqlite3
-from datetime import date
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from datetime import date, timedelta
+from functools import lru_cache, wraps
+import hashlib
+import hmac
+import importlib.util
+import io
+import json
+import logging
 import os
+import re
+import threading
+import time
+
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash, generate_password_hash
 
 DB_NAME = "mi_erp.db"
 
-# ⚠️ Solo para pruebas en Render: borra la base cada vez que arranca
-if os.path.exists(DB_NAME):
-    os.remove(DB_NAME)
-    print("⚠️ Base de datos eliminada, se regenerará desde schema.sql")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
 
 app = Flask(__name__)
 app.secret_key = "tu_clave_supersecreta"  # Cambia esto por una clave más segura en producción
 
-# -------------------- INIT DB (crea tablas desde schema.sql) --------------------
-def init_db():
-    with sqlite3.connect(DB_NAME) as conn:
-        with open("schema.sql", "r") as f:
-            conn.executescript(f.read())
-    print("✅ Base de datos inicializada con schema.sql")
-
-# Ejecutar inicialización
-init_db()
-
-
-# -------------------- MIGRACIÓN SUAVE DE USUARIOS --------------------
-def ensure_user_columns():
-    """Añade a 'usuarios' las columnas que falten y normaliza valores nulos."""
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+# En Render la app corre detrás de un proxy: sin ProxyFix remote_addr es la
+# IP del proxy para todos y el límite de login por IP sería uno solo para
+# todos los clientes. ERP_PROXIES es la cantidad de proxies de confianza
+# delante de gunicorn (0 si se expone directo; con más de los reales un
+# cliente podría falsear su IP con X-Forwarded-For).
+PROXIES_CONFIABLES = int(os.environ.get("ERP_PROXIES", "1"))
+if PROXIES_CONFIABLES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXIES_CONFIABLES)
+
+# -------------------- CONEXIÓN SQLITE --------------------
+# Pragmas por conexión. journal_mode=WAL es persistente en el archivo y se
+# fija una sola vez en init_db(); con WAL los lectores no se bloquean con
+# las escrituras de otros workers de gunicorn.
+SQLITE_TIMEOUT = 5.0  # segundos de espera si otro proceso tiene el lock
+SQLITE_PRAGMAS = (
+    ("synchronous", "NORMAL"),
+    ("foreign_keys", "ON"),
+    ("busy_timeout", int(SQLITE_TIMEOUT * 1000)),
+    ("mmap_size", 64 * 1024 * 1024),
+)
+
+
+def _conectar():
+    """Abre una conexión con row_factory y los pragmas de SQLITE_PRAGMAS.
+
+    Con las métricas activas la conexión es una ConexionMedida.
+    """
+    conn = sqlite3.connect(DB_NAME, timeout=SQLITE_TIMEOUT,
+                           factory=ConexionMedida if METRICAS_ACTIVAS else sqlite3.Connection)
+    conn.row_factory = sqlite3.Row
+    for nombre, valor in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {nombre} = {valor}")
+    return conn
+
+
+def get_db():
+    """Conexión de la request actual; se abre una vez y se cierra en el teardown."""
+    if "db" not in g:
+        g.db = _conectar()
+    return g.db
+
+
+@app.teardown_appcontext
+def close_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        # Si la vista falló a mitad de una escritura, un cursor vivo (p. ej. en
+        # el traceback) puede diferir el close() y dejar el lock tomado
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
 
-    c.execute("PRAGMA table_info(usuarios)")
-    cols = {row[1] for row in c.fetchall()}
 
-    def add_col(name, ddl):
-        if name not in cols:
-            c.execute(f"ALTER TABLE usuarios ADD COLUMN {name} {ddl}")
+# -------------------- MÉTRICAS --------------------
+# Se activan con ERP_METRICAS=1; apagadas no se registra ningún hook ni la
+# ruta /metrics y las conexiones son sqlite3.Connection normales.
+# Con ERP_METRICAS_DIR cada worker de gunicorn vuelca sus contadores a
+# <dir>/<pid>.json (cada METRICAS_VOLCADO segundos) y /metrics suma todos
+# los archivos; sin directorio solo se ve el worker que responde.
+# /metrics (nombres de rutas, tiempos y texto de SQL) exige el encabezado
+# "Authorization: Bearer <ERP_METRICAS_TOKEN>" o una sesión de admin.
+METRICAS_ACTIVAS = os.environ.get("ERP_METRICAS") == "1"
+METRICAS_DIR = os.environ.get("ERP_METRICAS_DIR") or None
+METRICAS_TOKEN = os.environ.get("ERP_METRICAS_TOKEN") or None
+METRICAS_VOLCADO = 5.0
+SQL_LENTA = float(os.environ.get("ERP_SQL_LENTA", "0.1"))  # segundos
+LATENCIA_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log_sql = logging.getLogger("erp.sql")
+
+
+class Metricas:
+    """Contadores del worker: latencia por endpoint (histograma) y consultas SQL.
+
+    Los aciertos y fallos de los cachés en memoria (CACHES) se leen al volcar.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ultimo_volcado = 0.0
+        self.datos = {"peticiones": {}, "latencia": {}, "sql": {}, "sql_lentas": 0}
+
+    def registrar(self, endpoint, codigo, duracion, consultas, tiempo_sql):
+        with self._lock:
+            peticiones = self.datos["peticiones"].setdefault(endpoint, {})
+            peticiones[str(codigo)] = peticiones.get(str(codigo), 0) + 1
+            hist = self.datos["latencia"].setdefault(
+                endpoint, {"buckets": [0] * len(LATENCIA_BUCKETS), "suma": 0.0, "cantidad": 0})
+            for i, limite in enumerate(LATENCIA_BUCKETS):
+                if duracion <= limite:
+                    hist["buckets"][i] += 1
+            hist["suma"] += duracion
+            hist["cantidad"] += 1
+            sql = self.datos["sql"].setdefault(endpoint, {"consultas": 0, "segundos": 0.0})
+            sql["consultas"] += consultas
+            sql["segundos"] += tiempo_sql
+
+    def consulta_lenta(self):
+        with self._lock:
+            self.datos["sql_lentas"] += 1
+
+    def _instantanea(self):
+        """Copia de los contadores más los de cada caché; se llama con el lock tomado."""
+        caches = {nombre: {"hits": cache.hits, "misses": cache.misses} for nombre, cache in CACHES.items()}
+        return json.dumps({**self.datos, "caches": caches})
+
+    def volcar(self, forzar=False):
+        """Escribe los contadores en METRICAS_DIR/<pid>.json (reemplazo atómico)."""
+        if not METRICAS_DIR or (not forzar and time.monotonic() - self._ultimo_volcado < METRICAS_VOLCADO):
+            return
+        with self._lock:
+            contenido = self._instantanea()
+            self._ultimo_volcado = time.monotonic()
+        os.makedirs(METRICAS_DIR, exist_ok=True)
+        ruta = os.path.join(METRICAS_DIR, f"{os.getpid()}.json")
+        with open(ruta + ".tmp", "w") as f:
+            f.write(contenido)
+        os.replace(ruta + ".tmp", ruta)
+
+    def agregadas(self):
+        """Suma de todos los workers (o solo este si no hay METRICAS_DIR)."""
+        if not METRICAS_DIR:
+            with self._lock:
+                return [json.loads(self._instantanea())]
+        self.volcar(forzar=True)
+        todas = []
+        for nombre in os.listdir(METRICAS_DIR):
+            if nombre.endswith(".json"):
+                try:
+                    with open(os.path.join(METRICAS_DIR, nombre)) as f:
+                        todas.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return todas
+
+
+metricas = Metricas()
+
+
+def _medir_sql(conn, ejecutar, sql, params, muchas=False):
+    """Ejecuta y acumula tiempo/cantidad en g; registra las consultas lentas con su plan.
+
+    Con ``muchas`` (executemany) ``params`` es una secuencia de filas: el
+    plan se pide con la primera. Si llegó un iterador ya está consumido y
+    se registra sin plan.
+    """
+    inicio = time.perf_counter()
+    try:
+        return ejecutar(sql, params)
+    finally:
+        duracion = time.perf_counter() - inicio
+        if has_request_context():
+            g.sql_consultas = g.get("sql_consultas", 0) + 1
+            g.sql_tiempo = g.get("sql_tiempo", 0.0) + duracion
+        if duracion >= SQL_LENTA and not sql.lstrip().upper().startswith(("EXPLAIN", "PRAGMA")):
+            metricas.consulta_lenta()
+            if muchas:
+                muestra = params[0] if isinstance(params, (tuple, list)) and params else None
+            else:
+                muestra = params if isinstance(params, (tuple, list, dict)) else ()
+            plan = ["sin plan: executemany con iterador"]
+            if muestra is not None:
+                try:
+                    plan = [fila[3] for fila in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, muestra)]
+                except sqlite3.Error as e:
+                    plan = [f"sin plan: {e}"]
+            log_sql.warning("Consulta lenta (%.1f ms%s): %s | plan: %s",
+                            duracion * 1000, ", executemany" if muchas else "",
+                            " ".join(sql.split()), " / ".join(plan))
+
+
+class CursorMedido(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        return _medir_sql(self.connection, super().execute, sql, params)
+
+    def executemany(self, sql, params):
+        return _medir_sql(self.connection, super().executemany, sql, params, muchas=True)
+
+
+class ConexionMedida(sqlite3.Connection):
+    """Conexión que mide cada consulta (ver _medir_sql)."""
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+
+def _texto_prometheus(todas):
+    """Formato de texto de Prometheus a partir de los contadores de cada worker."""
+    peticiones, latencia, sql, caches = {}, {}, {}, {}
+    lentas = 0
+    for datos in todas:
+        lentas += datos.get("sql_lentas", 0)
+        for nombre, valores in datos.get("caches", {}).items():
+            total = caches.setdefault(nombre, {"hits": 0, "misses": 0})
+            total["hits"] += valores["hits"]
+            total["misses"] += valores["misses"]
+        for endpoint, codigos in datos.get("peticiones", {}).items():
+            for codigo, n in codigos.items():
+                peticiones[(endpoint, codigo)] = peticiones.get((endpoint, codigo), 0) + n
+        for endpoint, hist in datos.get("latencia", {}).items():
+            total = latencia.setdefault(endpoint, {"buckets": [0] * len(LATENCIA_BUCKETS), "suma": 0.0, "cantidad": 0})
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], hist["buckets"])]
+            total["suma"] += hist["suma"]
+            total["cantidad"] += hist["cantidad"]
+        for endpoint, valores in datos.get("sql", {}).items():
+            total = sql.setdefault(endpoint, {"consultas": 0, "segundos": 0.0})
+            total["consultas"] += valores["consultas"]
+            total["segundos"] += valores["segundos"]
+
+    lineas = [
+        "# HELP erp_http_requests_total Peticiones atendidas por endpoint y código HTTP.",
+        "# TYPE erp_http_requests_total counter",
+    ]
+    for (endpoint, codigo), n in sorted(peticiones.items()):
+        lineas.append(f'erp_http_requests_total{{endpoint="{endpoint}",code="{codigo}"}} {n}')
+    lineas += [
+        "# HELP erp_http_request_duration_seconds Latencia de las peticiones por endpoint.",
+        "# TYPE erp_http_request_duration_seconds histogram",
+    ]
+    for endpoint, hist in sorted(latencia.items()):
+        for limite, n in zip(LATENCIA_BUCKETS, hist["buckets"]):
+            lineas.append(f'erp_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{limite}"}} {n}')
+        lineas.append(f'erp_http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {hist["cantidad"]}')
+        lineas.append(f'erp_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {hist["suma"]:.6f}')
+        lineas.append(f'erp_http_request_duration_seconds_count{{endpoint="{endpoint}"}} {hist["cantidad"]}')
+    lineas += [
+        "# HELP erp_sql_queries_total Consultas SQL ejecutadas por endpoint.",
+        "# TYPE erp_sql_queries_total counter",
+    ]
+    lineas += [f'erp_sql_queries_total{{endpoint="{e}"}} {v["consultas"]}' for e, v in sorted(sql.items())]
+    lineas += [
+        "# HELP erp_sql_seconds_total Tiempo en consultas SQL por endpoint.",
+        "# TYPE erp_sql_seconds_total counter",
+    ]
+    lineas += [f'erp_sql_seconds_total{{endpoint="{e}"}} {v["segundos"]:.6f}' for e, v in sorted(sql.items())]
+    lineas += [
+        f"# HELP erp_sql_slow_queries_total Consultas de {SQL_LENTA} s o más (ver log erp.sql).",
+        "# TYPE erp_sql_slow_queries_total counter",
+        f"erp_sql_slow_queries_total {lentas}",
+        "# HELP erp_cache_hits_total Lecturas resueltas por cada caché en memoria.",
+        "# TYPE erp_cache_hits_total counter",
+    ]
+    lineas += [f'erp_cache_hits_total{{cache="{n}"}} {v["hits"]}' for n, v in sorted(caches.items())]
+    lineas += [
+        "# HELP erp_cache_misses_total Lecturas que cada caché en memoria no tenía o tenía vencidas.",
+        "# TYPE erp_cache_misses_total counter",
+    ]
+    lineas += [f'erp_cache_misses_total{{cache="{n}"}} {v["misses"]}' for n, v in sorted(caches.items())]
+    return "\n".join(lineas) + "\n"
+
+
+if METRICAS_ACTIVAS:
+    @app.before_request
+    def _iniciar_medicion():
+        g.inicio_peticion = time.perf_counter()
+
+    @app.after_request
+    def _registrar_medicion(resp):
+        if "inicio_peticion" in g and request.endpoint != "metrics":
+            metricas.registrar(
+                request.endpoint or "sin_ruta", resp.status_code,
+                time.perf_counter() - g.inicio_peticion,
+                g.get("sql_consultas", 0), g.get("sql_tiempo", 0.0),
+            )
+            metricas.volcar()
+        return resp
+
+    def _metricas_autorizadas():
+        if METRICAS_TOKEN and hmac.compare_digest(
+                request.headers.get("Authorization", "").encode(), f"Bearer {METRICAS_TOKEN}".encode()):
+            return True
+        permisos = _permisos_usuario(session["user_id"]) if "user_id" in session else {}
+        return bool(permisos) and permisos["admin"]
+
+    @app.route("/metrics")
+    def metrics():
+        if not _metricas_autorizadas():
+            resp = jsonify({"ok": False, "error": "No autenticado"})
+            resp.status_code = 401
+            resp.headers["WWW-Authenticate"] = "Bearer"
+            return resp
+        return app.response_class(_texto_prometheus(metricas.agregadas()),
+                                  mimetype="text/plain; version=0.0.4")
+
+
+# -------------------- CACHÉ EN MEMORIA --------------------
+CACHES = {}  # nombre -> CacheLRU, para las métricas
+
+
+class CacheLRU:
+    """Caché LRU acotado con TTL, local a cada worker.
+
+    Cada entrada guarda la versión de datos con la que se armó; si la versión
+    actual (tabla ``versiones``) es otra, la entrada se descarta. Se registra
+    en CACHES con ``nombre``: /metrics expone sus aciertos y fallos.
+    """
+
+    def __init__(self, nombre, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._datos = OrderedDict()
+        CACHES[nombre] = self
+        self._lock = threading.Lock()
+
+    def get(self, clave, version):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada and entrada[0] == version and entrada[1] > time.monotonic():
+                self._datos.move_to_end(clave)
+                self.hits += 1
+                return entrada[2]
+            if entrada:
+                del self._datos[clave]
+            self.misses += 1
+            return None
 
-    add_col("password", "TEXT DEFAULT ''")
-    add_col("is_admin", "INTEGER DEFAULT 0")
-    add_col("mod_pedidos", "INTEGER DEFAULT 1")
-    add_col("mod_movimientos", "INTEGER DEFAULT 1")
-    add_col("mod_admin", "INTEGER DEFAULT 0")
-    add_col("mod_usuarios", "INTEGER DEFAULT 0")
+    def set(self, clave, version, valor):
+        with self._lock:
+            self._datos[clave] = (version, time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+def _version_datos(conn, clave):
+    """Versión actual de un grupo de datos (ver migración 0005)."""
+    row = conn.execute("SELECT valor FROM versiones WHERE clave=?", (clave,)).fetchone()
+    return row[0] if row else 0
+
+
+cache_catalogo = CacheLRU("catalogo", maxsize=256, ttl=300)
+cache_tipos_cambio = CacheLRU("tipos_cambio", maxsize=4, ttl=3600)
+cache_permisos = CacheLRU("permisos", maxsize=1024, ttl=300)
+cache_filas_movimientos = CacheLRU("filas_movimientos", maxsize=5000, ttl=3600)  # HTML por fila (~1.5 KB), ver _filas_movimientos
+
+
+# -------------------- MIGRACIONES --------------------
+def _listar_migraciones():
+    """Archivos NNNN_nombre.sql / NNNN_nombre.py de migrations/, en orden."""
+    migraciones = []
+    for nombre in os.listdir(MIGRATIONS_DIR):
+        base, ext = os.path.splitext(nombre)
+        numero = base.split("_", 1)[0]
+        if ext in (".sql", ".py") and numero.isdigit():
+            migraciones.append((int(numero), nombre))
+    return sorted(migraciones)
+
+
+def aplicar_migraciones(conn):
+    """Aplica en orden las migraciones pendientes y las registra en schema_version.
+
+    Cada migración corre en su propia transacción: si falla, no queda a medias
+    ni registrada. Los .sql se ejecutan como script; los .py deben definir
+    ``upgrade(conn)``.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            aplicada_en TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    actual = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+    aplicadas = []
+    for version, nombre in _listar_migraciones():
+        if version <= actual:
+            continue
+        ruta = os.path.join(MIGRATIONS_DIR, nombre)
+        try:
+            if nombre.endswith(".sql"):
+                with open(ruta, "r", encoding="utf-8") as f:
+                    # executescript hace COMMIT antes de empezar; el BEGIN deja
+                    # abierta la transacción hasta registrar la versión
+                    conn.executescript("BEGIN;\n" + f.read())
+            else:
+                spec = importlib.util.spec_from_file_location(f"migracion_{version:04d}", ruta)
+                modulo = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(modulo)
+                conn.execute("BEGIN")
+                modulo.upgrade(conn)
+            conn.execute("INSERT INTO schema_version (version, nombre) VALUES (?, ?)", (version, nombre))
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        aplicadas.append(nombre)
+    return aplicadas
 
-    # Normalizar NULLs a sus defaults
-    c.execute("UPDATE usuarios SET password = COALESCE(password, '')")
-    c.execute("UPDATE usuarios SET is_admin = COALESCE(is_admin, 0)")
-    c.execute("UPDATE usuarios SET mod_pedidos = COALESCE(mod_pedidos, 1)")
-    c.execute("UPDATE usuarios SET mod_movimientos = COALESCE(mod_movimientos, 1)")
-    c.execute("UPDATE usuarios SET mod_admin = COALESCE(mod_admin, 0)")
-    c.execute("UPDATE usuarios SET mod_usuarios = COALESCE(mod_usuarios, 0)")
 
-    conn.commit()
+def init_db():
+    with sqlite3.connect(DB_NAME) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
+        for nombre in aplicar_migraciones(conn):
+            print(f"✅ Migración aplicada: {nombre}")
     conn.close()
 
 
@@ -66,31 +453,344 @@ def ensure_admin_user():
         c.execute("""
             INSERT INTO usuarios (username, password, is_admin, mod_pedidos, mod_movimientos, mod_admin, mod_usuarios)
             VALUES (?, ?, 1, 1, 1, 1, 1)
-        """, ("Administrador", "1812"))
+        """, ("Administrador", generate_password_hash("1812")))
         conn.commit()
     conn.close()
 
-# Ejecutar migraciones y admin inicial
-ensure_user_columns()
-ensure_admin_user()
 
+# -------------------- ARRANQUE --------------------
+# Migraciones y admin se preparan una sola vez por base. Bajo gunicorn lo hace
+# el master en on_starting (ver gunicorn.conf.py) antes de crear workers; en el
+# resto de casos (flask run, CLI, scripts) cada proceso solo comprueba
+# schema_version al importar, y si falta algo el lock de archivo evita que
+# dos procesos migren a la vez.
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock (el servidor de desarrollo es un solo proceso)
+    fcntl = None
+
+
+def _base_al_dia():
+    """True si la base tiene WAL, todas las migraciones y el admin. Solo lee."""
+    if not os.path.exists(DB_NAME):
+        return False
+    ultima = _listar_migraciones()[-1][0]
+    conn = sqlite3.connect(DB_NAME, timeout=SQLITE_TIMEOUT)
+    try:
+        modo = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+        admin = conn.execute("SELECT 1 FROM usuarios WHERE username = ?", ("Administrador",)).fetchone()
+    except sqlite3.OperationalError:  # base vacía o anterior a schema_version
+        return False
+    finally:
+        conn.close()
+    return modo == "wal" and (version or 0) >= ultima and admin is not None
+
+
+def preparar_base():
+    """Aplica migraciones pendientes y crea el admin si hace falta.
+
+    Devuelve True si tuvo que preparar algo. Seguro con varios procesos: el
+    que toma el lock prepara, los demás esperan y vuelven a comprobar.
+    """
+    if _base_al_dia():
+        return False
+    with open(DB_NAME + ".lock", "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if _base_al_dia():
+            return False
+        init_db()
+        ensure_admin_user()
+    return True
+
+
+preparar_base()
+
+
+
+# -------------------- PERMISOS --------------------
+MODULOS = ("pedidos", "movimientos", "admin", "usuarios")
+
+
+def _permisos_usuario(user_id):
+    """Permisos vigentes del usuario ({} si ya no existe), una vez por petición.
+
+    Salen de cache_permisos mientras no cambie la versión 'permisos' (una
+    búsqueda por PK en versiones); la fila de usuarios solo se lee al
+    cambiar algún usuario.
+    """
+    if "permisos" not in g:
+        conn = get_db()
+        version = _version_datos(conn, "permisos")
+        permisos = cache_permisos.get(user_id, version)
+        if permisos is None:
+            row = conn.execute(
+                "SELECT username, mod_pedidos, mod_movimientos, mod_admin, mod_usuarios FROM usuarios WHERE id=?",
+                (user_id,),
+            ).fetchone()
+            permisos = {"user": row["username"], **{m: bool(row[f"mod_{m}"]) for m in MODULOS}} if row else {}
+            cache_permisos.set(user_id, version, permisos)
+        g.permisos = permisos
+    return g.permisos
+
+
+def requires(*modulos, api=False):
+    """Exige sesión iniciada y, si se indican módulos, permiso en alguno de ellos.
+
+    Las rutas ``api`` responden 401/403 en JSON; las páginas redirigen al
+    login o al dashboard. Los permisos de la sesión (que usan las plantillas)
+    se actualizan con los vigentes.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            permisos = _permisos_usuario(session["user_id"]) if "user_id" in session else {}
+            if not permisos:
+                session.clear()
+                if api:
+                    return jsonify({"ok": False, "error": "No autenticado"}), 401
+                return redirect(url_for("login"))
+
+            vigentes = {"user": permisos["user"], **{f"mod_{m}": permisos[m] for m in MODULOS}}
+            for clave, valor in vigentes.items():
+                if session.get(clave) != valor:
+                    session[clave] = valor
+
+            if modulos and not any(permisos[m] for m in modulos):
+                if api:
+                    return jsonify({"ok": False, "error": "Sin permiso"}), 403
+                return redirect(url_for("dashboard"))
+            return vista(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+# -------------------- PÁGINAS CONDICIONALES Y COMPRESIÓN --------------------
+# Las páginas HTML llevan un ETag armado con las versiones de los datos que
+# muestran (tabla versiones), el código desplegado, la sesión, la fecha y
+# la query. Si el navegador ya tiene esa versión se responde 304 sin
+# consultar ni renderizar nada más. HTML y JSON desde COMPRESION_MINIMA bytes salen con
+# gzip si el cliente lo acepta.
+COMPRESION_MINIMA = 1024  # bytes; por debajo gzip casi no ahorra
+COMPRESION_NIVEL = 6
+COMPRESION_TIPOS = ("text/html", "application/json")
+
+
+def _version_despliegue():
+    """Token del código desplegado: ERP_VERSION (p. ej. el commit) o la fecha de app.py y las plantillas.
+
+    Entra en el ETag de las páginas para que, tras un despliegue que cambia
+    HTML o JS, los navegadores no sigan recibiendo 304 sobre la versión vieja.
+    """
+    if os.environ.get("ERP_VERSION"):
+        return os.environ["ERP_VERSION"]
+    carpeta = os.path.join(app.root_path, app.template_folder)
+    archivos = [__file__] + sorted(os.path.join(carpeta, n) for n in os.listdir(carpeta))
+    return hashlib.sha1(repr([(a, os.path.getmtime(a)) for a in archivos]).encode()).hexdigest()[:12]
+
+
+VERSION_DESPLIEGUE = _version_despliegue()
+
+
+def condicional(*claves):
+    """ETag y 304 para una página que depende de las versiones ``claves``.
+
+    Va debajo de requires: la sesión ya tiene los permisos al día, y el
+    layout los renderiza.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            marcadores = ", ".join("?" * len(claves))
+            versiones = dict(get_db().execute(
+                f"SELECT clave, valor FROM versiones WHERE clave IN ({marcadores})", claves
+            ).fetchall())
+            firma = json.dumps([
+                VERSION_DESPLIEGUE, request.full_path, sorted(session.items()), date.today().isoformat(),
+                [versiones.get(clave, 0) for clave in claves],
+            ], default=str)
+            etag = hashlib.sha1(firma.encode()).hexdigest()[:16]
+            if request.if_none_match.contains_weak(etag):
+                resp = app.response_class(status=304)
+            else:
+                resp = make_response(vista(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = "private, no-cache"
+            return resp
+        return envoltura
+    return decorador
+
+
+@app.after_request
+def _comprimir(resp):
+    if resp.mimetype not in COMPRESION_TIPOS or resp.direct_passthrough or resp.is_streamed:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if (resp.status_code != 200 or "Content-Encoding" in resp.headers
+            or "gzip" not in request.accept_encodings or (resp.content_length or 0) < COMPRESION_MINIMA):
+        return resp
+    resp.set_data(gzip.compress(resp.get_data(), compresslevel=COMPRESION_NIVEL, mtime=0))
+    resp.headers["Content-Encoding"] = "gzip"
+    # El ETag es del contenido sin comprimir: la versión gzip es equivalente, no idéntica
+    etag, debil = resp.get_etag()
+    if etag and not debil:
+        resp.set_etag(etag, weak=True)
+    return resp
 
 
 # -------------------- LOGIN --------------------
+# La verificación (scrypt, ~150 ms) es cara en CPU: se hace en un pool
+# acotado para que una ráfaga de logins no ocupe todos los hilos del worker.
+# Cada verificación admitida retiene además el hilo de la petición mientras
+# espera, así que el cupo (LOGIN_HILOS + LOGIN_COLA) debe quedar muy por
+# debajo de los hilos de gunicorn (ERP_HILOS); pasado el cupo se responde
+# 503 enseguida. Con una verificación en espera por hilo del pool, nadie
+# espera en cola más de un hash; LOGIN_TIMEOUT solo corta esa espera si la
+# CPU está saturada (una verificación ya empezada se termina).
+LOGIN_HILOS = 2
+LOGIN_COLA = LOGIN_HILOS
+LOGIN_TIMEOUT = 0.3  # segundos de espera máxima en cola (unos dos hashes)
+_pool_login_lock = threading.Lock()
+_pool_login_creado = None
+
+
+def _pool_login():
+    """(pool, cupos) de verificación, creados en el primer login de cada worker.
+
+    No se crean al importar: gunicorn importa app en el master (ver
+    gunicorn.conf.py) y con workers gevent la cola del pool debe crearse
+    después del monkey-patching que hace cada worker.
+    """
+    global _pool_login_creado
+    with _pool_login_lock:
+        if _pool_login_creado is None:
+            _pool_login_creado = (
+                ThreadPoolExecutor(max_workers=LOGIN_HILOS, thread_name_prefix="login"),
+                threading.BoundedSemaphore(LOGIN_HILOS + LOGIN_COLA),
+            )
+        return _pool_login_creado
+
+
+@lru_cache(maxsize=1)
+def _hash_ficticio():
+    """Hash contra el que se verifica a usuarios inexistentes: misma demora que uno real.
+
+    Se calcula al primer uso y no al importar (scrypt cuesta ~150 ms por
+    proceso); gunicorn lo precalcula en el master (ver gunicorn.conf.py).
+    """
+    return generate_password_hash("-")
+
+
+class LimiteIntentos:
+    """Intentos fallidos por clave (usuario o IP) en una ventana deslizante, en memoria.
+
+    Guarda a lo sumo ``maxsize`` claves; al llenarse descarta las usadas hace
+    más tiempo. Es local a cada worker, igual que CacheLRU.
+    """
+
+    def __init__(self, limite, ventana=300, maxsize=10000):
+        self.limite = limite
+        self.ventana = ventana
+        self.maxsize = maxsize
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _vigentes(self, clave, ahora):
+        intentos = [t for t in self._datos.get(clave, ()) if t > ahora - self.ventana]
+        if intentos:
+            self._datos[clave] = intentos
+            self._datos.move_to_end(clave)
+        else:
+            self._datos.pop(clave, None)
+        return intentos
+
+    def bloqueado(self, clave):
+        with self._lock:
+            return len(self._vigentes(clave, time.monotonic())) >= self.limite
+
+    def fallo(self, clave):
+        with self._lock:
+            ahora = time.monotonic()
+            self._datos[clave] = self._vigentes(clave, ahora) + [ahora]
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def limpiar(self, clave=None):
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+
+
+limite_por_usuario = LimiteIntentos(limite=5)
+limite_por_ip = LimiteIntentos(limite=30)
+
+
+def _es_hash(valor):
+    return (valor or "").startswith(("scrypt:", "pbkdf2:"))
+
+
+def _verificar_password(guardado, password):
+    """(válida, hash nuevo) para ``password`` contra lo guardado.
+
+    Las contraseñas heredadas en texto plano se comparan directo y, si son
+    correctas, se devuelve su hash para guardarlo (actualización transparente).
+    """
+    if _es_hash(guardado):
+        return check_password_hash(guardado, password), None
+    if guardado and hmac.compare_digest(guardado.encode(), password.encode()):
+        return True, generate_password_hash(password)
+    return False, None
+
+
+def _verificar_en_pool(guardado, password):
+    """Corre _verificar_password en el pool; None si el pool está saturado."""
+    pool, cupos = _pool_login()
+    if not cupos.acquire(blocking=False):
+        return None
+    # El cupo se libera cuando termina la verificación, aunque aquí se deje de esperar
+    futuro = pool.submit(_verificar_password, guardado, password)
+    futuro.add_done_callback(lambda _: cupos.release())
+    try:
+        return futuro.result(timeout=LOGIN_TIMEOUT)
+    except FuturesTimeout:
+        # Si sigue en cola se descarta; si ya empezó, el hash está casi pago
+        if futuro.cancel():
+            return None
+        return futuro.result()
+
+
 @app.route("/", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
+        ip = request.remote_addr or ""
+
+        if limite_por_usuario.bloqueado(username) or limite_por_ip.bloqueado(ip):
+            return render_template("login.html", error="Demasiados intentos, espere unos minutos"), 429
 
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         c = conn.cursor()
-        c.execute("SELECT * FROM usuarios WHERE username=? AND password=?", (username, password))
+        c.execute("SELECT * FROM usuarios WHERE username=?", (username,))
         user = c.fetchone()
-        conn.close()
 
-        if user:
+        verificacion = _verificar_en_pool(user["password"] if user else _hash_ficticio(), password)
+        if verificacion is None:
+            return render_template("login.html", error="Servidor ocupado, intente de nuevo"), 503, {"Retry-After": "1"}
+        valido, nuevo_hash = verificacion
+
+        if user and valido:
+            limite_por_usuario.limpiar(username)
+            if nuevo_hash:
+                c.execute("UPDATE usuarios SET password=? WHERE id=?", (nuevo_hash, user["id"]))
+                conn.commit()
+
             session["user"] = user["username"]
             session["user_id"] = user["id"]
 
@@ -102,6 +802,8 @@ def login():
 
             return redirect(url_for("dashboard"))
         else:
+            limite_por_usuario.fallo(username)
+            limite_por_ip.fallo(ip)
             return render_template("login.html", error="Usuario o contraseña incorrectos")
 
     return render_template("login.html")
@@ -111,325 +813,1036 @@ def login():
 
 # -------------------- DASHBOARD --------------------
 @app.route("/dashboard")
+@requires()
 def dashboard():
-    if "user" not in session:
-        return redirect(url_for("login"))
     return render_template("index.html")
 
+# -------------------- API DASHBOARD --------------------
+def _kpis_dashboard(c, desde, hasta, con_pedidos=True, con_movimientos=True):
+    """KPIs leídos de las tablas de resumen (migración 0006), nunca de las tablas crudas."""
+    kpis = {"desde": desde, "hasta": hasta}
+
+    if con_pedidos:
+        rango = (desde, hasta)
+        c.execute("""
+            SELECT moneda, SUM(cantidad) AS pedidos, SUM(importe) AS importe,
+                   SUM(gasto) AS gasto, SUM(ingresos) AS ingresos
+            FROM resumen_pedidos_diario
+            WHERE fecha BETWEEN ? AND ?
+            GROUP BY moneda
+        """, rango)
+        kpis["totales"] = {
+            r["moneda"]: {
+                "pedidos": r["pedidos"],
+                "importe": round(r["importe"], 2),
+                "gasto": round(r["gasto"], 2),
+                "margen": round(r["importe"] - r["gasto"], 2),
+                "ingresos": round(r["ingresos"], 2),
+                "por_cobrar": round(r["importe"] - r["ingresos"], 2),
+            }
+            for r in c.fetchall()
+        }
+
+        c.execute("""
+            SELECT substr(fecha, 1, 7) AS mes, moneda, SUM(cantidad) AS pedidos,
+                   SUM(importe) AS importe, SUM(gasto) AS gasto, SUM(ingresos) AS ingresos
+            FROM resumen_pedidos_diario
+            WHERE fecha BETWEEN ? AND ?
+            GROUP BY mes, moneda
+            ORDER BY mes
+        """, rango)
+        kpis["por_mes"] = [
+            {"mes": r["mes"], "moneda": r["moneda"], "pedidos": r["pedidos"],
+             "importe": round(r["importe"], 2), "margen": round(r["importe"] - r["gasto"], 2),
+             "ingresos": round(r["ingresos"], 2)}
+            for r in c.fetchall()
+        ]
+
+        for dimension in ("etapa", "canal"):
+            c.execute(f"""
+                SELECT {dimension} AS clave, moneda, SUM(cantidad) AS pedidos, SUM(importe) AS importe
+                FROM resumen_pedidos_diario
+                WHERE fecha BETWEEN ? AND ?
+                GROUP BY {dimension}, moneda
+                ORDER BY pedidos DESC
+            """, rango)
+            kpis[f"por_{dimension}"] = [
+                {dimension: r["clave"], "moneda": r["moneda"], "pedidos": r["pedidos"],
+                 "importe": round(r["importe"], 2)}
+                for r in c.fetchall()
+            ]
+
+        hoy = date.today().isoformat()
+        c.execute("""
+            SELECT moneda,
+                   SUM(CASE WHEN fecha_entrega_propuesta < ? THEN cantidad ELSE 0 END) AS vencidos,
+                   SUM(CASE WHEN fecha_entrega_propuesta = ? THEN cantidad ELSE 0 END) AS vencen_hoy
+            FROM resumen_entregas_pendientes
+            WHERE fecha_entrega_propuesta <= ?
+            GROUP BY moneda
+        """, (hoy, hoy, hoy))
+        kpis["entregas"] = {
+            r["moneda"]: {"vencidos": r["vencidos"], "vencen_hoy": r["vencen_hoy"]}
+            for r in c.fetchall()
+        }
+
+        efectivo_pen, efectivo_usd = _efectivo_en_caja(c)
+        kpis["caja"] = {"PEN": efectivo_pen, "USD": efectivo_usd}
+
+    if con_movimientos:
+        c.execute("""
+            SELECT r.tipo, COALESCE(cat.nombre, '') AS categoria, r.cantidad, r.total
+            FROM resumen_movimientos r
+            LEFT JOIN categorias cat ON cat.id = r.categoria_id
+            WHERE r.cantidad > 0
+            ORDER BY r.tipo, r.total DESC
+        """)
+        kpis["movimientos"] = [
+            {"tipo": r["tipo"], "categoria": r["categoria"], "cantidad": r["cantidad"],
+             "total": round(r["total"], 2)}
+            for r in c.fetchall()
+        ]
+
+    return kpis
+
+
+@app.route("/api/dashboard")
+@requires(api=True)
+def api_dashboard():
+    hoy = date.today()
+    desde = request.args.get("desde") or (hoy - timedelta(days=365)).isoformat()
+    hasta = request.args.get("hasta") or hoy.isoformat()
+    c = get_db().cursor()
+    kpis = _kpis_dashboard(
+        c, desde, hasta,
+        con_pedidos=g.permisos["pedidos"],
+        con_movimientos=g.permisos["movimientos"],
+    )
+    return jsonify({"ok": True, **kpis})
+
+
 # -------------------- MOVIMIENTOS --------------------
-@app.route("/movimientos")
-def movimientos_list():
-    if "user" not in session:
-        return redirect(url_for("login"))
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("""
-        SELECT m.id, m.tipo, 
-               (SELECT nombre FROM categorias WHERE id = m.categoria_id) as categoria,
-               (SELECT nombre FROM subcategorias WHERE id = m.subcategoria_id) as subcategoria,
+MOVIMIENTOS_POR_PAGINA = 100
+MOVIMIENTOS_POR_PAGINA_MAX = 500
+
+
+def _filtros_movimientos(args):
+    """Condiciones SQL para tipo, categoria, subcategoria y rango de monto."""
+    condiciones = []
+    params = []
+    filtros = {}
+
+    def filtro(nombre, condicion, tipo=str):
+        valor = args.get(nombre, type=tipo)
+        if valor not in (None, ""):
+            condiciones.append(condicion)
+            params.append(valor)
+            filtros[nombre] = valor
+
+    filtro("tipo", "m.tipo = ?")
+    filtro("categoria", "m.categoria_id = ?", int)
+    filtro("subcategoria", "m.subcategoria_id = ?", int)
+    filtro("monto_min", "m.monto >= ?", float)
+    filtro("monto_max", "m.monto <= ?", float)
+    return condiciones, params, filtros
+
+
+def _consultar_movimientos(c, args):
+    """Página de movimientos (más recientes primero) con filtros y keyset por id.
+
+    Parámetros: tipo, categoria, subcategoria, monto_min, monto_max, limite y
+    ``antes`` (id de la última fila de la página anterior).
+    """
+    condiciones, params, filtros = _filtros_movimientos(args)
+
+    antes = args.get("antes", type=int)
+    if antes:
+        condiciones.append("m.id < ?")
+        params.append(antes)
+
+    limite = args.get("limite", MOVIMIENTOS_POR_PAGINA, type=int)
+    limite = min(max(limite, 1), MOVIMIENTOS_POR_PAGINA_MAX)
+
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    c.execute(f"""
+        SELECT m.id, m.tipo, m.categoria_id, m.subcategoria_id,
+               cat.nombre AS categoria, sub.nombre AS subcategoria,
                m.descripcion, m.monto
         FROM movimientos m
+        LEFT JOIN categorias cat ON cat.id = m.categoria_id
+        LEFT JOIN subcategorias sub ON sub.id = m.subcategoria_id
+        {where}
         ORDER BY m.id DESC
-    """)
+        LIMIT ?
+    """, params + [limite + 1])
     movimientos = c.fetchall()
-    conn.close()
-    return render_template("movimientos.html", movimientos=movimientos)
+
+    # Se pide una fila de más para saber si hay página siguiente
+    siguiente = None
+    if len(movimientos) > limite:
+        movimientos = movimientos[:limite]
+        siguiente = movimientos[-1]["id"]
+    return {"movimientos": movimientos, "siguiente": siguiente, "filtros": filtros}
+
+
+def _filas_movimientos(movimientos):
+    """HTML de las filas de la tabla de movimientos, con caché por fila.
+
+    La versión de cada fragmento es la fila completa (incluye los nombres de
+    categoría y subcategoría): cualquier cambio visible la vuelve a renderizar.
+    """
+    plantilla = app.jinja_env.get_template("_fila_movimiento.html")
+    partes = []
+    for m in movimientos:
+        version = tuple(m)
+        html = cache_filas_movimientos.get(m["id"], version)
+        if html is None:
+            html = plantilla.render(m=m)
+            cache_filas_movimientos.set(m["id"], version, html)
+        partes.append(html)
+    return Markup("".join(partes))
+
+
+@app.route("/movimientos")
+@requires("movimientos")
+@condicional("movimientos", "catalogo")
+def movimientos_list():
+    conn = get_db()
+    c = conn.cursor()
+    pagina = _consultar_movimientos(c, request.args)
+    categorias = c.execute("SELECT id, tipo, nombre FROM categorias ORDER BY nombre").fetchall()
+    return render_template("movimientos.html", categorias=categorias, lote_max=MOVIMIENTOS_LOTE_MAX,
+                           filas=_filas_movimientos(pagina.pop("movimientos")), **pagina)
+
+
+@app.route("/api/movimientos")
+@requires("movimientos", api=True)
+def api_movimientos():
+    conn = get_db()
+    c = conn.cursor()
+    pagina = _consultar_movimientos(c, request.args)
+    pagina["movimientos"] = [dict(m) for m in pagina["movimientos"]]
+    return jsonify({"ok": True, **pagina})
 
 @app.route("/movimientos/add", methods=["POST"])
+@requires("movimientos")
 def add_movimiento():
     tipo = request.form["tipo"]
-    categoria_id = request.form.get("categoria")
+    categoria_id = request.form.get("categoria") or None
     usar_sub = request.form.get("usar_subcategoria")
-    subcategoria_id = request.form.get("subcategoria") if usar_sub else None
+    subcategoria_id = (request.form.get("subcategoria") or None) if usar_sub else None
     descripcion = request.form["descripcion"]
     monto = request.form["monto"]
 
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("INSERT INTO movimientos (tipo, categoria_id, subcategoria_id, descripcion, monto) VALUES (?, ?, ?, ?, ?)",
               (tipo, categoria_id, subcategoria_id, descripcion, monto))
     conn.commit()
-    conn.close()
     return redirect(url_for("movimientos_list"))
 
 # -------------------- EDITAR MOVIMIENTO --------------------
-@app.route("/movimientos/update", methods=["POST"])
-def update_movimiento():
-    if "user" not in session:
-        return redirect(url_for("login"))
+MOVIMIENTOS_EDITABLES = ("categoria_id", "subcategoria_id", "descripcion", "monto")
+MOVIMIENTOS_LOTE_MAX = 1000  # ediciones por llamada a /api/movimientos/batch
 
-    mov_id = request.form["id"]
-    categoria_id = request.form.get("categoria_id")
-    subcategoria_id = request.form.get("subcategoria_id")
-    descripcion = request.form.get("descripcion")
-    monto = request.form.get("monto")
 
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    if categoria_id:
-        c.execute("UPDATE movimientos SET categoria_id=? WHERE id=?", (categoria_id, mov_id))
-    if subcategoria_id:
-        c.execute("UPDATE movimientos SET subcategoria_id=? WHERE id=?", (subcategoria_id, mov_id))
-    if descripcion:
-        c.execute("UPDATE movimientos SET descripcion=? WHERE id=?", (descripcion, mov_id))
-    if monto:
-        c.execute("UPDATE movimientos SET monto=? WHERE id=?", (monto, mov_id))
-    conn.commit()
-    conn.close()
+def _leer_edicion_movimiento(datos):
+    """Normaliza los campos editables presentes en ``datos``.
+
+    Solo vuelven las claves enviadas: categoría y subcategoría vacías pasan a
+    NULL; ValueError si un campo no es editable o no tiene formato válido.
+    """
+    desconocidos = set(datos) - set(MOVIMIENTOS_EDITABLES) - {"id"}
+    if desconocidos:
+        raise ValueError("Campos no editables: " + ", ".join(sorted(desconocidos)))
+    campos = {}
+    try:
+        for campo in ("categoria_id", "subcategoria_id"):
+            if campo in datos:
+                campos[campo] = int(datos[campo]) if datos[campo] not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ValueError("Categoría o subcategoría inválida")
+    if "descripcion" in datos:
+        campos["descripcion"] = str(datos["descripcion"] or "").strip()
+    if "monto" in datos:
+        try:
+            campos["monto"] = float(datos["monto"])
+        except (TypeError, ValueError):
+            raise ValueError("Monto inválido")
+    return campos
+
+
+def _aplicar_ediciones_movimientos(conn, ediciones):
+    """Valida y aplica ediciones [{id, campo: valor, ...}] en una sola transacción.
+
+    Las ediciones de un mismo id se combinan (la última gana) y cada fila se
+    escribe con un único UPDATE; las filas con los mismos campos van juntas
+    en un executemany. Se valida que la categoría sea del tipo del movimiento
+    y la subcategoría de esa categoría. Devuelve un resultado por id, en el
+    orden en que aparecen; las filas con error no se aplican.
+    """
+    por_id = {}
+    errores = {}
+    for datos in ediciones:
+        try:
+            mov_id = int(datos["id"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Cada edición necesita un 'id' numérico")
+        try:
+            por_id.setdefault(mov_id, {}).update(_leer_edicion_movimiento(datos))
+        except ValueError as e:
+            errores[mov_id] = str(e)
+            por_id.setdefault(mov_id, {})
+
+    def cargar(sql, ids):
+        ids = list(ids)
+        if not ids:
+            return {}
+        marcas = ",".join("?" * len(ids))
+        return {row[0]: row for row in conn.execute(sql.format(marcas), ids)}
+
+    actuales = cargar("SELECT id, tipo, categoria_id, subcategoria_id FROM movimientos WHERE id IN ({})", por_id)
+    categorias = cargar("SELECT id, tipo FROM categorias WHERE id IN ({})",
+                        {v["categoria_id"] for v in por_id.values() if v.get("categoria_id")})
+    # Subcategoría resultante de cada fila que toca categoría o subcategoría
+    # (si solo cambia la categoría, la actual debe pertenecer a la nueva)
+    subcategorias = cargar("SELECT id, categoria_id FROM subcategorias WHERE id IN ({})", {
+        campos.get("subcategoria_id", actuales[mov_id]["subcategoria_id"])
+        for mov_id, campos in por_id.items()
+        if mov_id in actuales and campos.keys() & {"categoria_id", "subcategoria_id"}
+    } - {None})
+
+    grupos = {}  # campos editados -> [(valores..., id)]
+    for mov_id, campos in por_id.items():
+        if mov_id in errores:
+            continue
+        actual = actuales.get(mov_id)
+        if actual is None:
+            errores[mov_id] = "Movimiento NO existe"
+            continue
+        if not campos:
+            errores[mov_id] = "Sin cambios"
+            continue
+        categoria_id = campos.get("categoria_id", actual["categoria_id"])
+        subcategoria_id = campos.get("subcategoria_id", actual["subcategoria_id"])
+        if "categoria_id" in campos and categoria_id is not None:
+            categoria = categorias.get(categoria_id)
+            if categoria is None or categoria["tipo"] != actual["tipo"]:
+                errores[mov_id] = f"La categoría no es de tipo {actual['tipo']}"
+                continue
+        if campos.keys() & {"categoria_id", "subcategoria_id"} and subcategoria_id is not None:
+            subcategoria = subcategorias.get(subcategoria_id)
+            if subcategoria is None or subcategoria["categoria_id"] != categoria_id:
+                errores[mov_id] = "La subcategoría no pertenece a la categoría"
+                continue
+        claves = tuple(sorted(campos))
+        grupos.setdefault(claves, []).append(tuple(campos[k] for k in claves) + (mov_id,))
 
+    try:
+        for claves, filas in grupos.items():
+            asignaciones = ", ".join(f"{k}=?" for k in claves)
+            conn.executemany(f"UPDATE movimientos SET {asignaciones} WHERE id=?", filas)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return [
+        {"id": mov_id, "ok": False, "error": errores[mov_id]} if mov_id in errores else {"id": mov_id, "ok": True}
+        for mov_id in por_id
+    ]
+
+
+@app.route("/api/movimientos/batch", methods=["POST"])
+@requires("movimientos", api=True)
+def api_movimientos_batch():
+    datos = request.get_json(silent=True)
+    ediciones = datos.get("ediciones") if isinstance(datos, dict) else datos
+    if not isinstance(ediciones, list) or not all(isinstance(e, dict) for e in ediciones):
+        return jsonify({"ok": False, "error": "Envíe {'ediciones': [{id, campo: valor, ...}]}"}), 400
+    if len(ediciones) > MOVIMIENTOS_LOTE_MAX:
+        return jsonify({"ok": False, "error": f"Máximo {MOVIMIENTOS_LOTE_MAX} ediciones por lote"}), 400
+    try:
+        resultados = _aplicar_ediciones_movimientos(get_db(), ediciones)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    actualizados = sum(1 for r in resultados if r["ok"])
+    return jsonify({"ok": True, "actualizados": actualizados,
+                    "errores": len(resultados) - actualizados, "resultados": resultados})
+
+
+@app.route("/movimientos/update", methods=["POST"])
+@requires("movimientos", api=True)
+def update_movimiento():
+    # Edición de una fila por formulario; los campos vacíos no se tocan
+    edicion = {k: v for k, v in request.form.items() if k in MOVIMIENTOS_EDITABLES and v}
+    edicion["id"] = request.form.get("id")
+    try:
+        resultado, = _aplicar_ediciones_movimientos(get_db(), [edicion])
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if not resultado["ok"]:
+        return jsonify(resultado), 400
     return ("", 204)  # Respuesta vacía pero válida
 
 
 # -------------------- API CATEGORÍAS --------------------
+def _respuesta_catalogo(clave, cargar):
+    """JSON de categorías/subcategorías desde el caché, con ETag y 304.
+
+    La versión 'catalogo' la incrementan los triggers de categorias y
+    subcategorias, así que una escritura en cualquier worker invalida el
+    caché de todos y el ETag que tienen los navegadores.
+    """
+    version = _version_datos(get_db(), "catalogo")
+    etag = hashlib.sha1(f"{clave}:{version}".encode()).hexdigest()[:16]
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+    else:
+        data = cache_catalogo.get(clave, version)
+        if data is None:
+            data = cargar()
+            cache_catalogo.set(clave, version, data)
+        resp = jsonify(data)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
 @app.route("/api/categorias/<tipo>")
+@requires("movimientos", "admin", api=True)
 def get_categorias(tipo):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id, nombre FROM categorias WHERE tipo=?", (tipo,))
-    data = c.fetchall()
-    conn.close()
-    return jsonify(data)
+    def cargar():
+        c = get_db().cursor()
+        c.execute("SELECT id, nombre FROM categorias WHERE tipo=?", (tipo,))
+        return [tuple(r) for r in c.fetchall()]
+    return _respuesta_catalogo(f"categorias:{tipo}", cargar)
 
 @app.route("/api/subcategorias/<int:categoria_id>")
+@requires("movimientos", "admin", api=True)
 def get_subcategorias(categoria_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id, nombre FROM subcategorias WHERE categoria_id=?", (categoria_id,))
-    data = c.fetchall()
-    conn.close()
-    return jsonify(data)
+    def cargar():
+        c = get_db().cursor()
+        c.execute("SELECT id, nombre FROM subcategorias WHERE categoria_id=?", (categoria_id,))
+        return [tuple(r) for r in c.fetchall()]
+    return _respuesta_catalogo(f"subcategorias:{categoria_id}", cargar)
 
 
 # ==========================
 #   PEDIDOS & INGRESOS
 # ==========================
-from datetime import date, datetime
+def _efectivo_en_caja(c):
+    """Efectivo en caja (ingresos no depositados) por moneda, desde caja_saldos."""
+    c.execute("SELECT moneda, efectivo FROM caja_saldos")
+    saldos = {row["moneda"]: row["efectivo"] for row in c.fetchall()}
+    return round(saldos.get("PEN", 0), 2), round(saldos.get("USD", 0), 2)
 
-def _dias_restantes(fecha_str: str):
-    try:
-        if not fecha_str:
-            return None
-        hoy = date.today()
-        f = datetime.strptime(fecha_str, "%Y-%m-%d").date()
-        return (f - hoy).days
-    except Exception:
-        return None
 
-@app.route("/pedidos")
-def pedidos_list():
-    # Requiere login y permiso
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    if not session.get("mod_pedidos"):
-        return redirect(url_for("dashboard"))
+def conciliar_caja(conn, corregir=True):
+    """Recalcula caja_saldos y pedidos.total_ingresos desde ingresos.
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    Devuelve las diferencias encontradas (``caja``: moneda -> (guardado,
+    real); ``pedidos``: cantidad de pedidos con total distinto). Con
+    ``corregir`` reescribe los valores materializados en una sola transacción.
+    """
     c = conn.cursor()
-
-    # Traer pedidos (orden por # Pedido desc)
     c.execute("""
-        SELECT p.*
-        FROM pedidos p
-        ORDER BY CAST(p.numero_pedido AS INTEGER) DESC, p.numero_pedido DESC
+        SELECT s.moneda, s.efectivo AS guardado, COALESCE((
+            SELECT SUM(i.monto)
+            FROM ingresos i JOIN pedidos p ON p.id = i.pedido_id
+            WHERE i.depositado = 0
+              AND (CASE WHEN p.moneda = 'USD' THEN 'USD' ELSE 'PEN' END) = s.moneda
+        ), 0) AS real
+        FROM caja_saldos s
     """)
-    pedidos_rows = c.fetchall()
-
-    # Construir ingresos por pedido + totales + días
-    pedidos = []
-    ingresos_map = {}
-    efectivo_pen = 0
-    efectivo_usd = 0
+    caja = {
+        row["moneda"]: (row["guardado"], row["real"])
+        for row in c.fetchall()
+        if round(row["guardado"] - row["real"], 2) != 0
+    }
+    c.execute("""
+        SELECT COUNT(*) FROM pedidos p
+        WHERE ROUND(p.total_ingresos - (
+            SELECT COALESCE(SUM(i.monto), 0) FROM ingresos i WHERE i.pedido_id = p.id
+        ), 2) <> 0
+    """)
+    pedidos = c.fetchone()[0]
 
-    for p in pedidos_rows:
-        pid = p["id"]
+    if corregir:
         c.execute("""
-            SELECT id, pedido_id, monto, forma_pago, fecha, depositado
-            FROM ingresos
-            WHERE pedido_id=?
-            ORDER BY id DESC
-        """, (pid,))
-        ingresos = c.fetchall()
-        ingresos_list = [dict(i) for i in ingresos]
-        ingresos_map[pid] = ingresos_list
-
-        # Calcular totales
-        total_ingresos = sum((i["monto"] or 0) for i in ingresos_list)
-        dias = None
-        if p["fecha_entrega_propuesta"]:
-            try:
-                dias = (date.fromisoformat(p["fecha_entrega_propuesta"]) - date.today()).days
-            except Exception:
-                dias = None
-
-        # Armar dict
-        p_dict = dict(p)
-        p_dict["total_ingresos"] = round(total_ingresos, 2)
-        p_dict["dias"] = dias
-        pedidos.append(p_dict)
-
-        # Calcular efectivo en caja (solo ingresos no depositados)
-        for ing in ingresos_list:
-            if not ing["depositado"]:
-                if (p["moneda"] or "PEN") == "USD":
-                    efectivo_usd += ing["monto"] or 0
-                else:
-                    efectivo_pen += ing["monto"] or 0
+            UPDATE pedidos SET total_ingresos = (
+                SELECT COALESCE(SUM(i.monto), 0) FROM ingresos i WHERE i.pedido_id = pedidos.id
+            )
+            WHERE ROUND(total_ingresos - (
+                SELECT COALESCE(SUM(i.monto), 0) FROM ingresos i WHERE i.pedido_id = pedidos.id
+            ), 2) <> 0
+        """)
+        c.execute("""
+            UPDATE caja_saldos SET efectivo = (
+                SELECT COALESCE(SUM(i.monto), 0)
+                FROM ingresos i JOIN pedidos p ON p.id = i.pedido_id
+                WHERE i.depositado = 0
+                  AND (CASE WHEN p.moneda = 'USD' THEN 'USD' ELSE 'PEN' END) = caja_saldos.moneda
+            )
+        """)
+        conn.commit()
+    return {"caja": caja, "pedidos": pedidos}
+
 
+@app.cli.command("conciliar-caja")
+@click.option("--solo-reportar", is_flag=True, help="Muestra las diferencias sin corregirlas.")
+def conciliar_caja_command(solo_reportar):
+    """Reconstruye el efectivo en caja y los totales por pedido."""
+    conn = _conectar()
+    resultado = conciliar_caja(conn, corregir=not solo_reportar)
     conn.close()
+    for moneda, (guardado, real) in resultado["caja"].items():
+        click.echo(f"⚠️ Caja {moneda}: guardado {guardado:.2f}, real {real:.2f}")
+    if resultado["pedidos"]:
+        click.echo(f"⚠️ Pedidos con total_ingresos desfasado: {resultado['pedidos']}")
+    if not resultado["caja"] and not resultado["pedidos"]:
+        click.echo("✅ Caja conciliada, sin diferencias")
+    elif not solo_reportar:
+        click.echo("✅ Valores materializados reconstruidos")
+
+
+@app.route("/pedidos")
+@requires("pedidos")
+@condicional("caja")
+def pedidos_list():
+    # La tabla se llena desde /api/pedidos; aquí solo va el resumen de caja
+    # y el último cambio, desde el que la página escucha /api/stream: lo que
+    # se escriba entre este render y la carga de la tabla llega por el feed
+    conn = get_db()
+    c = conn.cursor()
+    efectivo_pen, efectivo_usd = _efectivo_en_caja(c)
 
     return render_template(
         "pedidos.html",
-        pedidos=pedidos,
-        ingresos=ingresos_map,
         today=date.today().isoformat(),
         efectivo_pen=efectivo_pen,
-        efectivo_usd=efectivo_usd
+        efectivo_usd=efectivo_usd,
+        ultimo_cambio=_ultimo_cambio(conn),
     )
 
+
+# -------------------- API PEDIDOS (DataTables server-side) --------------------
+# Columnas que se pueden ordenar/filtrar -> expresiones de la clave de orden.
+# El id siempre se agrega al final como desempate para la paginación keyset.
+# Columnas ordenables: la clave de orden de cada una, más p.id, tiene su
+# índice (0003 y 0014), así el orden y el keyset no necesitan un SCAN.
+# etapa_orden y moneda_orden son columnas generadas con el COALESCE.
+PEDIDOS_COLUMNAS = {
+    "etapa": ("p.etapa_orden",),
+    "numero_pedido": ("p.numero_pedido_num", "p.numero_pedido"),
+    "fecha": ("p.fecha",),
+    "cliente": ("p.cliente",),
+    "moneda": ("p.moneda_orden",),
+}
+PEDIDOS_POR_PAGINA_MAX = 500
+
+
+def _filtros_pedidos(args):
+    """Arma el WHERE a partir de la búsqueda global y por columna de DataTables."""
+    condiciones = []
+    params = []
+
+    def like(valor):
+        valor = valor.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"%{valor}%"
+
+    i = 0
+    while f"columns[{i}][data]" in args:
+        columna = args.get(f"columns[{i}][data]")
+        valor = (args.get(f"columns[{i}][search][value]") or "").strip()
+        if valor and columna in PEDIDOS_COLUMNAS:
+            if columna in ("etapa", "moneda"):
+                condiciones.append(f"{PEDIDOS_COLUMNAS[columna][0]} = ?")
+                params.append(valor)
+            else:
+                condiciones.append(f"p.{columna} LIKE ? ESCAPE '\\'")
+                params.append(like(valor))
+        i += 1
+
+    # La búsqueda global usa el índice FTS (cliente, descripción, OC, doc. venta, # pedido, motivo)
+    buscar = _consulta_fts(args.get("search[value]") or "")
+    if buscar:
+        condiciones.append("p.id IN (SELECT rowid FROM pedidos_fts WHERE pedidos_fts MATCH ?)")
+        params.append(buscar)
+
+    return condiciones, params
+
+
+def _pagina_pedidos(c, args):
+    """Devuelve una página de pedidos según el protocolo server-side de DataTables.
+
+    Si el cliente envía ``cursor`` (la clave de orden de la última fila de la
+    página anterior) se pagina por keyset; si no, se usa OFFSET con ``start``.
+    """
+    start = max(args.get("start", 0, type=int), 0)
+    length = args.get("length", 25, type=int)
+    if length < 0 or length > PEDIDOS_POR_PAGINA_MAX:
+        length = PEDIDOS_POR_PAGINA_MAX
+
+    columna = args.get(f"columns[{args.get('order[0][column]', '')}][data]") or "numero_pedido"
+    if columna not in PEDIDOS_COLUMNAS:
+        columna = "numero_pedido"
+    direccion = "ASC" if args.get("order[0][dir]") == "asc" else "DESC"
+    claves = PEDIDOS_COLUMNAS[columna] + ("p.id",)
+
+    condiciones, params = _filtros_pedidos(args)
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+
+    # El total sin filtrar sale del resumen que mantienen los triggers (0006):
+    # unas decenas de filas en lugar de contar pedidos en cada draw
+    c.execute("SELECT CAST(TOTAL(cantidad) AS INTEGER) FROM resumen_pedidos_diario")
+    total = c.fetchone()[0]
+    if condiciones:
+        c.execute(f"SELECT COUNT(*) FROM pedidos p {where}", params)
+        filtrados = c.fetchone()[0]
+    else:
+        filtrados = total
+
+    # Paginación keyset cuando hay cursor válido para esta página
+    cursor = None
+    if args.get("cursor"):
+        try:
+            cursor = json.loads(args["cursor"])
+        except ValueError:
+            cursor = None
+    if isinstance(cursor, list) and len(cursor) == len(claves):
+        operador = ">" if direccion == "ASC" else "<"
+        condiciones_pagina = condiciones + [f"({', '.join(claves)}) {operador} ({', '.join('?' * len(claves))})"]
+        params_pagina = params + cursor
+        offset = 0
+    else:
+        condiciones_pagina = condiciones
+        params_pagina = list(params)
+        offset = start
+
+    where_pagina = ("WHERE " + " AND ".join(condiciones_pagina)) if condiciones_pagina else ""
+    orden = ", ".join(f"{clave} {direccion}" for clave in claves)
+    seleccion_claves = ", ".join(f"{clave} AS _k{n}" for n, clave in enumerate(claves))
+    # dias = fecha propuesta - hoy, calculado en SQL (NULL si no hay fecha o no es válida)
+    c.execute(f"""
+        SELECT p.*, {seleccion_claves},
+               CAST(julianday(p.fecha_entrega_propuesta) - julianday(?) AS INTEGER) AS dias
+        FROM pedidos p
+        {where_pagina}
+        ORDER BY {orden}
+        LIMIT ? OFFSET ?
+    """, [date.today().isoformat()] + params_pagina + [length, offset])
+    rows = c.fetchall()
+
+    data = []
+    for r in rows:
+        p_dict = {k: r[k] for k in r.keys() if not k.startswith("_k")}
+        p_dict["total_ingresos"] = round(r["total_ingresos"], 2)
+        data.append(p_dict)
+
+    siguiente = [rows[-1][f"_k{n}"] for n in range(len(claves))] if rows else None
+    return {
+        "draw": args.get("draw", 0, type=int),
+        "recordsTotal": total,
+        "recordsFiltered": filtrados,
+        "data": data,
+        "cursor": siguiente,
+    }
+
+
+@app.route("/api/pedidos")
+@requires("pedidos", api=True)
+def api_pedidos():
+    conn = get_db()
+    c = conn.cursor()
+    resultado = _pagina_pedidos(c, request.args)
+    return jsonify(resultado)
+
+
+@app.route("/api/pedidos/<int:pedido_id>/ingresos")
+@requires("pedidos", api=True)
+def api_ingresos_pedido(pedido_id):
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT id, pedido_id, monto, forma_pago, fecha, depositado
+        FROM ingresos
+        WHERE pedido_id=?
+        ORDER BY id DESC
+    """, (pedido_id,))
+    ingresos = [dict(i) for i in c.fetchall()]
+    return jsonify({"ok": True, "ingresos": ingresos})
+
+# -------------------- VENCIMIENTOS DE ENTREGA --------------------
+VENCIMIENTOS_DIAS = 7
+VENCIMIENTOS_LIMITE_MAX = 200
+
+
+@app.route("/api/pedidos/vencimientos")
+@requires("pedidos", api=True)
+def api_vencimientos():
+    """Pedidos sin entrega real agrupados en vencidos, vencen hoy y vencen en N días.
+
+    Los conteos salen de resumen_entregas_pendientes y los listados (hasta
+    ``limite`` por grupo, los más urgentes primero) de rangos sobre el índice
+    parcial idx_pedidos_entrega_pendiente.
+    """
+
+    dias = min(max(request.args.get("dias", VENCIMIENTOS_DIAS, type=int), 1), 365)
+    limite = min(max(request.args.get("limite", 50, type=int), 1), VENCIMIENTOS_LIMITE_MAX)
+    hoy = date.today()
+    hasta = (hoy + timedelta(days=dias)).isoformat()
+    hoy = hoy.isoformat()
+
+    conn = get_db()
+    c = conn.cursor()
+    grupos = {
+        "vencidos": ("fecha_entrega_propuesta < ?", (hoy,)),
+        "hoy": ("fecha_entrega_propuesta = ?", (hoy,)),
+        "proximos": ("fecha_entrega_propuesta > ? AND fecha_entrega_propuesta <= ?", (hoy, hasta)),
+    }
+    resultado = {"ok": True, "hoy": hoy, "dias": dias}
+    for nombre, (condicion, params) in grupos.items():
+        c.execute(f"""
+            SELECT COALESCE(SUM(cantidad), 0) FROM resumen_entregas_pendientes
+            WHERE {condicion}
+        """, params)
+        cantidad = c.fetchone()[0]
+        c.execute(f"""
+            SELECT id, numero_pedido, etapa, cliente, descripcion, moneda, importe,
+                   fecha_entrega_propuesta, motivo_retraso,
+                   CAST(julianday(fecha_entrega_propuesta) - julianday(?) AS INTEGER) AS dias
+            FROM pedidos
+            WHERE fecha_entrega_real IS NULL AND {condicion}
+            ORDER BY fecha_entrega_propuesta
+            LIMIT ?
+        """, (hoy,) + params + (limite,))
+        resultado[nombre] = {"cantidad": cantidad, "pedidos": [dict(r) for r in c.fetchall()]}
+    return jsonify(resultado)
+
+
+# -------------------- FEED DE CAMBIOS (SSE) --------------------
+# Las rutas que tocan pedidos o ingresos agregan un evento a la tabla
+# cambios (migración 0012) en la misma transacción. /api/stream lo sigue
+# desde el último id que vio la página y se lo envía como Server-Sent
+# Events. Cada stream ocupa una conexión HTTP mientras la página está
+# abierta: ver worker_class en gunicorn.conf.py.
+CAMBIOS_RETENCION_DIAS = 7
+STREAM_INTERVALO = 1.0  # segundos entre consultas de MAX(id)
+STREAM_LATIDO = 15  # segundos entre comentarios para que proxies no corten
+STREAM_DURACION = 300  # segundos; luego el navegador reconecta y se revalida la sesión
+STREAM_LOTE = 200  # eventos por consulta
+
+_ultimo_cambio_lock = threading.Lock()
+_ultimo_cambio_visto = {"id": 0, "momento": float("-inf")}
+
+
+def _registrar_cambio(c, tabla, accion, registro_id, datos):
+    """Agrega un evento al feed; va en la transacción de la escritura."""
+    c.execute(
+        "INSERT INTO cambios (tabla, accion, registro_id, datos) VALUES (?, ?, ?, ?)",
+        (tabla, accion, registro_id, json.dumps(datos)),
+    )
+
+
+def _ultimo_cambio(conn):
+    """MAX(id) de cambios, compartido por los streams del worker.
+
+    Con cientos de páginas abiertas se consulta a lo sumo una vez por
+    STREAM_INTERVALO por worker, no una vez por stream.
+    """
+    with _ultimo_cambio_lock:
+        if time.monotonic() - _ultimo_cambio_visto["momento"] >= STREAM_INTERVALO:
+            _ultimo_cambio_visto["id"] = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cambios").fetchone()[0]
+            _ultimo_cambio_visto["momento"] = time.monotonic()
+        return _ultimo_cambio_visto["id"]
+
+
+def _evento_sse(evento, datos, id_evento=None):
+    linea_id = f"id: {id_evento}\n" if id_evento is not None else ""
+    return f"{linea_id}event: {evento}\ndata: {json.dumps(datos)}\n\n"
+
+
+def _eventos_cambios(desde):
+    """Generador SSE: eventos 'cambio' con id > desde durante STREAM_DURACION.
+
+    Usa su propia conexión (la de la petición se cierra al devolver la
+    respuesta). Si ``desde`` ya no está en el feed (podado o de otra base)
+    envía 'reinicio' para que la página recargue todo.
+    """
+    conn = _conectar()
+    try:
+        ultimo = _ultimo_cambio(conn)
+        if desde is not None:
+            primero = conn.execute("SELECT MIN(id) FROM cambios").fetchone()[0]
+            if desde > ultimo or (primero is not None and desde < primero - 1):
+                yield _evento_sse("reinicio", {}, ultimo)
+            else:
+                ultimo = desde
+        yield "retry: 3000\n" + _evento_sse("inicio", {"id": ultimo}, ultimo)
+
+        fin = time.monotonic() + STREAM_DURACION
+        latido = time.monotonic() + STREAM_LATIDO
+        while time.monotonic() < fin:
+            if _ultimo_cambio(conn) > ultimo:
+                filas = conn.execute("""
+                    SELECT id, tabla, accion, registro_id, datos FROM cambios
+                    WHERE id > ? ORDER BY id LIMIT ?
+                """, (ultimo, STREAM_LOTE)).fetchall()
+                for f in filas:
+                    yield _evento_sse("cambio", {
+                        "tabla": f["tabla"], "accion": f["accion"],
+                        "registro_id": f["registro_id"], "datos": json.loads(f["datos"]),
+                    }, f["id"])
+                if filas:
+                    ultimo = filas[-1]["id"]
+                    latido = time.monotonic() + STREAM_LATIDO
+                if len(filas) == STREAM_LOTE:
+                    continue
+            elif time.monotonic() >= latido:
+                yield ": latido\n\n"
+                latido = time.monotonic() + STREAM_LATIDO
+            time.sleep(STREAM_INTERVALO)
+    finally:
+        conn.close()
+
+
+@app.route("/api/stream")
+@requires("pedidos", api=True)
+def api_stream():
+    # EventSource reenvía el último id al reconectar; ?desde= para el primer intento
+    desde = request.headers.get("Last-Event-ID") or request.args.get("desde")
+    try:
+        desde = int(desde) if desde else None
+    except ValueError:
+        desde = None
+    return app.response_class(
+        _eventos_cambios(desde),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _pedido_para_feed(c, pedido_id):
+    """Campos de la fila de /api/pedidos que cambia api_editar_pedido."""
+    c.execute("""
+        SELECT id, cliente, descripcion, fecha_entrega_propuesta,
+               CAST(julianday(fecha_entrega_propuesta) - julianday(?) AS INTEGER) AS dias
+        FROM pedidos WHERE id=?
+    """, (date.today().isoformat(), pedido_id))
+    row = c.fetchone()
+    return dict(row) if row else {"id": pedido_id}
+
+
 # -------------------- NUEVO PEDIDO --------------------
-@app.route("/nuevo_pedido", methods=["POST"])
-def nuevo_pedido():
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    if not session.get("mod_pedidos"):
-        return redirect(url_for("dashboard"))
+SQL_INSERTAR_PEDIDO = """
+    INSERT INTO pedidos
+    (etapa, numero_pedido, fecha, fecha_entrega_propuesta, fecha_entrega_real,
+     motivo_retraso, canal, oc, doc_venta, cliente, descripcion, importe, gasto, moneda)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _leer_fecha(datos, campo, defecto=None):
+    """Fecha ISO (AAAA-MM-DD) de ``datos[campo]``, o ``defecto`` si viene vacía.
+
+    Lanza ValueError si no es una fecha válida.
+    """
+    valor = datos.get(campo)
+    if valor in (None, ""):
+        return defecto
+    try:
+        return date.fromisoformat(str(valor).strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"Fecha inválida en '{campo}': {valor}")
+
+
+def _leer_pedido(datos):
+    """Valida un pedido (form o dict) y devuelve los parámetros de SQL_INSERTAR_PEDIDO.
 
+    Lanza ValueError si importe o gasto no son números o alguna fecha no es
+    AAAA-MM-DD.
+    """
     etapa = "P. Generado"  # por defecto
-    numero_pedido = request.form.get("numero_pedido", "").strip()
-    fecha = request.form.get("fecha") or date.today().isoformat()
-    fecha_entrega_propuesta = request.form.get("fecha_entrega_propuesta") or None
-    fecha_entrega_real = request.form.get("fecha_entrega_real") or None
-    motivo_retraso = request.form.get("motivo_retraso") or None
-    canal = request.form.get("canal") or None
-    oc = request.form.get("oc") or None
-    doc_venta = request.form.get("doc_venta") or None
-    cliente = request.form.get("cliente") or ""
-    descripcion = request.form.get("descripcion") or ""
-    importe = request.form.get("importe")
-    importe = float(importe) if importe not in (None, "",) else None
-    gasto = request.form.get("gasto")
-    gasto = float(gasto) if gasto not in (None, "",) else 0.0
-    moneda = request.form.get("moneda", "PEN")  # PEN por defecto
+    numero_pedido = str(datos.get("numero_pedido") or "").strip()
+    fecha = _leer_fecha(datos, "fecha", date.today().isoformat())
+    fecha_entrega_propuesta = _leer_fecha(datos, "fecha_entrega_propuesta")
+    fecha_entrega_real = _leer_fecha(datos, "fecha_entrega_real")
+    motivo_retraso = datos.get("motivo_retraso") or None
+    canal = datos.get("canal") or None
+    oc = datos.get("oc") or None
+    doc_venta = datos.get("doc_venta") or None
+    cliente = datos.get("cliente") or ""
+    descripcion = datos.get("descripcion") or ""
+    try:
+        importe = datos.get("importe")
+        importe = float(importe) if importe not in (None, "",) else None
+    except (TypeError, ValueError):
+        raise ValueError("Importe inválido")
+    try:
+        gasto = datos.get("gasto")
+        gasto = float(gasto) if gasto not in (None, "",) else 0.0
+    except (TypeError, ValueError):
+        raise ValueError("Gasto inválido")
+    moneda = datos.get("moneda") or "PEN"  # PEN por defecto
 
+    return (etapa, numero_pedido, fecha, fecha_entrega_propuesta, fecha_entrega_real,
+            motivo_retraso, canal, oc, doc_venta, cliente, descripcion, importe, gasto, moneda)
 
-    conn = sqlite3.connect(DB_NAME)
+
+@app.route("/nuevo_pedido", methods=["POST"])
+@requires("pedidos")
+def nuevo_pedido():
+    try:
+        valores = _leer_pedido(request.form)
+    except ValueError as e:
+        return f"No se puede guardar: {e}", 400
+
+    conn = get_db()
     c = conn.cursor()
-    c.execute("""
-        INSERT INTO pedidos
-        (etapa, numero_pedido, fecha, fecha_entrega_propuesta, fecha_entrega_real,
-         motivo_retraso, canal, oc, doc_venta, cliente, descripcion, importe, gasto, moneda)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (etapa, numero_pedido, fecha, fecha_entrega_propuesta, fecha_entrega_real,
-          motivo_retraso, canal, oc, doc_venta, cliente, descripcion, importe, gasto, moneda))
+    c.execute(SQL_INSERTAR_PEDIDO, valores)
+    _registrar_cambio(c, "pedidos", "alta", c.lastrowid, {"id": c.lastrowid})
     conn.commit()
-    conn.close()
     return redirect(url_for("pedidos_list"))
 
 # -------------------- NUEVO INGRESO --------------------
+def _delta_ingresos(c, pedido_id, **extra):
+    """Lo que cambió tras tocar un ingreso: total del pedido y caja.
+
+    Es la respuesta de las APIs de ingresos y los datos del evento del feed.
+    """
+    c.execute("SELECT id, total_ingresos FROM pedidos WHERE id=?", (pedido_id,))
+    pedido = c.fetchone()
+    efectivo_pen, efectivo_usd = _efectivo_en_caja(c)
+    return {
+        "pedido": {"id": pedido["id"], "total_ingresos": round(pedido["total_ingresos"], 2)} if pedido else None,
+        "caja": {"PEN": efectivo_pen, "USD": efectivo_usd},
+        **extra,
+    }
+
+
+def _leer_ingreso(datos):
+    """Valida un ingreso (form o dict): devuelve (monto, forma_pago, fecha, depositado).
+
+    Lanza ValueError si el monto no es un número o la fecha no es AAAA-MM-DD.
+    """
+    try:
+        monto = float(datos.get("monto"))
+    except (TypeError, ValueError):
+        raise ValueError("Monto inválido")
+    forma_pago = datos.get("forma_pago") or ""
+    fecha = _leer_fecha(datos, "fecha", date.today().isoformat())
+    depositado = 1 if str(datos.get("depositado") or "0") in ("1", "true", "True") else 0
+    return monto, forma_pago, fecha, depositado
+
+
 @app.route("/api/nuevo_ingreso", methods=["POST"])
+@requires("pedidos", api=True)
 def api_nuevo_ingreso():
-    if "user_id" not in session:
-        return jsonify({"ok": False, "error": "No autenticado"}), 401
-    if not session.get("mod_pedidos"):
-        return jsonify({"ok": False, "error": "Sin permiso"}), 403
-
     pedido_id = request.form.get("pedido_id")
-    monto = request.form.get("monto")
-    forma_pago = request.form.get("forma_pago") or ""
-    fecha = request.form.get("fecha") or date.today().isoformat()
-
     try:
-        monto = float(monto)
-    except Exception:
-        return jsonify({"ok": False, "error": "Monto inválido"}), 400
+        monto, forma_pago, fecha, _ = _leer_ingreso(request.form)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("SELECT id FROM pedidos WHERE id=?", (pedido_id,))
     if not c.fetchone():
-        conn.close()
         return jsonify({"ok": False, "error": "Pedido NO existe"}), 400
 
     c.execute("""
         INSERT INTO ingresos (pedido_id, monto, forma_pago, fecha, depositado)
         VALUES (?, ?, ?, ?, 0)
     """, (pedido_id, monto, forma_pago, fecha))
+    ingreso_id = c.lastrowid
+
+    c.execute("""
+        SELECT id, pedido_id, monto, forma_pago, fecha, depositado
+        FROM ingresos WHERE id=?
+    """, (ingreso_id,))
+    ingreso = c.fetchone()
+    delta = _delta_ingresos(c, ingreso["pedido_id"], ingreso=dict(ingreso))
+    _registrar_cambio(c, "ingresos", "alta", ingreso_id, delta)
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, **delta})
 
 
 
 @app.route("/api/toggle_ingreso", methods=["POST"])
+@requires("pedidos", api=True)
 def api_toggle_ingreso():
-    if "user_id" not in session:
-        return jsonify({"ok": False, "error": "No autenticado"}), 401
-    if not session.get("mod_pedidos"):
-        return jsonify({"ok": False, "error": "Sin permiso"}), 403
-
     ingreso_id = request.form.get("ingreso_id")
     valor = request.form.get("valor", "0")
     valor = 1 if str(valor) in ("1", "true", "True") else 0
 
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("UPDATE ingresos SET depositado=? WHERE id=?", (valor, ingreso_id))
+
+    c.execute("""
+        SELECT id, pedido_id, monto, forma_pago, fecha, depositado
+        FROM ingresos WHERE id=?
+    """, (ingreso_id,))
+    ingreso = c.fetchone()
+    if not ingreso:
+        return jsonify({"ok": False, "error": "Ingreso NO existe"}), 404
+    delta = _delta_ingresos(c, ingreso["pedido_id"], ingreso=dict(ingreso))
+    _registrar_cambio(c, "ingresos", "edicion", ingreso["id"], delta)
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, **delta})
 
 @app.route("/eliminar_ingreso/<int:ingreso_id>", methods=["POST"])
+@requires("pedidos", api=True)
 def eliminar_ingreso(ingreso_id):
-    if "user_id" not in session:
-        return jsonify({"ok": False, "error": "No autenticado"}), 401
-    if not session.get("mod_pedidos"):
-        return jsonify({"ok": False, "error": "Sin permiso"}), 403
-
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
+    c.execute("SELECT pedido_id FROM ingresos WHERE id=?", (ingreso_id,))
+    ingreso = c.fetchone()
+    if not ingreso:
+        return jsonify({"ok": False, "error": "Ingreso NO existe"}), 404
+
     c.execute("DELETE FROM ingresos WHERE id=?", (ingreso_id,))
+    delta = _delta_ingresos(c, ingreso["pedido_id"], eliminado=ingreso_id)
+    _registrar_cambio(c, "ingresos", "baja", ingreso_id, delta)
     conn.commit()
-    conn.close()
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, **delta})
 
 @app.route("/eliminar_pedido/<int:pedido_id>", methods=["POST"])
+@requires("pedidos")
 def eliminar_pedido(pedido_id):
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    if not session.get("mod_pedidos"):
-        return redirect(url_for("dashboard"))
-
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM ingresos WHERE pedido_id=?", (pedido_id,))
     c.execute("DELETE FROM pedidos WHERE id=?", (pedido_id,))
+    if c.rowcount:
+        efectivo_pen, efectivo_usd = _efectivo_en_caja(c)
+        _registrar_cambio(c, "pedidos", "baja", pedido_id,
+                          {"id": pedido_id, "caja": {"PEN": efectivo_pen, "USD": efectivo_usd}})
     conn.commit()
-    conn.close()
     return redirect(url_for("pedidos_list"))
 
 @app.route("/api/editar_pedido/<int:pedido_id>", methods=["POST"])
+@requires("pedidos")
 def api_editar_pedido(pedido_id):
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    if not session.get("mod_pedidos"):
-        return redirect(url_for("dashboard"))
-
     cliente = request.form.get("cliente") or ""
     descripcion = request.form.get("descripcion") or ""
-    fecha_entrega_propuesta = request.form.get("fecha_entrega_propuesta") or None
+    try:
+        fecha_entrega_propuesta = _leer_fecha(request.form, "fecha_entrega_propuesta")
+    except ValueError as e:
+        return f"No se puede guardar: {e}", 400
 
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("""
         UPDATE pedidos
         SET cliente=?, descripcion=?, fecha_entrega_propuesta=?
         WHERE id=?
     """, (cliente, descripcion, fecha_entrega_propuesta, pedido_id))
+    if c.rowcount:
+        _registrar_cambio(c, "pedidos", "edicion", pedido_id, _pedido_para_feed(c, pedido_id))
     conn.commit()
-    conn.close()
     return redirect(url_for("pedidos_list"))
 
 
@@ -437,33 +1850,1008 @@ def api_editar_pedido(pedido_id):
 
 
 
+# -------------------- BÚSQUEDA (FTS5) --------------------
+BUSCAR_POR_PAGINA = 20
+BUSCAR_POR_PAGINA_MAX = 100
+
+
+def _consulta_fts(texto):
+    """Convierte lo que escribe el usuario en una consulta FTS5 por prefijos.
+
+    Cada palabra se cita (para que no se interprete como operador) y se
+    busca como prefijo; todas deben aparecer. Devuelve None si no hay palabras.
+    """
+    palabras = re.findall(r"\w+", texto)
+    if not palabras:
+        return None
+    return " ".join(f'"{p}"*' for p in palabras)
+
+
+@app.route("/api/buscar")
+@requires(api=True)
+def api_buscar():
+    consulta = _consulta_fts(request.args.get("q", ""))
+    pagina = max(request.args.get("pagina", 1, type=int), 1)
+    limite = min(max(request.args.get("limite", BUSCAR_POR_PAGINA, type=int), 1), BUSCAR_POR_PAGINA_MAX)
+    if not consulta:
+        return jsonify({"ok": True, "resultados": [], "pagina": pagina, "hay_mas": False})
+
+    partes = []
+    params = []
+    if g.permisos["pedidos"]:
+        partes.append("""
+            SELECT 'pedido' AS tipo, p.id, p.numero_pedido AS titulo, p.cliente AS detalle,
+                   snippet(pedidos_fts, -1, char(2), char(3), '…', 12) AS fragmento,
+                   bm25(pedidos_fts) AS rango
+            FROM pedidos_fts JOIN pedidos p ON p.id = pedidos_fts.rowid
+            WHERE pedidos_fts MATCH ?
+        """)
+        params.append(consulta)
+    if g.permisos["movimientos"]:
+        partes.append("""
+            SELECT 'movimiento' AS tipo, m.id, m.tipo AS titulo, CAST(m.monto AS TEXT) AS detalle,
+                   snippet(movimientos_fts, 0, char(2), char(3), '…', 12) AS fragmento,
+                   bm25(movimientos_fts) AS rango
+            FROM movimientos_fts JOIN movimientos m ON m.id = movimientos_fts.rowid
+            WHERE movimientos_fts MATCH ?
+        """)
+        params.append(consulta)
+    if not partes:
+        return jsonify({"ok": False, "error": "Sin permiso"}), 403
+
+    # Los términos encontrados van entre \x02 y \x03 en 'fragmento': el texto
+    # no se escapa aquí, así que el cliente escapa y luego resalta.
+    # Se pide una fila de más para saber si hay otra página.
+    c = get_db().cursor()
+    c.execute(
+        " UNION ALL ".join(partes) + " ORDER BY rango LIMIT ? OFFSET ?",
+        params + [limite + 1, (pagina - 1) * limite],
+    )
+    resultados = [dict(r) for r in c.fetchall()]
+    hay_mas = len(resultados) > limite
+    return jsonify({"ok": True, "resultados": resultados[:limite], "pagina": pagina, "hay_mas": hay_mas})
+
+
+@app.cli.command("reconstruir-busqueda")
+def reconstruir_busqueda_command():
+    """Reconstruye los índices FTS de pedidos y movimientos."""
+    conn = _conectar()
+    conn.execute("INSERT INTO pedidos_fts(pedidos_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO movimientos_fts(movimientos_fts) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+    click.echo("✅ Índices de búsqueda reconstruidos")
+
+
+# -------------------- REPORTES MULTIMONEDA --------------------
+MONEDA_BASE = "PEN"  # las tasas de tipos_cambio están en soles por unidad
+
+
+def _tipos_cambio(conn):
+    """Tasas por moneda como listas ordenadas (fechas, tasas), desde el caché.
+
+    La versión 'tipos_cambio' la incrementan los triggers de la tabla, así que
+    una carga nueva invalida el caché de todos los workers.
+    """
+    version = _version_datos(conn, "tipos_cambio")
+    tasas = cache_tipos_cambio.get("tasas", version)
+    if tasas is None:
+        tasas = {}
+        for row in conn.execute("SELECT moneda, fecha, tasa FROM tipos_cambio ORDER BY moneda, fecha"):
+            fechas, valores = tasas.setdefault(row["moneda"], ([], []))
+            fechas.append(row["fecha"])
+            valores.append(row["tasa"])
+        cache_tipos_cambio.set("tasas", version, tasas)
+    return tasas
+
+
+def _tasa(tasas, moneda, fecha):
+    """Soles por unidad de ``moneda`` en ``fecha`` (última tasa conocida a esa fecha).
+
+    Para fechas anteriores a la primera tasa se usa la primera. None si la
+    moneda no tiene tasas cargadas.
+    """
+    if moneda == MONEDA_BASE:
+        return 1.0
+    if moneda not in tasas:
+        return None
+    fechas, valores = tasas[moneda]
+    return valores[max(bisect.bisect_right(fechas, fecha) - 1, 0)]
+
+
+def consolidar(conn, base=MONEDA_BASE, desde=None, hasta=None):
+    """Importe, gasto e ingresos convertidos a ``base`` con la tasa de cada fecha.
+
+    Lee los resúmenes diarios (pedidos por fecha del pedido, ingresos por
+    fecha del ingreso), así que convierte unas filas por día y moneda y no
+    millones de registros. Los montos sin tasa van en ``sin_tipo_cambio``.
+    """
+    tasas = _tipos_cambio(conn)
+    condiciones, params = _filtros_fechas({"desde": desde, "hasta": hasta}, "fecha")
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    consultas = [
+        (("importe", "gasto"), f"""
+            SELECT fecha, moneda, SUM(importe) AS importe, SUM(gasto) AS gasto
+            FROM resumen_pedidos_diario {where}
+            GROUP BY fecha, moneda
+        """),
+        (("ingresos",), f"""
+            SELECT fecha, moneda, monto AS ingresos
+            FROM resumen_ingresos_diario {where}
+        """),
+    ]
+    por_moneda = {}
+    consolidado = {"importe": 0.0, "gasto": 0.0, "ingresos": 0.0}
+    sin_tipo_cambio = {}
+    for campos, sql in consultas:
+        for row in conn.execute(sql, params):
+            a_base = _tasa(tasas, base, row["fecha"])
+            tasa = _tasa(tasas, row["moneda"], row["fecha"])
+            totales = por_moneda.setdefault(row["moneda"], {"importe": 0.0, "gasto": 0.0, "ingresos": 0.0})
+            for campo in campos:
+                valor = row[campo] or 0
+                totales[campo] += valor
+                if tasa is None or a_base is None:
+                    faltante = sin_tipo_cambio.setdefault(row["moneda"], {"importe": 0.0, "gasto": 0.0, "ingresos": 0.0})
+                    faltante[campo] += valor
+                else:
+                    consolidado[campo] += valor * tasa / a_base
+
+    def redondear(totales):
+        return {campo: round(valor, 2) for campo, valor in totales.items()}
+
+    return {
+        "base": base,
+        "consolidado": redondear(consolidado),
+        "por_moneda": {moneda: redondear(t) for moneda, t in sorted(por_moneda.items())},
+        "sin_tipo_cambio": {moneda: redondear(t) for moneda, t in sorted(sin_tipo_cambio.items())},
+    }
+
+
+@app.route("/api/reportes/consolidado")
+@requires("pedidos", api=True)
+def api_reporte_consolidado():
+    base = (request.args.get("base") or MONEDA_BASE).upper()
+    if base not in ("PEN", "USD"):
+        return jsonify({"ok": False, "error": "Moneda base inválida"}), 400
+    resultado = consolidar(get_db(), base, request.args.get("desde"), request.args.get("hasta"))
+    return jsonify({"ok": True, **resultado})
+
+
+@app.cli.command("cargar-tipos-cambio")
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--moneda", default="USD", show_default=True,
+              help="Moneda de las filas sin columna 'moneda'.")
+def cargar_tipos_cambio_command(archivo, moneda):
+    """Carga tasas diarias desde un CSV con columnas fecha,tasa[,moneda].
+
+    La tasa es en soles por unidad de la moneda; una fecha ya cargada se
+    reemplaza.
+    """
+    filas = []
+    errores = 0
+    with open(archivo, newline="", encoding="utf-8-sig") as f:
+        for n, fila in enumerate(csv.DictReader(f), start=2):
+            try:
+                fecha = date.fromisoformat((fila.get("fecha") or "").strip()).isoformat()
+                tasa = float(fila.get("tasa") or "")
+                if tasa <= 0:
+                    raise ValueError
+            except ValueError:
+                errores += 1
+                click.echo(f"⚠️ Línea {n}: fecha o tasa inválida")
+                continue
+            filas.append(((fila.get("moneda") or moneda).strip().upper(), fecha, tasa))
+
+    conn = _conectar()
+    with conn:
+        conn.executemany("""
+            INSERT INTO tipos_cambio (moneda, fecha, tasa) VALUES (?, ?, ?)
+            ON CONFLICT (moneda, fecha) DO UPDATE SET tasa = excluded.tasa
+        """, filas)
+    conn.close()
+    click.echo(f"✅ Tipos de cambio cargados: {len(filas)}" + (f" ({errores} con error)" if errores else ""))
+
+
+# -------------------- EXPORTACIÓN CSV --------------------
+EXPORT_LOTE = 2000  # filas por fetchmany / bloque enviado
+
+
+def _exportar_csv(nombre, sql, params):
+    """Respuesta CSV que se genera por lotes mientras se lee la consulta.
+
+    La memoria queda acotada a un lote sin importar cuántas filas haya. Usa
+    su propia conexión porque la de la request se cierra en el teardown,
+    antes de que termine el envío.
+    """
+    def generar():
+        conn = _conectar()
+        try:
+            c = conn.execute(sql, params)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffer.write("\ufeff")  # BOM para que Excel lea bien los acentos
+            writer.writerow([d[0] for d in c.description])
+            while True:
+                filas = c.fetchmany(EXPORT_LOTE)
+                if not filas:
+                    break
+                writer.writerows(filas)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            conn.close()
+
+    resp = app.response_class(stream_with_context(generar()), mimetype="text/csv")
+    resp.headers["Content-Disposition"] = f"attachment; filename={nombre}_{date.today().isoformat()}.csv"
+    return resp
+
+
+def _filtros_fechas(args, columna):
+    """Condiciones de rango 'desde'/'hasta' (AAAA-MM-DD, inclusivas) sobre una columna fecha."""
+    condiciones = []
+    params = []
+    if args.get("desde"):
+        condiciones.append(f"{columna} >= ?")
+        params.append(args["desde"])
+    if args.get("hasta"):
+        condiciones.append(f"{columna} <= ?")
+        params.append(args["hasta"])
+    return condiciones, params
+
+
+@app.route("/export/pedidos")
+@requires("pedidos")
+def exportar_pedidos():
+    condiciones, params = _filtros_fechas(request.args, "p.fecha")
+    if request.args.get("moneda"):
+        condiciones.append("COALESCE(p.moneda, 'PEN') = ?")
+        params.append(request.args["moneda"])
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    return _exportar_csv("pedidos", f"""
+        SELECT p.id, p.etapa, p.numero_pedido, p.fecha, p.fecha_entrega_propuesta,
+               p.fecha_entrega_real, p.motivo_retraso, p.canal, p.oc, p.doc_venta,
+               p.cliente, p.descripcion, p.importe, p.gasto, p.moneda, p.total_ingresos
+        FROM pedidos p
+        {where}
+        ORDER BY p.id
+    """, params)
+
+
+@app.route("/export/ingresos")
+@requires("pedidos")
+def exportar_ingresos():
+    condiciones, params = _filtros_fechas(request.args, "i.fecha")
+    if request.args.get("moneda"):
+        condiciones.append("COALESCE(p.moneda, 'PEN') = ?")
+        params.append(request.args["moneda"])
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    return _exportar_csv("ingresos", f"""
+        SELECT i.id, i.pedido_id, p.numero_pedido, p.cliente, i.fecha, i.monto,
+               COALESCE(p.moneda, 'PEN') AS moneda, i.forma_pago, i.depositado
+        FROM ingresos i
+        JOIN pedidos p ON p.id = i.pedido_id
+        {where}
+        ORDER BY i.id
+    """, params)
+
+
+@app.route("/export/movimientos")
+@requires("movimientos")
+def exportar_movimientos():
+    # movimientos no tiene fecha ni moneda: se filtra como en la lista
+    condiciones, params, _ = _filtros_movimientos(request.args)
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    return _exportar_csv("movimientos", f"""
+        SELECT m.id, m.tipo, cat.nombre AS categoria, sub.nombre AS subcategoria,
+               m.descripcion, m.monto
+        FROM movimientos m
+        LEFT JOIN categorias cat ON cat.id = m.categoria_id
+        LEFT JOIN subcategorias sub ON sub.id = m.subcategoria_id
+        {where}
+        ORDER BY m.id
+    """, params)
+
+
+# -------------------- IMPORTACIÓN MASIVA --------------------
+IMPORT_LOTE = 5000  # filas por transacción
+IMPORT_MAX_ERRORES = 1000  # errores detallados en la respuesta
+
+
+def _leer_filas_import():
+    """Filas a importar desde un archivo 'archivo' (CSV o JSON) o un cuerpo JSON.
+
+    Devuelve un iterador de (número de fila, dict). En CSV la fila 1 es la
+    cabecera; en JSON se numera desde 1.
+    """
+    archivo = request.files.get("archivo")
+    if archivo is None:
+        datos = request.get_json(silent=True)
+        if not isinstance(datos, list):
+            raise ValueError("Envíe un archivo CSV/JSON en 'archivo' o una lista JSON")
+        return enumerate(datos, start=1)
+    if archivo.filename.lower().endswith(".json") or archivo.mimetype == "application/json":
+        datos = json.load(archivo.stream)
+        if not isinstance(datos, list):
+            raise ValueError("El JSON debe ser una lista de objetos")
+        return enumerate(datos, start=1)
+    texto = io.TextIOWrapper(archivo.stream, encoding="utf-8-sig", newline="")
+    return enumerate(csv.DictReader(texto), start=2)
+
+
+def _importar_por_lotes(filas, procesar_lote):
+    """Valida e inserta por lotes de IMPORT_LOTE, una transacción por lote.
+
+    ``procesar_lote(c, lote)`` recibe [(fila, dict)] y devuelve
+    (insertados, [(fila, error)]).
+    """
+    conn = get_db()
+    c = conn.cursor()
+    insertados = 0
+    errores = []
+    total_errores = 0
+
+    def aplicar(lote):
+        nonlocal insertados, total_errores
+        try:
+            n, errores_lote = procesar_lote(c, lote)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        insertados += n
+        total_errores += len(errores_lote)
+        for fila, error in errores_lote:
+            if len(errores) < IMPORT_MAX_ERRORES:
+                errores.append({"fila": fila, "error": error})
+
+    lote = []
+    for numero, datos in filas:
+        lote.append((numero, datos))
+        if len(lote) >= IMPORT_LOTE:
+            aplicar(lote)
+            lote = []
+    if lote:
+        aplicar(lote)
+    return {"ok": True, "insertados": insertados, "total_errores": total_errores, "errores": errores}
+
+
+def _lote_pedidos(c, lote):
+    validos = []
+    errores = []
+    for numero, datos in lote:
+        if not isinstance(datos, dict):
+            errores.append((numero, "Fila inválida"))
+            continue
+        try:
+            validos.append(_leer_pedido(datos))
+        except ValueError as e:
+            errores.append((numero, str(e)))
+        except (TypeError, AttributeError):  # p. ej. un objeto JSON donde va texto
+            errores.append((numero, "Fila con valores de tipo inválido"))
+    c.executemany(SQL_INSERTAR_PEDIDO, validos)
+    return len(validos), errores
+
+
+def _lote_ingresos(c, lote):
+    # Resolver numero_pedido -> id con una consulta por lote (usa idx_pedidos_numero)
+    numeros = {str((d.get("numero_pedido") if isinstance(d, dict) else "") or "").strip() for _, d in lote}
+    numeros.discard("")
+    ids = {}
+    numeros = list(numeros)
+    for i in range(0, len(numeros), 500):
+        parte = numeros[i:i + 500]
+        c.execute(f"""
+            SELECT id, numero_pedido FROM pedidos
+            WHERE numero_pedido_num IN ({", ".join("CAST(? AS INTEGER)" for _ in parte)})
+        """, parte)
+        for pid, numero in c.fetchall():
+            ids.setdefault(numero, []).append(pid)
+
+    validos = []
+    errores = []
+    for numero, datos in lote:
+        if not isinstance(datos, dict):
+            errores.append((numero, "Fila inválida"))
+            continue
+        numero_pedido = str(datos.get("numero_pedido") or "").strip()
+        pedidos = ids.get(numero_pedido, [])
+        if not pedidos:
+            errores.append((numero, f"Pedido {numero_pedido or '(vacío)'} NO existe"))
+            continue
+        if len(pedidos) > 1:
+            errores.append((numero, f"Pedido {numero_pedido} es ambiguo ({len(pedidos)} pedidos con ese número)"))
+            continue
+        try:
+            monto, forma_pago, fecha, depositado = _leer_ingreso(datos)
+        except ValueError as e:
+            errores.append((numero, str(e)))
+            continue
+        validos.append((pedidos[0], monto, forma_pago, fecha, depositado))
+    c.executemany("""
+        INSERT INTO ingresos (pedido_id, monto, forma_pago, fecha, depositado)
+        VALUES (?, ?, ?, ?, ?)
+    """, validos)
+    return len(validos), errores
+
+
+@app.route("/import/pedidos", methods=["POST"])
+@requires("pedidos", api=True)
+def importar_pedidos():
+    try:
+        filas = _leer_filas_import()
+        return jsonify(_importar_por_lotes(filas, _lote_pedidos))
+    except (ValueError, csv.Error) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+
+@app.route("/import/ingresos", methods=["POST"])
+@requires("pedidos", api=True)
+def importar_ingresos():
+    try:
+        filas = _leer_filas_import()
+        resultado = _importar_por_lotes(filas, _lote_ingresos)
+    except (ValueError, csv.Error) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    efectivo_pen, efectivo_usd = _efectivo_en_caja(get_db().cursor())
+    resultado["caja"] = {"PEN": efectivo_pen, "USD": efectivo_usd}
+    return jsonify(resultado)
+
+
+# -------------------- RESPALDOS --------------------
+# Copias en caliente con la API de backup de SQLite. La conexión de origen
+# abre una transacción de lectura y copia RESPALDO_PAGINAS páginas por paso
+# con una pausa entre pasos: con WAL las escrituras de la app siguen
+# mientras tanto y todos los pasos leen la misma foto. Sin esa transacción,
+# cada escritura de otro proceso haría reiniciar la copia desde la primera
+# página. Lo escrito durante la copia se acumula en el WAL hasta el
+# siguiente checkpoint.
+RESPALDOS_DIR = os.environ.get("ERP_RESPALDOS_DIR", "respaldos")
+RESPALDOS_CONSERVAR = 7  # respaldos más recientes que se guardan; los demás se borran
+RESPALDO_PAGINAS = 1024  # páginas por paso (4 MB con páginas de 4 KB)
+RESPALDO_PAUSA = 0.005  # segundos entre pasos
+RESPALDO_COMPRESION = 1  # nivel de gzip: 4 veces más rápido que 6 y ~18 % más grande
+RESPALDO_PREFIJO = "mi_erp-"
+
+
+def _verificar_integridad(conn):
+    errores = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    if errores != ["ok"]:
+        raise ValueError("Respaldo dañado: " + "; ".join(errores[:5]))
+
+
+def _rotar_respaldos(directorio, conservar):
+    """Borra los respaldos más viejos que los ``conservar`` más recientes."""
+    archivos = sorted(
+        nombre for nombre in os.listdir(directorio)
+        if nombre.startswith(RESPALDO_PREFIJO) and nombre.endswith(".db.gz")
+    )
+    borrados = archivos[:-conservar] if conservar > 0 else []
+    for nombre in borrados:
+        os.remove(os.path.join(directorio, nombre))
+    return borrados
+
+
+def respaldar(directorio=None, paginas=RESPALDO_PAGINAS, pausa=RESPALDO_PAUSA,
+              conservar=RESPALDOS_CONSERVAR, progreso=None):
+    """Copia la base en caliente a ``directorio`` como mi_erp-FECHA.db.gz.
+
+    La copia pasa integrity_check antes de comprimirse; si falla no se
+    guarda nada. Después rota los respaldos. ``progreso(fraccion, mensaje)``
+    como en los trabajos. Devuelve un resumen con el archivo y los tamaños.
+    """
+    directorio = directorio or RESPALDOS_DIR
+    os.makedirs(directorio, exist_ok=True)
+    final = os.path.join(directorio, f"{RESPALDO_PREFIJO}{time.strftime('%Y%m%d-%H%M%S')}.db.gz")
+    copia = final[:-len(".gz")] + ".tmp"
+    comprimido = final + ".tmp"
+    inicio = time.monotonic()
+    avance = {"pasos": 0, "informado": 0.0}
+
+    def paso(estado, restantes, total):
+        avance["pasos"] += 1
+        fraccion = 0.7 * (total - restantes) / max(total, 1)
+        if progreso and fraccion - avance["informado"] >= 0.01:
+            progreso(fraccion, "Copia")
+            avance["informado"] = fraccion
+        time.sleep(pausa)
+
+    try:
+        origen = sqlite3.connect(DB_NAME, timeout=SQLITE_TIMEOUT, isolation_level=None)
+        destino = sqlite3.connect(copia)
+        try:
+            origen.execute("BEGIN")
+            origen.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # fija la foto
+            origen.backup(destino, pages=paginas, progress=paso)
+            origen.execute("COMMIT")
+            # El respaldo es un solo archivo, sin -wal
+            destino.execute("PRAGMA journal_mode = DELETE")
+            if progreso:
+                progreso(0.7, "integrity_check")
+            _verificar_integridad(destino)
+        finally:
+            destino.close()
+            origen.close()
+        copiado = time.monotonic()
+
+        if progreso:
+            progreso(0.8, "Compresión")
+        with open(copia, "rb") as f, gzip.open(comprimido, "wb", compresslevel=RESPALDO_COMPRESION) as gz:
+            shutil.copyfileobj(f, gz, 1024 * 1024)
+        os.replace(comprimido, final)
+        bytes_base = os.path.getsize(copia)
+    finally:
+        for tmp in (copia, comprimido):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    return {
+        "archivo": final,
+        "bytes": bytes_base,
+        "bytes_comprimido": os.path.getsize(final),
+        "pasos": avance["pasos"],
+        "copia_s": round(copiado - inicio, 2),
+        "total_s": round(time.monotonic() - inicio, 2),
+        "rotados": _rotar_respaldos(directorio, conservar),
+    }
+
+
+def restaurar(archivo):
+    """Reemplaza el contenido de la base por el del respaldo ``archivo`` (.db.gz o .db).
+
+    El respaldo se descomprime junto a la base, pasa integrity_check y se
+    copia con la API de backup sobre la base viva: los procesos conectados
+    lo ven como una escritura más, aunque las suyas esperan lo que dure la
+    copia. Luego se aplican las migraciones que le falten. Los contadores
+    de versiones y los ids del feed de cambios quedan por encima de los de
+    antes, para que ningún caché de worker siga vigente y las páginas
+    abiertas recarguen.
+    """
+    copia = DB_NAME + ".restaurar"
+    try:
+        abrir = gzip.open if archivo.endswith(".gz") else open
+        with abrir(archivo, "rb") as f, open(copia, "wb") as salida:
+            shutil.copyfileobj(f, salida, 1024 * 1024)
+        origen = sqlite3.connect(copia)
+        conn = _conectar()
+        try:
+            _verificar_integridad(origen)
+            versiones = conn.execute("SELECT clave, valor FROM versiones").fetchall()
+            ultimo_cambio = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cambios").fetchone()[0]
+            origen.backup(conn)
+        finally:
+            conn.close()
+            origen.close()
+    finally:
+        if os.path.exists(copia):
+            os.remove(copia)
+
+    preparar_base()
+    conn = _conectar()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("UPDATE versiones SET valor = MAX(valor, ?) + 1 WHERE clave = ?",
+                         [(valor, clave) for clave, valor in versiones])
+        if not conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'cambios'",
+                            (ultimo_cambio,)).rowcount:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('cambios', ?)", (ultimo_cambio,))
+        efectivo_pen, efectivo_usd = _efectivo_en_caja(conn.cursor())
+        _registrar_cambio(conn, "pedidos", "restauracion", 0,
+                          {"caja": {"PEN": efectivo_pen, "USD": efectivo_usd}})
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@app.cli.command("respaldar")
+@click.option("--dir", "directorio", help=f"Carpeta de respaldos (por defecto {RESPALDOS_DIR}).")
+@click.option("--pausa", type=float, default=RESPALDO_PAUSA, show_default=True,
+              help="Segundos entre pasos de la copia.")
+def respaldar_command(directorio, pausa):
+    """Respalda la base en caliente (comprimido, verificado y rotado)."""
+    try:
+        r = respaldar(directorio, pausa=pausa)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"✅ Respaldo {r['archivo']}: {r['bytes']} bytes, {r['bytes_comprimido']} comprimido, "
+               f"{r['total_s']} s")
+    for nombre in r["rotados"]:
+        click.echo(f"🗑️ Rotado: {nombre}")
+
+
+@app.cli.command("restaurar")
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--sin-respaldo", is_flag=True, help="No respalda la base actual antes de restaurar.")
+@click.confirmation_option(prompt="Se reemplazarán todos los datos actuales. ¿Continuar?")
+def restaurar_command(archivo, sin_respaldo):
+    """Reemplaza la base por un respaldo; antes respalda la actual."""
+    try:
+        if not sin_respaldo:
+            click.echo(f"✅ Base actual respaldada en {respaldar(pausa=0)['archivo']}")
+        restaurar(archivo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"✅ Base restaurada desde {archivo}")
+
+
+# -------------------- COLA DE TRABAJOS --------------------
+# Lo que tarda minutos (recalcular resúmenes, mantenimiento) no corre en un
+# worker de gunicorn: se encola en la tabla trabajos (migración 0011), la
+# petición responde 202 con el id y worker.py lo ejecuta. El avance se
+# consulta en /api/jobs/<id>.
+TRABAJOS = {}  # tipo -> (función, módulos con permiso para encolarlo)
+TRABAJOS_INTENTOS = 3
+TRABAJOS_REINTENTO = 30  # segundos de espera antes del reintento n, por n
+TRABAJOS_LATIDO = 60  # segundos entre latidos de un trabajo en curso
+TRABAJOS_LATIDO_MAX = 900  # segundos sin latido para dar por caído un trabajo en curso
+# Mantenimiento que worker.py encola solo si no corrió en el período (segundos)
+TRABAJOS_PERIODICOS = {
+    "optimizar": 24 * 3600, "vacuum": 7 * 24 * 3600, "podar_cambios": 24 * 3600, "respaldo": 24 * 3600,
+}
+
+log_trabajos = logging.getLogger("erp.trabajos")
+
+
+def trabajo(tipo, *modulos):
+    """Registra ``funcion(conn, parametros, progreso)`` como trabajo encolable.
+
+    ``progreso(fraccion, mensaje)`` guarda el avance (0 a 1) y hace commit:
+    se llama entre pasos, no a mitad de una transacción. Lo que devuelve la
+    función queda en ``resultado``. ``modulos``: permisos para encolarlo
+    desde /api/jobs (alguno de ellos, como en requires).
+    """
+    def decorador(funcion):
+        TRABAJOS[tipo] = (funcion, modulos)
+        return funcion
+    return decorador
+
+
+def encolar(conn, tipo, parametros=None, usuario_id=None, unico=False):
+    """Inserta un trabajo pendiente y devuelve su id.
+
+    Con ``unico`` no duplica: si ya hay uno del mismo tipo pendiente o en
+    curso devuelve ese.
+    """
+    if tipo not in TRABAJOS:
+        raise ValueError(f"Trabajo desconocido: {tipo}")
+    if unico:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id FROM trabajos WHERE tipo = ? AND estado IN ('pendiente', 'en_curso')", (tipo,)
+        ).fetchone()
+        if row:
+            conn.commit()
+            return row[0]
+    cur = conn.execute(
+        "INSERT INTO trabajos (tipo, parametros, usuario_id, max_intentos) VALUES (?, ?, ?, ?)",
+        (tipo, json.dumps(parametros or {}), usuario_id, TRABAJOS_INTENTOS),
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def tomar_trabajo(conn):
+    """Pasa a 'en_curso' el próximo trabajo disponible y lo devuelve (o None).
+
+    Es un solo UPDATE ... RETURNING: dos workers nunca toman el mismo.
+    """
+    row = conn.execute("""
+        UPDATE trabajos
+        SET estado = 'en_curso', intentos = intentos + 1, progreso = 0, mensaje = NULL,
+            iniciado_en = datetime('now'), actualizado_en = datetime('now')
+        WHERE id = (
+            SELECT id FROM trabajos
+            WHERE estado = 'pendiente' AND disponible_en <= datetime('now')
+            ORDER BY disponible_en, id
+            LIMIT 1
+        )
+        RETURNING id, tipo, parametros, intentos, max_intentos
+    """).fetchone()
+    conn.commit()
+    return row
+
+
+def _latido_trabajo(fila, parar):
+    """Mientras corre el trabajo, renueva actualizado_en cada TRABAJOS_LATIDO.
+
+    Usa su propia conexión: un paso largo sin progreso (VACUUM, un recálculo
+    grande) no debe parecer un worker caído. Si la base está bloqueada por
+    el propio trabajo, reintenta en el siguiente latido.
+    """
+    conn = _conectar()
+    try:
+        while not parar.wait(TRABAJOS_LATIDO):
+            try:
+                conn.execute("""
+                    UPDATE trabajos SET actualizado_en = datetime('now')
+                    WHERE id = ? AND estado = 'en_curso' AND intentos = ?
+                """, (fila["id"], fila["intentos"]))
+                conn.commit()
+            except sqlite3.OperationalError:
+                if conn.in_transaction:
+                    conn.rollback()
+    finally:
+        conn.close()
+
+
+def ejecutar_trabajo(conn, fila):
+    """Corre un trabajo tomado con tomar_trabajo y guarda el resultado o el error.
+
+    Si falla y le quedan intentos vuelve a 'pendiente' con espera creciente;
+    si no, queda 'fallido'. Las actualizaciones solo valen para el intento
+    que tomó el trabajo: si recuperar_trabajos lo liberó y otro worker lo
+    tomó, este intento no pisa su estado. Devuelve True si terminó bien.
+    """
+    propio = "id = ? AND estado = 'en_curso' AND intentos = ?"
+    clave = (fila["id"], fila["intentos"])
+
+    def progreso(fraccion, mensaje=None):
+        conn.execute(
+            f"UPDATE trabajos SET progreso = ?, mensaje = ?, actualizado_en = datetime('now') WHERE {propio}",
+            (round(fraccion, 4), mensaje, *clave),
+        )
+        conn.commit()
+
+    parar_latido = threading.Event()
+    latido = threading.Thread(target=_latido_trabajo, args=(fila, parar_latido), daemon=True,
+                              name=f"latido-{fila['id']}")
+    latido.start()
+    try:
+        if fila["tipo"] not in TRABAJOS:
+            raise ValueError(f"Trabajo desconocido: {fila['tipo']}")
+        funcion, _ = TRABAJOS[fila["tipo"]]
+        resultado = funcion(conn, json.loads(fila["parametros"]), progreso)
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        log_trabajos.exception("Trabajo %s (%s) falló en el intento %s", fila["id"], fila["tipo"], fila["intentos"])
+        if fila["intentos"] < fila["max_intentos"]:
+            conn.execute(f"""
+                UPDATE trabajos
+                SET estado = 'pendiente', error = ?, actualizado_en = datetime('now'),
+                    disponible_en = datetime('now', ?)
+                WHERE {propio}
+            """, (repr(e), f"+{TRABAJOS_REINTENTO * fila['intentos']} seconds", *clave))
+        else:
+            conn.execute(f"""
+                UPDATE trabajos
+                SET estado = 'fallido', error = ?, actualizado_en = datetime('now'), terminado_en = datetime('now')
+                WHERE {propio}
+            """, (repr(e), *clave))
+        conn.commit()
+        return False
+    finally:
+        parar_latido.set()
+        latido.join()
+
+    cur = conn.execute(f"""
+        UPDATE trabajos
+        SET estado = 'terminado', progreso = 1, resultado = ?, error = NULL,
+            actualizado_en = datetime('now'), terminado_en = datetime('now')
+        WHERE {propio}
+    """, (json.dumps(resultado), *clave))
+    conn.commit()
+    if not cur.rowcount:
+        log_trabajos.warning("Trabajo %s (%s) terminó, pero el intento %s ya no era el vigente",
+                             fila["id"], fila["tipo"], fila["intentos"])
+        return False
+    log_trabajos.info("Trabajo %s (%s) terminado", fila["id"], fila["tipo"])
+    return True
+
+
+def recuperar_trabajos(conn):
+    """Libera los trabajos en curso sin latido reciente (su worker se cayó).
+
+    Vuelven a 'pendiente' si les quedan intentos; si no, quedan 'fallido'.
+    """
+    cur = conn.execute("""
+        UPDATE trabajos
+        SET estado = CASE WHEN intentos < max_intentos THEN 'pendiente' ELSE 'fallido' END,
+            error = 'Sin avance: el worker dejó de responder', actualizado_en = datetime('now')
+        WHERE estado = 'en_curso' AND actualizado_en < datetime('now', ?)
+    """, (f"-{TRABAJOS_LATIDO_MAX} seconds",))
+    conn.commit()
+    return cur.rowcount
+
+
+def encolar_periodicos(conn):
+    """Encola el mantenimiento de TRABAJOS_PERIODICOS que no corrió en su período."""
+    encolados = []
+    for tipo, periodo in TRABAJOS_PERIODICOS.items():
+        reciente = conn.execute("""
+            SELECT 1 FROM trabajos
+            WHERE tipo = ? AND creado_en > datetime('now', ?) AND estado <> 'fallido'
+            LIMIT 1
+        """, (tipo, f"-{periodo} seconds")).fetchone()
+        if not reciente:
+            encolados.append(encolar(conn, tipo, unico=True))
+    return encolados
+
+
+def _trabajo_a_dict(row):
+    datos = dict(row)
+    datos["parametros"] = json.loads(datos["parametros"])
+    datos["resultado"] = json.loads(datos["resultado"]) if datos["resultado"] else None
+    return datos
+
+
+# Misma carga inicial que las migraciones 0006 y 0009
+RECALCULO_RESUMENES = (
+    ("resumen_pedidos_diario", """
+        INSERT INTO resumen_pedidos_diario (fecha, moneda, canal, etapa, cantidad, importe, gasto, ingresos)
+        SELECT fecha, CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END, COALESCE(canal, ''), COALESCE(etapa, ''),
+               COUNT(*), COALESCE(SUM(importe), 0), COALESCE(SUM(gasto), 0), COALESCE(SUM(total_ingresos), 0)
+        FROM pedidos
+        GROUP BY 1, 2, 3, 4
+    """),
+    ("resumen_entregas_pendientes", """
+        INSERT INTO resumen_entregas_pendientes (fecha_entrega_propuesta, moneda, canal, etapa, cantidad)
+        SELECT fecha_entrega_propuesta, CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END,
+               COALESCE(canal, ''), COALESCE(etapa, ''), COUNT(*)
+        FROM pedidos
+        WHERE fecha_entrega_real IS NULL AND fecha_entrega_propuesta IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """),
+    ("resumen_ingresos_diario", """
+        INSERT INTO resumen_ingresos_diario (fecha, moneda, cantidad, monto)
+        SELECT i.fecha, CASE WHEN p.moneda = 'USD' THEN 'USD' ELSE 'PEN' END, COUNT(*), SUM(i.monto)
+        FROM ingresos i JOIN pedidos p ON p.id = i.pedido_id
+        GROUP BY 1, 2
+    """),
+    ("resumen_movimientos", """
+        INSERT INTO resumen_movimientos (tipo, categoria_id, cantidad, total)
+        SELECT tipo, COALESCE(categoria_id, 0), COUNT(*), COALESCE(SUM(monto), 0)
+        FROM movimientos
+        GROUP BY 1, 2
+    """),
+)
+
+
+@trabajo("recalcular_resumenes", "admin")
+def recalcular_resumenes(conn, parametros, progreso):
+    """Reconstruye caja, total_ingresos y las tablas resumen desde pedidos/ingresos.
+
+    Cada tabla se reescribe en su propia transacción: las escrituras de la
+    app esperan lo que tarda una tabla, no el recálculo completo.
+    """
+    pasos = len(RECALCULO_RESUMENES) + 1
+    progreso(0, "Caja y total_ingresos")
+    diferencias = conciliar_caja(conn)
+    filas = {}
+    for n, (tabla, sql) in enumerate(RECALCULO_RESUMENES, start=1):
+        progreso(n / pasos, tabla)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DELETE FROM {tabla}")
+        filas[tabla] = conn.execute(sql).rowcount
+        conn.commit()
+    return {
+        "caja": {moneda: {"guardado": guardado, "real": real} for moneda, (guardado, real) in diferencias["caja"].items()},
+        "pedidos_corregidos": diferencias["pedidos"],
+        "filas": filas,
+    }
+
+
+@trabajo("optimizar", "admin")
+def optimizar_base(conn, parametros, progreso):
+    """ANALYZE, merge de segmentos de los índices FTS y PRAGMA optimize."""
+    progreso(0, "Índices de búsqueda")
+    conn.execute("INSERT INTO pedidos_fts(pedidos_fts) VALUES ('optimize')")
+    conn.execute("INSERT INTO movimientos_fts(movimientos_fts) VALUES ('optimize')")
+    conn.commit()
+    progreso(0.5, "ANALYZE")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    return {}
+
+
+@trabajo("vacuum", "admin")
+def vacuum_base(conn, parametros, progreso):
+    """VACUUM y checkpoint del WAL; devuelve el tamaño en bytes antes y después."""
+    def tamano():
+        paginas, libres, bytes_pagina = (
+            conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_count", "freelist_count", "page_size")
+        )
+        return {"bytes": paginas * bytes_pagina, "libres": libres * bytes_pagina}
+
+    antes = tamano()
+    progreso(0.1, "VACUUM")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"antes": antes, "despues": tamano()}
+
+
+@trabajo("podar_cambios", "admin")
+def podar_cambios(conn, parametros, progreso):
+    """Borra del feed de cambios lo anterior a CAMBIOS_RETENCION_DIAS.
+
+    Las fechas crecen con el id: se busca el primer id a conservar y se
+    borra por rango de rowid.
+    """
+    cur = conn.execute("""
+        DELETE FROM cambios WHERE id < COALESCE(
+            (SELECT id FROM cambios WHERE fecha >= datetime('now', ?) ORDER BY id LIMIT 1),
+            (SELECT MAX(id) + 1 FROM cambios)
+        )
+    """, (f"-{CAMBIOS_RETENCION_DIAS} days",))
+    conn.commit()
+    return {"borrados": cur.rowcount}
+
+
+@trabajo("respaldo", "admin")
+def respaldo_base(conn, parametros, progreso):
+    """Respaldo en caliente con respaldar(); devuelve su resumen."""
+    return respaldar(progreso=progreso)
+
+
+@app.route("/api/jobs", methods=["POST"])
+@requires(api=True)
+def api_encolar_trabajo():
+    tipo = request.form.get("tipo", "")
+    if tipo not in TRABAJOS:
+        return jsonify({"ok": False, "error": "Trabajo desconocido"}), 400
+    _, modulos = TRABAJOS[tipo]
+    if modulos and not any(g.permisos[m] for m in modulos):
+        return jsonify({"ok": False, "error": "Sin permiso"}), 403
+
+    trabajo_id = encolar(get_db(), tipo, usuario_id=session["user_id"], unico=True)
+    url = url_for("api_trabajo", trabajo_id=trabajo_id)
+    resp = jsonify({"ok": True, "id": trabajo_id, "url": url})
+    resp.status_code = 202
+    resp.headers["Location"] = url
+    return resp
+
+
+@app.route("/api/jobs/<int:trabajo_id>")
+@requires(api=True)
+def api_trabajo(trabajo_id):
+    row = get_db().execute("""
+        SELECT id, tipo, parametros, estado, intentos, max_intentos, progreso, mensaje, resultado, error,
+               usuario_id, creado_en, iniciado_en, actualizado_en, terminado_en
+        FROM trabajos WHERE id = ?
+    """, (trabajo_id,)).fetchone()
+    # Los periódicos (sin usuario) y los ajenos solo los ve un admin
+    if row is None or (row["usuario_id"] != session["user_id"] and not g.permisos["admin"]):
+        return jsonify({"ok": False, "error": "Trabajo NO existe"}), 404
+    return jsonify({"ok": True, "trabajo": _trabajo_a_dict(row)})
+
+
+@app.cli.command("encolar")
+@click.argument("tipo", type=click.Choice(sorted(TRABAJOS)))
+def encolar_command(tipo):
+    """Encola un trabajo (lo ejecuta worker.py)."""
+    conn = _conectar()
+    trabajo_id = encolar(conn, tipo, unico=True)
+    conn.close()
+    click.echo(f"✅ Trabajo {tipo} encolado con id {trabajo_id}")
+
+
 @app.route("/administracion")
+@requires("admin")
 def administracion_panel():
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    if not session.get("mod_admin"):
-        return "Acceso no autorizado", 403
     return render_template("administracion.html")
 
 
 # -------------------- PERFIL DE USUARIOS --------------------
 @app.route("/usuarios")
+@requires("usuarios", "admin")
 def perfil_usuarios():
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    if not session.get("mod_admin"):
-        return "Acceso no autorizado", 403
-
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     c = conn.cursor()
-    usuarios = c.execute("SELECT * FROM usuarios").fetchall()
-    conn.close()
+    usuarios = c.execute("""
+        SELECT id, username, is_admin, mod_pedidos, mod_movimientos, mod_admin, mod_usuarios
+        FROM usuarios
+    """).fetchall()
 
     return render_template("perfil_usuarios.html", usuarios=usuarios)
 
 
 @app.route("/usuarios/nuevo", methods=["POST"])
+@requires("usuarios", "admin")
 def nuevo_usuario():
     username = request.form.get("username")
     password = request.form.get("password")
@@ -475,18 +2863,23 @@ def nuevo_usuario():
     mod_admin = 1 if request.form.get("mod_admin") else 0
     mod_usuarios = 1 if request.form.get("mod_usuarios") else 0
 
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
-    c.execute("""
-        INSERT INTO usuarios (username, password, is_admin,
-                              mod_pedidos, mod_movimientos, mod_admin, mod_usuarios)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (username, password, is_admin, mod_pedidos, mod_movimientos, mod_admin, mod_usuarios))
-    conn.commit()
-    conn.close()
+    try:
+        c.execute("""
+            INSERT INTO usuarios (username, password, is_admin,
+                                  mod_pedidos, mod_movimientos, mod_admin, mod_usuarios)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (username, generate_password_hash(password), is_admin,
+              mod_pedidos, mod_movimientos, mod_admin, mod_usuarios))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return "No se puede guardar: el nombre de usuario ya existe", 409
     return redirect(url_for("perfil_usuarios"))
 
 @app.route("/usuarios/editar/<int:user_id>", methods=["POST"])
+@requires("usuarios", "admin")
 def editar_usuario(user_id):
     username = request.form.get("username")
     password = request.form.get("password")
@@ -497,108 +2890,119 @@ def editar_usuario(user_id):
     mod_admin = 1 if request.form.get("mod_admin") else 0
     mod_usuarios = 1 if request.form.get("mod_usuarios") else 0
 
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
-    c.execute("""
-        UPDATE usuarios
-        SET username=?, password=?, is_admin=?,
-            mod_pedidos=?, mod_movimientos=?, mod_admin=?, mod_usuarios=?
-        WHERE id=?
-    """, (username, password, is_admin,
-          mod_pedidos, mod_movimientos, mod_admin, mod_usuarios, user_id))
-    conn.commit()
-    conn.close()
+    try:
+        c.execute("""
+            UPDATE usuarios
+            SET username=?, is_admin=?,
+                mod_pedidos=?, mod_movimientos=?, mod_admin=?, mod_usuarios=?
+            WHERE id=?
+        """, (username, is_admin,
+              mod_pedidos, mod_movimientos, mod_admin, mod_usuarios, user_id))
+        # Contraseña en blanco = se mantiene la actual
+        if password:
+            c.execute("UPDATE usuarios SET password=? WHERE id=?", (generate_password_hash(password), user_id))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return "No se puede guardar: el nombre de usuario ya existe", 409
     return redirect(url_for("perfil_usuarios"))
 
 @app.route("/usuarios/eliminar/<int:user_id>", methods=["POST"])
+@requires("usuarios", "admin")
 def eliminar_usuario(user_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM usuarios WHERE id=?", (user_id,))
     conn.commit()
-    conn.close()
     return redirect(url_for("perfil_usuarios"))
 
 
 # -------------------- CATEGORIAS Y SUBCATEGORIAS --------------------
 @app.route("/categorias")
+@requires("movimientos", "admin")
+@condicional("catalogo")
 def categorias_list():
-    if "user" not in session:
-        return redirect(url_for("login"))
-
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     c = conn.cursor()
     categorias = c.execute("SELECT * FROM categorias").fetchall()
     subcategorias = c.execute("SELECT * FROM subcategorias").fetchall()
-    conn.close()
     return render_template("categorias.html", categorias=categorias, subcategorias=subcategorias)
 
 
 @app.route("/categorias/nueva", methods=["POST"])
+@requires("movimientos", "admin")
 def nueva_categoria():
     nombre = request.form.get("nombre")
     tipo = request.form.get("tipo")
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("INSERT INTO categorias (tipo, nombre) VALUES (?, ?)", (tipo, nombre))
     conn.commit()
-    conn.close()
     return redirect(url_for("categorias_list"))
 
 
 @app.route("/categorias/editar/<int:cat_id>", methods=["POST"])
+@requires("movimientos", "admin")
 def editar_categoria(cat_id):
     nombre = request.form.get("nombre")
     tipo = request.form.get("tipo")
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("UPDATE categorias SET nombre=?, tipo=? WHERE id=?", (nombre, tipo, cat_id))
     conn.commit()
-    conn.close()
     return redirect(url_for("categorias_list"))
 
 
 @app.route("/categorias/eliminar/<int:cat_id>", methods=["POST"])
+@requires("movimientos", "admin")
 def eliminar_categoria(cat_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
-    c.execute("DELETE FROM categorias WHERE id=?", (cat_id,))
-    conn.commit()
-    conn.close()
+    try:
+        c.execute("DELETE FROM categorias WHERE id=?", (cat_id,))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return "No se puede eliminar: la categoría tiene movimientos asociados", 409
     return redirect(url_for("categorias_list"))
 
 
 @app.route("/subcategorias/nueva", methods=["POST"])
+@requires("movimientos", "admin")
 def nueva_subcategoria():
     nombre = request.form.get("nombre")
     categoria_id = request.form.get("categoria_id")
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("INSERT INTO subcategorias (categoria_id, nombre) VALUES (?, ?)", (categoria_id, nombre))
     conn.commit()
-    conn.close()
     return redirect(url_for("categorias_list"))
 
 
 @app.route("/subcategorias/editar/<int:sub_id>", methods=["POST"])
+@requires("movimientos", "admin")
 def editar_subcategoria(sub_id):
     nombre = request.form.get("nombre")
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("UPDATE subcategorias SET nombre=? WHERE id=?", (nombre, sub_id))
     conn.commit()
-    conn.close()
     return redirect(url_for("categorias_list"))
 
 
 @app.route("/subcategorias/eliminar/<int:sub_id>", methods=["POST"])
+@requires("movimientos", "admin")
 def eliminar_subcategoria(sub_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
-    c.execute("DELETE FROM subcategorias WHERE id=?", (sub_id,))
-    conn.commit()
-    conn.close()
+    try:
+        c.execute("DELETE FROM subcategorias WHERE id=?", (sub_id,))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return "No se puede eliminar: la subcategoría tiene movimientos asociados", 409
     return redirect(url_for("categorias_list"))
 
 @app.route("/logout")
@@ -0,0 +1,16 @@
+"""Benchmarks y pruebas de carga del ERP.
+
+Los scripts sueltos (``python bench/planes.py``) verifican una mejora
+concreta; la suite reproducible se corre como módulos desde la raíz:
+
+    python -m bench.datos --escala 100k --dir /tmp/erp_100k   # base sintética
+    python -m bench.rutas --escala 1k --salida rutas.json     # micro por ruta
+    python -m bench.carga_http --dir /tmp/erp_100k --salida carga.json
+    python -m bench.arranque --escala 100k --salida arranque.json
+    python -m bench.trabajos --dir /tmp/erp_100k --salida trabajos.json
+    python -m bench.movimientos_lote --dir /tmp/erp_100k --salida lote.json
+    python -m bench.stream --suscriptores 200 --worker-class gevent
+    python -m bench.respaldo --dir /tmp/erp_100k --gb 2 --salida respaldo.json
+    python -m bench.paginas --escala 10000 --salida paginas.json
+    python -m bench.resultados antes.json despues.json        # comparar
+"""
@@ -0,0 +1,128 @@
+"""Tiempo de arranque: preparación de la base, import de app y boot de gunicorn.
+
+Mide sobre una base de bench.datos (copiada) y sobre bases nuevas:
+- import de app en un proceso nuevo con la base al día (lo que paga cada
+  worker o comando de CLI);
+- _base_al_dia() frente a init_db() + ensure_admin_user() (lo que corría
+  antes en cada import);
+- preparar_base() sobre una base vacía y N procesos importando a la vez
+  una base vacía (solo uno migra, el resto espera el lock);
+- gunicorn con N workers hasta la primera respuesta.
+
+Uso:
+    python -m bench.arranque --escala 100k --workers 4 --salida arranque.json
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import datos, resultados
+from bench.carga_http import _levantar_gunicorn, _puerto_libre
+
+MEDIR_IMPORT = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+
+
+def _entorno():
+    return {**os.environ, "PYTHONPATH": datos.RAIZ}
+
+
+def _import_en(directorio):
+    salida = subprocess.run([sys.executable, "-c", MEDIR_IMPORT], cwd=directorio, env=_entorno(),
+                            capture_output=True, text=True, check=True)
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def _copiar_base(origen, destino):
+    conn = sqlite3.connect(os.path.join(origen, "mi_erp.db"))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    shutil.copy(os.path.join(origen, "mi_erp.db"), destino)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="1k")
+    parser.add_argument("--dir", help="base ya generada con bench.datos (se usa una copia)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+    if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+        print(f"Generando base {args.escala} en {origen}...")
+        datos.preparar(origen, args.escala, salida=print)
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    salida = {}
+    try:
+        copia = os.path.join(tmp, "escala")
+        os.mkdir(copia)
+        _copiar_base(origen, copia)
+
+        salida["import_base_al_dia"] = resultados.percentiles(
+            [_import_en(copia) for _ in range(args.repeticiones)])
+
+        os.chdir(copia)
+        sys.path.insert(0, datos.RAIZ)
+        import app as erp
+        comprobar, completo = [], []
+        for _ in range(args.repeticiones):
+            t0 = time.perf_counter()
+            erp._base_al_dia()
+            comprobar.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            erp.init_db()
+            erp.ensure_admin_user()
+            completo.append(time.perf_counter() - t0)
+        salida["comprobar_schema_version"] = resultados.percentiles(comprobar)
+        salida["init_db_y_admin"] = resultados.percentiles(completo)
+
+        vacias = []
+        for i in range(args.repeticiones):
+            nueva = os.path.join(tmp, f"vacia{i}")
+            os.mkdir(nueva)
+            vacias.append(_import_en(nueva))
+        salida["import_base_nueva"] = resultados.percentiles(vacias)
+
+        concurrente = os.path.join(tmp, "concurrente")
+        os.mkdir(concurrente)
+        t0 = time.perf_counter()
+        procesos = [subprocess.Popen([sys.executable, "-c", "import app"], cwd=concurrente, env=_entorno(),
+                                     stdout=subprocess.DEVNULL)
+                    for _ in range(args.workers)]
+        fallidos = sum(1 for p in procesos if p.wait() != 0)
+        conn = sqlite3.connect(os.path.join(concurrente, "mi_erp.db"))
+        versiones = conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0]
+        conn.close()
+        salida["imports_concurrentes_base_nueva"] = {
+            "procesos": args.workers, "total_ms": round((time.perf_counter() - t0) * 1000, 2),
+            "fallidos": fallidos, "migraciones_registradas": versiones,
+        }
+
+        for nombre, directorio in (("gunicorn_base_al_dia", copia), ("gunicorn_base_nueva", os.path.join(tmp, "gunicorn"))):
+            os.makedirs(directorio, exist_ok=True)
+            t0 = time.perf_counter()
+            servidor = _levantar_gunicorn(directorio, args.workers, _puerto_libre())
+            salida[nombre] = {"workers": args.workers, "primera_respuesta_ms": round((time.perf_counter() - t0) * 1000, 2)}
+            servidor.terminate()
+            servidor.wait()
+    finally:
+        os.chdir(datos.RAIZ)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for nombre, r in salida.items():
+        print(f"{nombre:<34} " + "  ".join(f"{k} {v}" for k, v in r.items()))
+    resultados.guardar(args.salida, "arranque", {"escala": args.escala, "workers": args.workers,
+                                                 "repeticiones": args.repeticiones}, salida)
+    fallidos = salida["imports_concurrentes_base_nueva"]["fallidos"]
+    return 1 if fallidos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Benchmark de /api/buscar (FTS5) frente a LIKE '%texto%' sobre pedidos.
+
+Uso:
+    python bench/busqueda.py --pedidos 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PALABRAS = ("letrero banner vinil acrílico luminoso tarjetas volantes gigantografía stickers "
+            "rotulado fachada vehicular impresión diseño instalación lona panel módulo").split()
+CLIENTES = ("Panadería Ñandú", "Ferretería Lima", "Clínica San Pablo", "Colegio Los Andes",
+            "Restaurante El Tambo", "Minera Sur", "Boutique Aurora", "Taller Mecánico Chávez")
+BUSQUEDAS = ("panad", "ferreteria lima", "acrilico luminoso", "OC-12345", "gigantograf", "zzzz")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pedidos", type=int, default=1000000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app as erp
+
+        conn = sqlite3.connect(erp.DB_NAME)
+        t0 = time.perf_counter()
+        conn.executemany(
+            "INSERT INTO pedidos (numero_pedido, fecha, cliente, descripcion, oc) VALUES (?, '2025-05-01', ?, ?, ?)",
+            ((str(i), f"{random.choice(CLIENTES)} {i % 5000}",
+              " ".join(random.sample(PALABRAS, 4)), f"OC-{i}") for i in range(1, args.pedidos + 1)),
+        )
+        conn.commit()
+        print(f"{args.pedidos} pedidos insertados (con índice FTS) en {time.perf_counter() - t0:.1f} s")
+
+        cliente = erp.app.test_client()
+        with cliente.session_transaction() as s:
+            s["user"] = "bench"
+            s["user_id"] = 1
+            s["mod_pedidos"] = True
+            s["mod_movimientos"] = True
+
+        for texto in BUSQUEDAS:
+            t0 = time.perf_counter()
+            for _ in range(args.repeticiones):
+                r = cliente.get("/api/buscar", query_string={"q": texto}).get_json()
+            fts = (time.perf_counter() - t0) / args.repeticiones
+
+            t0 = time.perf_counter()
+            conn.execute(
+                "SELECT id FROM pedidos WHERE cliente LIKE ? OR descripcion LIKE ? OR oc LIKE ? LIMIT 20",
+                (f"%{texto}%",) * 3,
+            ).fetchall()
+            like = time.perf_counter() - t0
+            print(f"  {texto!r:<22} FTS {fts * 1000:8.2f} ms ({len(r['resultados'])} hits)   LIKE {like * 1000:8.2f} ms")
+        conn.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
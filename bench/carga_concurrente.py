@@ -0,0 +1,123 @@
+"""Prueba de carga concurrente: lecturas de /pedidos mezcladas con escrituras de ingresos.
+
+Lanza varios procesos (como los workers de gunicorn) contra la misma base y
+reporta latencias p50/p99 por tipo de operación y errores "database is locked".
+
+Uso:
+    python bench/carga_concurrente.py --procesos 4 --operaciones 300
+    python bench/carga_concurrente.py --sin-wal   # comportamiento anterior
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def trabajador(erp, n_operaciones, n_pedidos, proporcion_escrituras, semilla, cola):
+    random.seed(semilla)
+    erp.app.testing = True  # que las excepciones de SQLite lleguen hasta aquí
+    cliente = erp.app.test_client()
+    with cliente.session_transaction() as s:
+        s["user"] = "bench"
+        s["user_id"] = 1
+        s["mod_pedidos"] = True
+
+    latencias = {"lectura": [], "escritura": []}
+    bloqueos = 0
+    for _ in range(n_operaciones):
+        escritura = random.random() < proporcion_escrituras
+        t0 = time.perf_counter()
+        try:
+            if not escritura:
+                cliente.get("/pedidos")
+                cliente.get("/api/pedidos", query_string={"start": 0, "length": 25})
+            elif random.random() < 0.5:
+                cliente.post("/api/nuevo_ingreso", data={
+                    "pedido_id": random.randint(1, n_pedidos), "monto": "10", "forma_pago": "Efectivo",
+                })
+            else:
+                cliente.post("/api/toggle_ingreso", data={
+                    "ingreso_id": random.randint(1, n_pedidos), "valor": random.randint(0, 1),
+                })
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            bloqueos += 1
+            continue
+        latencias["escritura" if escritura else "lectura"].append(time.perf_counter() - t0)
+    cola.put((latencias, bloqueos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--operaciones", type=int, default=300, help="operaciones por proceso")
+    parser.add_argument("--pedidos", type=int, default=2000)
+    parser.add_argument("--escrituras", type=float, default=0.3, help="proporción de escrituras")
+    parser.add_argument("--sin-wal", action="store_true", help="journal_mode=DELETE y sin pragmas")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app as erp
+
+        conn = sqlite3.connect(erp.DB_NAME)
+        conn.executemany(
+            "INSERT INTO pedidos (numero_pedido, fecha, cliente, importe, moneda) VALUES (?, date('now'), ?, 100, ?)",
+            ((str(i), f"Cliente {i % 300}", random.choice(("PEN", "USD"))) for i in range(1, args.pedidos + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO ingresos (pedido_id, monto, forma_pago, fecha) VALUES (?, 25, 'Efectivo', date('now'))",
+            ((i,) for i in range(1, args.pedidos + 1)),
+        )
+        if args.sin_wal:
+            conn.execute("PRAGMA journal_mode = DELETE")
+            erp.SQLITE_PRAGMAS = ()
+            erp.SQLITE_TIMEOUT = 0.0
+        conn.commit()
+        conn.close()
+
+        ctx = multiprocessing.get_context("fork")
+        cola = ctx.Queue()
+        procesos = [
+            ctx.Process(target=trabajador, args=(erp, args.operaciones, args.pedidos, args.escrituras, n, cola))
+            for n in range(args.procesos)
+        ]
+        t0 = time.perf_counter()
+        for p in procesos:
+            p.start()
+        resultados = [cola.get() for _ in procesos]
+        for p in procesos:
+            p.join()
+        total = time.perf_counter() - t0
+
+        bloqueos = sum(r[1] for r in resultados)
+        print(f"{args.procesos} procesos x {args.operaciones} operaciones "
+              f"({'sin WAL' if args.sin_wal else 'WAL'}) en {total:.1f} s")
+        for tipo in ("lectura", "escritura"):
+            lat = [x for r in resultados for x in r[0][tipo]]
+            print(f"  {tipo:<10} n={len(lat):>5}  p50={percentil(lat, 50) * 1000:7.1f} ms"
+                  f"  p99={percentil(lat, 99) * 1000:7.1f} ms")
+        print(f"  errores 'database is locked': {bloqueos}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Carga HTTP multi-proceso contra gunicorn: throughput y p50/p95/p99 por ruta.
+
+Levanta gunicorn sobre una copia de la base de bench.datos, inicia sesión
+una vez por proceso cliente y durante ``--segundos`` repite una mezcla de
+lecturas y escrituras con pesos parecidos al uso real (MEZCLA).
+
+Uso:
+    python -m bench.carga_http --escala 100k --clientes 8 --workers 4 --segundos 30 --salida carga.json
+    python -m bench.carga_http --url http://127.0.0.1:8000   # servidor ya levantado
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+from bench import datos, resultados
+
+# (nombre, peso, método, ruta(rnd, n_pedidos), cuerpo(rnd, n_pedidos) o None)
+MEZCLA = [
+    ("api_pedidos", 30, "GET",
+     lambda r, n: "/api/pedidos?" + urllib.parse.urlencode({
+         "draw": 1, "start": r.choice((0, 0, 25, 50)), "length": 25, "order[0][column]": 0,
+         "order[0][dir]": "desc", "columns[0][data]": "numero_pedido"}), None),
+    ("api_pedidos búsqueda", 8, "GET",
+     lambda r, n: "/api/pedidos?" + urllib.parse.urlencode({
+         "draw": 1, "start": 0, "length": 25, "search[value]": r.choice(datos.PRODUCTOS)}), None),
+    ("api_ingresos_pedido", 15, "GET", lambda r, n: f"/api/pedidos/{r.randint(1, n)}/ingresos", None),
+    ("pedidos_list", 5, "GET", lambda r, n: "/pedidos", None),
+    ("api_movimientos", 10, "GET", lambda r, n: "/api/movimientos?tipo=egreso", None),
+    ("api_dashboard", 5, "GET", lambda r, n: "/api/dashboard", None),
+    ("api_vencimientos", 5, "GET", lambda r, n: "/api/pedidos/vencimientos", None),
+    ("api_buscar", 5, "GET", lambda r, n: "/api/buscar?q=" + r.choice(datos.PRODUCTOS), None),
+    ("get_categorias", 5, "GET", lambda r, n: "/api/categorias/egreso", None),
+    ("api_nuevo_ingreso", 7, "POST", lambda r, n: "/api/nuevo_ingreso",
+     lambda r, n: {"pedido_id": r.randint(1, n), "monto": "10", "forma_pago": "Efectivo"}),
+    ("api_toggle_ingreso", 5, "POST", lambda r, n: "/api/toggle_ingreso",
+     lambda r, n: {"ingreso_id": r.randint(1, n), "valor": r.randint(0, 1)}),
+]
+
+
+def _pedir(host, puerto, metodo, ruta, cuerpo=None, cookie=None):
+    cx = http.client.HTTPConnection(host, puerto, timeout=60)
+    cabeceras = {"Connection": "close"}
+    if cookie:
+        cabeceras["Cookie"] = cookie
+    datos_cuerpo = None
+    if cuerpo is not None:
+        datos_cuerpo = urllib.parse.urlencode(cuerpo)
+        cabeceras["Content-Type"] = "application/x-www-form-urlencoded"
+    try:
+        cx.request(metodo, ruta, body=datos_cuerpo, headers=cabeceras)
+        resp = cx.getresponse()
+        resp.read()
+        return resp.status, resp.getheader("Set-Cookie")
+    finally:
+        cx.close()
+
+
+def _cliente(host, puerto, segundos, n_pedidos, semilla, cola):
+    rnd = random.Random(semilla)
+    _, cookie = _pedir(host, puerto, "POST", "/", {"username": "Administrador", "password": "1812"})
+    cookie = cookie.split(";", 1)[0] if cookie else None
+    nombres, pesos = zip(*((m[0], m[1]) for m in MEZCLA))
+    por_nombre = {m[0]: m for m in MEZCLA}
+    registros = []
+    fin = time.monotonic() + segundos
+    while time.monotonic() < fin:
+        nombre, _, metodo, ruta, cuerpo = por_nombre[rnd.choices(nombres, weights=pesos)[0]]
+        t0 = time.perf_counter()
+        try:
+            estado, _ = _pedir(host, puerto, metodo, ruta(rnd, n_pedidos),
+                               cuerpo(rnd, n_pedidos) if cuerpo else None, cookie)
+        except OSError:
+            estado = 0
+        registros.append((nombre, estado, time.perf_counter() - t0))
+    cola.put(registros)
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _levantar_gunicorn(directorio, workers, puerto):
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{puerto}",
+         "-c", os.path.join(datos.RAIZ, "gunicorn.conf.py"), "--pythonpath", datos.RAIZ,
+         "--log-level", "warning", "app:app"],
+        cwd=directorio,
+    )
+    for _ in range(200):
+        try:
+            _pedir("127.0.0.1", puerto, "GET", "/")
+            return proceso
+        except OSError:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise RuntimeError("gunicorn no respondió")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="1k")
+    parser.add_argument("--dir", help="base ya generada con bench.datos (se usa una copia)")
+    parser.add_argument("--url", help="servidor ya levantado (no se inicia gunicorn)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clientes", type=int, default=8, help="procesos cliente concurrentes")
+    parser.add_argument("--segundos", type=float, default=20)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    servidor = None
+    try:
+        if args.url:
+            destino = urllib.parse.urlparse(args.url)
+            host, puerto = destino.hostname, destino.port or 80
+            n_pedidos = datos.ESCALAS.get(args.escala, 1000)
+        else:
+            origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+            if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+                print(f"Generando base {args.escala} en {origen}...")
+                datos.preparar(origen, args.escala, salida=print)
+            conn = sqlite3.connect(os.path.join(origen, "mi_erp.db"))
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            n_pedidos = conn.execute("SELECT MAX(id) FROM pedidos").fetchone()[0]
+            conn.close()
+            shutil.copy(os.path.join(origen, "mi_erp.db"), tmp)
+            host, puerto = "127.0.0.1", _puerto_libre()
+            servidor = _levantar_gunicorn(tmp, args.workers, puerto)
+
+        cola = multiprocessing.Queue()
+        clientes = [
+            multiprocessing.Process(target=_cliente, args=(host, puerto, args.segundos, n_pedidos, i, cola))
+            for i in range(args.clientes)
+        ]
+        t0 = time.perf_counter()
+        for p in clientes:
+            p.start()
+        registros = [r for _ in clientes for r in cola.get()]
+        for p in clientes:
+            p.join()
+        duracion = time.perf_counter() - t0
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    salida = {}
+    errores_total = 0
+    for nombre in [m[0] for m in MEZCLA] + ["total"]:
+        filas = registros if nombre == "total" else [r for r in registros if r[0] == nombre]
+        if not filas:
+            continue
+        errores = sum(1 for _, estado, _ in filas if estado == 0 or estado >= 500)
+        errores_total += errores if nombre != "total" else 0
+        salida[nombre] = {
+            **resultados.percentiles([t for _, estado, t in filas if 0 < estado < 500]),
+            "rps": round(len(filas) / duracion, 1),
+            "errores": errores,
+        }
+        r = salida[nombre]
+        print(f"{nombre:<22} {r['rps']:8.1f} req/s  p50 {r.get('p50_ms', 0):8.2f} ms  "
+              f"p95 {r.get('p95_ms', 0):8.2f}  p99 {r.get('p99_ms', 0):8.2f}  errores {errores}")
+
+    resultados.guardar(args.salida, "carga_http", {
+        "escala": args.escala, "workers": args.workers, "clientes": args.clientes,
+        "segundos": args.segundos, "url": args.url,
+    }, salida)
+    return 1 if errores_total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
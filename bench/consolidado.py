@@ -0,0 +1,93 @@
+"""Mide /api/reportes/consolidado con N ingresos y lo compara con convertir fila por fila.
+
+La referencia recorre todos los ingresos y busca la tasa de cada uno con
+una subconsulta en tipos_cambio; ambos totales deben coincidir.
+
+Uso:
+    python bench/consolidado.py --ingresos 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REFERENCIA = """
+    SELECT SUM(i.monto * CASE WHEN p.moneda = 'USD' THEN (
+        SELECT tasa FROM tipos_cambio t
+        WHERE t.moneda = 'USD' AND t.fecha <= i.fecha
+        ORDER BY t.fecha DESC LIMIT 1
+    ) ELSE 1 END)
+    FROM ingresos i JOIN pedidos p ON p.id = i.pedido_id
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ingresos", type=int, default=1000000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app as erp
+
+        rnd = random.Random(14)
+        inicio = date(2022, 1, 1)
+        dias = 3 * 365
+        fechas = [(inicio + timedelta(days=d)).isoformat() for d in range(dias)]
+
+        conn = sqlite3.connect(erp.DB_NAME)
+        conn.executemany(
+            "INSERT INTO tipos_cambio (moneda, fecha, tasa) VALUES ('USD', ?, ?)",
+            ((f, round(3.6 + rnd.random() * 0.3, 4)) for f in fechas if rnd.random() < 0.7),
+        )
+        n_pedidos = max(args.ingresos // 5, 1)
+        conn.executemany(
+            "INSERT INTO pedidos (numero_pedido, fecha, cliente, importe, gasto, moneda) VALUES (?, ?, 'C', 100, 20, ?)",
+            ((str(i), rnd.choice(fechas), "USD" if i % 3 == 0 else "PEN") for i in range(1, n_pedidos + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO ingresos (pedido_id, monto, forma_pago, fecha) VALUES (?, ?, 'Efectivo', ?)",
+            ((i % n_pedidos + 1, rnd.randint(1, 500), rnd.choice(fechas)) for i in range(args.ingresos)),
+        )
+        conn.commit()
+
+        t0 = time.perf_counter()
+        esperado = conn.execute(REFERENCIA).fetchone()[0]
+        t_referencia = time.perf_counter() - t0
+        conn.close()
+
+        cliente = erp.app.test_client()
+        with cliente.session_transaction() as s:
+            s["user"] = "bench"
+            s["user_id"] = 1
+            s["mod_pedidos"] = True
+
+        cliente.get("/api/reportes/consolidado")  # calienta el caché de tasas
+        t0 = time.perf_counter()
+        for _ in range(args.repeticiones):
+            datos = cliente.get("/api/reportes/consolidado").get_json()
+        t_api = (time.perf_counter() - t0) / args.repeticiones
+
+        obtenido = datos["consolidado"]["ingresos"]
+        ok = abs(obtenido - esperado) <= max(0.01, abs(esperado) * 1e-9)  # redondeo y orden de la suma
+        print(f"ingresos: {args.ingresos}  pedidos: {n_pedidos}")
+        print(f"fila por fila (SQL):      {t_referencia * 1000:9.1f} ms  total {esperado:,.2f}")
+        print(f"/api/reportes/consolidado {t_api * 1000:9.1f} ms  total {obtenido:,.2f}")
+        print("✅ totales coinciden" if ok else "❌ los totales no coinciden")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Generador de datos sintéticos a escala (1k / 100k / 1M pedidos).
+
+Distribuciones pensadas para parecerse a la base real:
+- numero_pedido correlativo desde 1000; ~2 % con sufijo ("1234-A").
+- cliente: pocos clientes concentran la mayoría de pedidos (Zipf).
+- moneda: ~80 % PEN, ~18 % USD, ~2 % NULL (cuenta como PEN).
+- 0 a 4 ingresos por pedido que suman a lo sumo el importe; ~80 % depositados.
+- movimientos: uno por pedido, repartidos en categorías y subcategorías
+  (se agregan a las de la semilla de 0001).
+La semilla fija hace que dos corridas con la misma escala generen lo mismo.
+
+Uso:
+    python -m bench.datos --escala 100k --dir /tmp/erp_100k
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ESCALAS = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+LOTE = 10_000
+
+ETAPAS = (("P. Generado", 20), ("En producción", 15), ("Despachado", 10), ("Entregado", 50), ("Anulado", 5))
+CANALES = (("Tienda", 40), ("Web", 30), ("Mayorista", 20), ("Licitación", 10))
+MONEDAS = (("PEN", 80), ("USD", 18), (None, 2))
+FORMAS_PAGO = ("Efectivo", "Transferencia", "Yape", "Tarjeta", "Depósito")
+PRODUCTOS = ("polos", "gorros", "mochilas", "uniformes", "casacas", "chalecos", "bordados", "estampados")
+MOTIVOS = ("Falta de insumos", "Cambio de diseño", "Demora del proveedor", "Pago pendiente")
+
+
+def _eleccion(rnd, opciones):
+    valores, pesos = zip(*opciones)
+    return rnd.choices(valores, weights=pesos)[0]
+
+
+def _pedidos(rnd, n, clientes, inicio, dias):
+    hoy = date.today().isoformat()
+    pesos = [1 / (k + 1) for k in range(len(clientes))]
+    for i in range(n):
+        fecha = inicio + timedelta(days=rnd.randrange(dias))
+        propuesta = fecha + timedelta(days=rnd.randint(3, 30))
+        etapa = _eleccion(rnd, ETAPAS)
+        entregado = etapa == "Entregado" or (propuesta.isoformat() < hoy and rnd.random() < 0.7)
+        real = propuesta + timedelta(days=rnd.randint(-2, 7)) if entregado else None
+        numero = str(1000 + i) + ("-A" if rnd.random() < 0.02 else "")
+        importe = round(rnd.lognormvariate(6.5, 1.0), 2)
+        yield (
+            etapa, numero, fecha.isoformat(), propuesta.isoformat(), real and real.isoformat(),
+            rnd.choice(MOTIVOS) if real and real > propuesta else None,
+            _eleccion(rnd, CANALES), f"OC-{rnd.randint(1, 99999):05d}" if rnd.random() < 0.4 else None,
+            f"F001-{i + 1:07d}" if entregado else None,
+            rnd.choices(clientes, weights=pesos)[0],
+            f"{rnd.randint(10, 500)} {rnd.choice(PRODUCTOS)} {rnd.choice(PRODUCTOS)}",
+            importe, round(importe * rnd.uniform(0.3, 0.8), 2), _eleccion(rnd, MONEDAS),
+        )
+
+
+def _ingresos(rnd, pedidos_generados, primer_id):
+    for n, pedido in enumerate(pedidos_generados):
+        importe = pedido[11]
+        fecha = date.fromisoformat(pedido[2])
+        restante = importe
+        for _ in range(rnd.choices((0, 1, 2, 3, 4), weights=(15, 35, 30, 15, 5))[0]):
+            monto = round(min(restante, importe * rnd.uniform(0.2, 0.6)), 2)
+            if monto <= 0:
+                break
+            restante -= monto
+            yield (
+                primer_id + n, monto, rnd.choice(FORMAS_PAGO),
+                (fecha + timedelta(days=rnd.randint(0, 45))).isoformat(), int(rnd.random() < 0.8),
+            )
+
+
+def generar(conn, escala="1k", semilla=18, salida=None):
+    """Llena ``conn`` (base ya migrada) con la escala pedida. Devuelve los conteos."""
+    n = ESCALAS[escala] if isinstance(escala, str) else int(escala)
+    rnd = random.Random(semilla)
+    salida = salida or (lambda texto: None)
+    inicio = date.today() - timedelta(days=730)
+    clientes = [f"Cliente {k:04d} S.A.C." for k in range(max(20, n // 50))]
+
+    # Catálogo: 6 categorías nuevas con 5 subcategorías cada una
+    for k in range(6):
+        tipo = "ingreso" if k % 3 == 0 else "egreso"
+        cat_id = conn.execute("INSERT INTO categorias (tipo, nombre) VALUES (?, ?)",
+                              (tipo, f"Categoría {k}")).lastrowid
+        conn.executemany("INSERT INTO subcategorias (categoria_id, nombre) VALUES (?, ?)",
+                         ((cat_id, f"Sub {k}.{j}") for j in range(5)))
+    categorias = [tuple(r) for r in conn.execute("SELECT id, tipo FROM categorias")]
+    subcategorias = {}
+    for sub_id, cat_id in conn.execute("SELECT id, categoria_id FROM subcategorias"):
+        subcategorias.setdefault(cat_id, []).append(sub_id)
+
+    t0 = time.perf_counter()
+    hechos = 0
+    generador = _pedidos(rnd, n, clientes, inicio, 730)
+    while hechos < n:
+        lote = [next(generador) for _ in range(min(LOTE, n - hechos))]
+        with conn:
+            primer_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM pedidos").fetchone()[0]
+            conn.executemany("""
+                INSERT INTO pedidos (etapa, numero_pedido, fecha, fecha_entrega_propuesta, fecha_entrega_real,
+                                     motivo_retraso, canal, oc, doc_venta, cliente, descripcion, importe, gasto, moneda)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, lote)
+            conn.executemany(
+                "INSERT INTO ingresos (pedido_id, monto, forma_pago, fecha, depositado) VALUES (?, ?, ?, ?, ?)",
+                _ingresos(rnd, lote, primer_id),
+            )
+
+            def movimientos():
+                for _ in lote:
+                    cat_id, tipo = rnd.choice(categorias)
+                    subs = subcategorias.get(cat_id)
+                    yield (tipo, cat_id, rnd.choice(subs) if subs and rnd.random() < 0.7 else None,
+                           f"{tipo.capitalize()} {rnd.choice(PRODUCTOS)}", round(rnd.lognormvariate(4, 1), 2))
+            conn.executemany(
+                "INSERT INTO movimientos (tipo, categoria_id, subcategoria_id, descripcion, monto) VALUES (?, ?, ?, ?, ?)",
+                movimientos(),
+            )
+        hechos += len(lote)
+        salida(f"  {hechos}/{n} pedidos ({time.perf_counter() - t0:.1f} s)")
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    return {
+        tabla: conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+        for tabla in ("pedidos", "ingresos", "movimientos", "categorias", "subcategorias")
+    }
+
+
+def preparar(directorio, escala="1k", semilla=18, salida=None):
+    """Crea (o reutiliza) la base de ``directorio`` con app.py y la llena si está vacía.
+
+    Deja el proceso en ``directorio`` (app.py abre DB_NAME relativo) y
+    devuelve el módulo app importado.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    os.chdir(directorio)
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    import app as erp
+
+    conn = sqlite3.connect(erp.DB_NAME)
+    if not conn.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]:
+        generar(conn, escala, semilla, salida)
+    conn.close()
+    return erp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="1k", help="1k, 100k, 1m o un número de pedidos")
+    parser.add_argument("--dir", required=True, help="directorio donde queda mi_erp.db")
+    parser.add_argument("--semilla", type=int, default=18)
+    args = parser.parse_args()
+
+    escala = args.escala.lower() if args.escala.lower() in ESCALAS else int(args.escala)
+    erp = preparar(args.dir, escala, args.semilla, print)
+    conn = sqlite3.connect(erp.DB_NAME)
+    for tabla in ("pedidos", "ingresos", "movimientos"):
+        print(f"{tabla:<12} {conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]:>10}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Exporta N filas sintéticas por /export/* y verifica que el RSS pico quede acotado.
+
+Las páginas de la base mapeadas con mmap_size (64 MB) también cuentan como
+RSS, por eso el límite por defecto las incluye.
+
+Uso:
+    python bench/exportar.py --filas 1000000 --max-mb 96
+"""
+import argparse
+import os
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_pico_mb():
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=1000000)
+    parser.add_argument("--max-mb", type=float, default=96, help="crecimiento máximo permitido del RSS pico")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app as erp
+
+        conn = sqlite3.connect(erp.DB_NAME)
+        n_pedidos = max(args.filas // 10, 1)
+        conn.executemany(
+            "INSERT INTO pedidos (numero_pedido, fecha, cliente, importe, moneda) VALUES (?, '2025-01-15', ?, 100, 'PEN')",
+            ((str(i), f"Cliente {i % 1000}") for i in range(1, n_pedidos + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO ingresos (pedido_id, monto, forma_pago, fecha) VALUES (?, 10, 'Efectivo', '2025-01-20')",
+            ((i % n_pedidos + 1,) for i in range(args.filas)),
+        )
+        conn.executemany(
+            "INSERT INTO movimientos (tipo, categoria_id, descripcion, monto) VALUES ('egreso', 3, ?, 5)",
+            ((f"Movimiento {i}",) for i in range(args.filas)),
+        )
+        conn.commit()
+        conn.close()
+
+        cliente = erp.app.test_client()
+        with cliente.session_transaction() as s:
+            s["user"] = "bench"
+            s["user_id"] = 1
+            s["mod_pedidos"] = True
+
+        base = rss_pico_mb()
+        ok = True
+        for ruta in ("/export/pedidos", "/export/ingresos", "/export/movimientos"):
+            t0 = time.perf_counter()
+            resp = cliente.get(ruta, buffered=False)
+            n_bytes = 0
+            n_lineas = 0
+            for bloque in resp.response:
+                n_bytes += len(bloque)
+                n_lineas += bloque.count(b"\n") if isinstance(bloque, bytes) else bloque.count("\n")
+            resp.close()
+            crecimiento = rss_pico_mb() - base
+            ok &= crecimiento <= args.max_mb
+            print(f"{ruta:<20} {n_lineas - 1:>9} filas  {n_bytes / 1024 / 1024:8.1f} MB  "
+                  f"{time.perf_counter() - t0:6.1f} s  RSS pico +{crecimiento:.1f} MB")
+        print("✅ memoria acotada" if ok else f"❌ el RSS pico creció más de {args.max_mb} MB")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
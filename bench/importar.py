@@ -0,0 +1,81 @@
+"""Benchmark de /import/pedidos e /import/ingresos vs. un POST por fila.
+
+Uso:
+    python bench/importar.py --filas 100000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def csv_bytes(columnas, filas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columnas)
+    writer.writerows(filas)
+    return buffer.getvalue().encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=100000)
+    parser.add_argument("--muestra-por-fila", type=int, default=1000,
+                        help="filas enviadas una por una con /nuevo_pedido para comparar")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app as erp
+
+        cliente = erp.app.test_client()
+        with cliente.session_transaction() as s:
+            s["user"] = "bench"
+            s["user_id"] = 1
+            s["mod_pedidos"] = True
+
+        # Antes: un POST (y un commit) por pedido
+        t0 = time.perf_counter()
+        for i in range(args.muestra_por_fila):
+            cliente.post("/nuevo_pedido", data={
+                "numero_pedido": f"900{i}", "cliente": "Cliente", "importe": "100", "moneda": "PEN",
+            })
+        por_fila = (time.perf_counter() - t0) / args.muestra_por_fila
+        print(f"por fila (/nuevo_pedido): {por_fila * 1000:.2f} ms/fila "
+              f"-> {por_fila * args.filas:.1f} s estimados para {args.filas} filas")
+
+        pedidos = csv_bytes(
+            ["numero_pedido", "fecha", "cliente", "descripcion", "importe", "gasto", "moneda"],
+            ((str(i), "2025-03-01", f"Cliente {i % 700}", "Trabajo", f"{random.uniform(10, 900):.2f}",
+              "" if i % 5 else "12.5", random.choice(("PEN", "USD", ""))) for i in range(1, args.filas + 1)),
+        )
+        t0 = time.perf_counter()
+        r = cliente.post("/import/pedidos", data={"archivo": (io.BytesIO(pedidos), "pedidos.csv")}).get_json()
+        t_pedidos = time.perf_counter() - t0
+        print(f"/import/pedidos:  {r['insertados']} filas en {t_pedidos:.2f} s "
+              f"({r['insertados'] / t_pedidos:,.0f} filas/s), errores: {r['total_errores']}")
+
+        ingresos = csv_bytes(
+            ["numero_pedido", "monto", "forma_pago", "fecha"],
+            ((str(random.randint(1, args.filas)), "25", "Efectivo", "2025-03-02") for _ in range(args.filas)),
+        )
+        t0 = time.perf_counter()
+        r = cliente.post("/import/ingresos", data={"archivo": (io.BytesIO(ingresos), "ingresos.csv")}).get_json()
+        t_ingresos = time.perf_counter() - t0
+        print(f"/import/ingresos: {r['insertados']} filas en {t_ingresos:.2f} s "
+              f"({r['insertados'] / t_ingresos:,.0f} filas/s), errores: {r['total_errores']}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
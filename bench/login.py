@@ -0,0 +1,164 @@
+"""Ráfaga de N logins concurrentes contra un servidor real: p50/p99 del login.
+
+El servidor atiende con --hilos hilos, como un worker gthread de gunicorn.
+Los logins rechazados por pool saturado (503) se reintentan tras el
+Retry-After, como haría el usuario. Mientras dura la ráfaga otro hilo, ya logueado, pide
+/api/dashboard: el bench falla si alguna respuesta tarda más de --umbral, es decir, si los
+logins retienen los hilos del worker. La mitad de los usuarios tiene la
+contraseña heredada en texto plano, así que también se mide la
+actualización a hash.
+
+Uso:
+    python bench/login.py --concurrentes 200 --hilos 64
+"""
+import argparse
+import http.client
+import http.cookies
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def servidor_acotado(app, hilos):
+    """Servidor WSGI que atiende con un pool fijo de ``hilos`` hilos (como gthread)."""
+    from werkzeug.serving import BaseWSGIServer
+
+    class Servidor(BaseWSGIServer):
+        def __init__(self, *a, **kw):
+            super().__init__(*a, **kw)
+            self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="http")
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._atender, request, client_address)
+
+        def _atender(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return Servidor("127.0.0.1", 0, app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrentes", type=int, default=200)
+    parser.add_argument("--hilos", type=int, default=64, help="hilos del servidor (ERP_HILOS)")
+    parser.add_argument("--umbral", type=float, default=1.0, help="latencia máxima de /api/dashboard, en segundos")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app as erp
+        from werkzeug.security import generate_password_hash
+
+        conn = sqlite3.connect(erp.DB_NAME)
+        hash_comun = generate_password_hash("clave")
+        conn.executemany(
+            "INSERT INTO usuarios (username, password, mod_pedidos) VALUES (?, ?, 1)",
+            ((f"u{i}", hash_comun if i % 2 else "clave") for i in range(args.concurrentes)),
+        )
+        conn.commit()
+        conn.close()
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        servidor = servidor_acotado(erp.app, args.hilos)
+        puerto = servidor.server_port
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+        def pedir(metodo, ruta, cuerpo=None, cookie=None):
+            cx = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+            t0 = time.perf_counter()
+            cabeceras = {"Content-Type": "application/x-www-form-urlencoded"} if cuerpo else {}
+            if cookie:
+                cabeceras["Cookie"] = cookie
+            cx.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            resp = cx.getresponse()
+            resp.read()
+            cx.close()
+            return resp.status, time.perf_counter() - t0, resp.getheader("Set-Cookie"), resp.getheader("Retry-After")
+
+        galleta = pedir("POST", "/", urllib.parse.urlencode({"username": "Administrador", "password": "1812"}))[2]
+        sesion = "; ".join(f"{m.key}={m.value}" for m in http.cookies.SimpleCookie(galleta).values())
+        assert pedir("GET", "/api/dashboard", cookie=sesion)[0] == 200
+        logins = []
+        reintentos = []
+        sondeos = []
+        inicio = threading.Barrier(args.concurrentes + 1)
+        fin = threading.Event()
+
+        def login(i):
+            cuerpo = urllib.parse.urlencode({"username": f"u{i}", "password": "clave"})
+            inicio.wait()
+            t0 = time.perf_counter()
+            intento = 0
+            while True:
+                estado, _, _, espera = pedir("POST", "/", cuerpo)
+                if estado != 503 or time.perf_counter() - t0 > 300:
+                    break
+                intento += 1
+                time.sleep(float(espera or 1) * random.uniform(1, 2))
+            logins.append((estado, time.perf_counter() - t0))
+            reintentos.append(intento)
+
+        def sondear():
+            inicio.wait()
+            while not fin.is_set():
+                sondeos.append(pedir("GET", "/api/dashboard", cookie=sesion)[1])
+                time.sleep(0.02)
+
+        hilos = [threading.Thread(target=login, args=(i,)) for i in range(args.concurrentes)]
+        sonda = threading.Thread(target=sondear)
+        for h in hilos + [sonda]:
+            h.start()
+        t0 = time.perf_counter()
+        for h in hilos:
+            h.join()
+        total = time.perf_counter() - t0
+        fin.set()
+        sonda.join()
+        servidor.shutdown()
+
+        ok = [t for estado, t in logins if estado == 302]
+        rechazados = sum(1 for estado, _ in logins if estado != 302)
+        print(f"logins: {len(logins)} ({rechazados} sin éxito, {sum(reintentos)} reintentos por 503)  "
+              f"ráfaga completa en {total:.2f} s  hilos: {args.hilos}  CPUs: {os.cpu_count()}")
+        if ok:
+            print(f"login           p50 {statistics.median(ok) * 1000:8.1f} ms   p99 {percentil(ok, 0.99) * 1000:8.1f} ms")
+        # El máximo y no el p99: la sonda es secuencial, si queda trabada detrás
+        # de los logins junta pocas muestras y el p99 no lo ve
+        max_sonda = max(sondeos, default=float("inf"))
+        print(f"/api/dashboard  p50 {statistics.median(sondeos or [max_sonda]) * 1000:8.1f} ms"
+              f"   p99 {percentil(sondeos or [max_sonda], 0.99) * 1000:8.1f} ms   máx {max_sonda * 1000:8.1f} ms"
+              f"   ({len(sondeos)} pedidos durante la ráfaga, umbral {args.umbral * 1000:.0f} ms)")
+        conn = sqlite3.connect(erp.DB_NAME)
+        planos = conn.execute("SELECT COUNT(*) FROM usuarios WHERE username LIKE 'u%' AND password NOT LIKE 'scrypt:%'").fetchone()[0]
+        conn.close()
+        print(f"contraseñas en texto plano restantes: {planos}")
+        sys.exit(0 if not rechazados and not planos and max_sonda <= args.umbral else 1)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Costo de las métricas: mismas peticiones con ERP_METRICAS apagado y encendido.
+
+Cada modo corre en un subproceso (el interruptor se lee al importar app.py)
+contra una base con pedidos y movimientos de ejemplo.
+
+Uso:
+    python bench/metricas.py --peticiones 2000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HIJO = r"""
+import os, sqlite3, sys, time
+sys.path.insert(0, sys.argv[1])
+import app as erp
+conn = sqlite3.connect(erp.DB_NAME)
+conn.executemany("INSERT INTO pedidos (numero_pedido, fecha, cliente, moneda) VALUES (?, date('now'), 'C', 'PEN')",
+                 ((str(i),) for i in range(5000)))
+conn.executemany("INSERT INTO movimientos (tipo, categoria_id, monto) VALUES ('egreso', 1, 1)", ((),) * 5000)
+conn.commit()
+cliente = erp.app.test_client()
+with cliente.session_transaction() as s:
+    s["user_id"] = 1
+rutas = ["/api/pedidos?draw=1&length=25", "/api/movimientos", "/api/dashboard", "/api/pedidos/vencimientos"]
+for ruta in rutas:
+    cliente.get(ruta)
+n = int(sys.argv[2])
+t0 = time.perf_counter()
+for i in range(n):
+    assert cliente.get(rutas[i % len(rutas)]).status_code == 200
+print((time.perf_counter() - t0) / n * 1e6)
+"""
+
+
+def correr(peticiones, activas):
+    with tempfile.TemporaryDirectory(prefix="bench_erp_") as tmp:
+        env = dict(os.environ, ERP_METRICAS="1" if activas else "0", ERP_METRICAS_DIR=os.path.join(tmp, "metricas"))
+        salida = subprocess.run([sys.executable, "-c", HIJO, RAIZ, str(peticiones)],
+                                cwd=tmp, env=env, capture_output=True, text=True, check=True)
+        return float(salida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    apagadas = correr(args.peticiones, False)
+    encendidas = correr(args.peticiones, True)
+    print(f"métricas apagadas:   {apagadas:8.1f} µs/petición")
+    print(f"métricas encendidas: {encendidas:8.1f} µs/petición  ({(encendidas / apagadas - 1) * 100:+.1f} %)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark de /movimientos: subconsultas correlacionadas sin límite (antes) vs. JOIN + keyset (después).
+
+Mide latencia y memoria pico (tracemalloc) de armar y renderizar la página.
+
+Uso:
+    python bench/movimientos_lista.py --movimientos 500000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONSULTA_ANTES = """
+    SELECT m.id, m.tipo,
+           (SELECT nombre FROM categorias WHERE id = m.categoria_id) as categoria,
+           (SELECT nombre FROM subcategorias WHERE id = m.subcategoria_id) as subcategoria,
+           m.descripcion, m.monto
+    FROM movimientos m
+    ORDER BY m.id DESC
+"""
+
+
+def sembrar(db, n):
+    conn = sqlite3.connect(db)
+    conn.executemany(
+        "INSERT INTO subcategorias (categoria_id, nombre) VALUES (?, ?)",
+        ((random.randint(1, 4), f"Sub {i}") for i in range(50)),
+    )
+    conn.executemany(
+        "INSERT INTO movimientos (tipo, categoria_id, subcategoria_id, descripcion, monto) VALUES (?, ?, ?, ?, ?)",
+        ((random.choice(("ingreso", "egreso")), random.randint(1, 4), random.choice((None, random.randint(1, 54))),
+          f"Movimiento {i}", round(random.uniform(1, 5000), 2)) for i in range(n)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def medir(funcion):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    funcion()
+    segundos = time.perf_counter() - t0
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return segundos, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movimientos", type=int, default=500000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app as erp
+        from flask import render_template
+
+        sembrar(erp.DB_NAME, args.movimientos)
+
+        def antes():
+            conn = sqlite3.connect(erp.DB_NAME)
+            conn.row_factory = sqlite3.Row
+            movimientos = conn.execute(CONSULTA_ANTES).fetchall()
+            conn.close()
+            with erp.app.test_request_context("/movimientos"):
+                render_template("movimientos.html", movimientos=movimientos, categorias=[],
+                                filtros={}, siguiente=None)
+
+        cliente = erp.app.test_client()
+        with cliente.session_transaction() as s:
+            s["user"] = "bench"
+            s["user_id"] = 1
+
+        def despues():
+            assert cliente.get("/movimientos").status_code == 200
+
+        def despues_filtrado():
+            assert cliente.get("/api/movimientos", query_string={
+                "tipo": "egreso", "categoria": 3, "monto_min": 1000, "monto_max": 2000,
+            }).status_code == 200
+
+        print(f"{args.movimientos} movimientos")
+        for nombre, funcion in (("antes", antes), ("después", despues), ("después + filtros (JSON)", despues_filtrado)):
+            segundos, pico = medir(funcion)
+            print(f"  {nombre:<26} {segundos * 1000:9.1f} ms  pico {pico / 1024 / 1024:8.1f} MB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
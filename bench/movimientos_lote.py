@@ -0,0 +1,104 @@
+"""200 ediciones de celdas en movimientos: una petición por celda frente a un lote.
+
+Sobre una copia de la base de bench.datos compara /movimientos/update
+(una petición por celda, como enviaba antes movimientos.html) con una
+sola llamada a /api/movimientos/batch. Las sentencias SQL (execute y
+executemany de la app) salen de las métricas de app.py.
+
+Uso:
+    python -m bench.movimientos_lote --dir /tmp/erp_100k --celdas 200 --salida lote.json
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench import datos, resultados
+
+
+def _ediciones(rnd, n_movimientos, celdas, sufijo):
+    ediciones = []
+    for k in range(celdas):
+        mov_id = rnd.randint(1, n_movimientos)
+        if k % 2:
+            ediciones.append({"id": mov_id, "descripcion": f"editado {sufijo} {k}"})
+        else:
+            ediciones.append({"id": mov_id, "monto": round(rnd.uniform(1, 900), 2)})
+    return ediciones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="1k")
+    parser.add_argument("--dir", help="base ya generada con bench.datos (se usa una copia)")
+    parser.add_argument("--celdas", type=int, default=200)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+    if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+        print(f"Generando base {args.escala} en {origen}...")
+        datos.preparar(origen, args.escala, salida=print)
+    conn = sqlite3.connect(os.path.join(origen, "mi_erp.db"))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        shutil.copy(os.path.join(origen, "mi_erp.db"), tmp)
+        os.chdir(tmp)
+        sys.path.insert(0, datos.RAIZ)
+        os.environ["ERP_METRICAS"] = "1"  # cuenta las sentencias por endpoint
+        import app as erp
+
+        cli = erp.app.test_client()
+        with cli.session_transaction() as s:
+            s["user_id"] = 1
+        def sentencias(endpoint):
+            return erp.metricas.datos["sql"].get(endpoint, {}).get("consultas", 0)
+
+        n_movimientos = sqlite3.connect(erp.DB_NAME).execute("SELECT MAX(id) FROM movimientos").fetchone()[0]
+        rnd = random.Random(21)
+
+        por_celda, lote = [], []
+        sentencias_celda = sentencias_lote = 0
+        for i in range(args.repeticiones):
+            ediciones = _ediciones(rnd, n_movimientos, args.celdas, f"c{i}")
+            antes = sentencias("update_movimiento")
+            t0 = time.perf_counter()
+            for e in ediciones:
+                r = cli.post("/movimientos/update", data={k: str(v) for k, v in e.items()})
+                assert r.status_code == 204, r.data
+            por_celda.append(time.perf_counter() - t0)
+            sentencias_celda = sentencias("update_movimiento") - antes
+
+            ediciones = _ediciones(rnd, n_movimientos, args.celdas, f"l{i}")
+            antes = sentencias("api_movimientos_batch")
+            t0 = time.perf_counter()
+            r = cli.post("/api/movimientos/batch", json={"ediciones": ediciones})
+            lote.append(time.perf_counter() - t0)
+            assert r.status_code == 200 and not r.json["errores"], r.json
+            sentencias_lote = sentencias("api_movimientos_batch") - antes
+    finally:
+        os.chdir(datos.RAIZ)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    salida = {
+        "una_peticion_por_celda": {**resultados.percentiles(por_celda), "peticiones": args.celdas,
+                                   "sentencias_sql": sentencias_celda},
+        "lote": {**resultados.percentiles(lote), "peticiones": 1, "sentencias_sql": sentencias_lote},
+    }
+    for nombre, r in salida.items():
+        print(f"{nombre:<24} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+              f"peticiones {r['peticiones']}  sentencias SQL {r['sentencias_sql']}")
+    resultados.guardar(args.salida, "movimientos_lote", {"escala": args.escala, "celdas": args.celdas,
+                                                         "repeticiones": args.repeticiones}, salida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Bytes en la red y tiempo de render de las páginas pesadas con 10k pedidos.
+
+Sobre una base de bench.datos (10 000 pedidos por defecto) recorre:
+- los 10k pedidos por /api/pedidos en páginas de 500, sin y con gzip;
+- las primeras páginas de /movimientos?limite=500 (las que entran en
+  cache_filas_movimientos), con el caché de filas frío (todas las filas se
+  renderizan) y caliente, sin y con gzip;
+- /pedidos, /movimientos y /categorias revalidadas con If-None-Match (304),
+  y que con otro VERSION_DESPLIEGUE esos ETag ya no valgan.
+
+Uso:
+    python -m bench.paginas --escala 10000 --salida paginas.json
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import datos, resultados
+
+GZIP = {"Accept-Encoding": "gzip"}
+DATATABLES = {"draw": 1, "length": 500, "order[0][column]": 0, "order[0][dir]": "desc",
+              "columns[0][data]": "numero_pedido"}
+
+
+def _rutas_movimientos(cli, maximo):
+    """Hasta ``maximo`` páginas de /movimientos?limite=500, siguiendo el keyset de /api/movimientos."""
+    rutas, antes = [], None
+    while len(rutas) < maximo:
+        sufijo = f"&antes={antes}" if antes else ""
+        rutas.append("/movimientos?limite=500" + sufijo)
+        antes = cli.get("/api/movimientos?limite=500" + sufijo).json["siguiente"]
+        if not antes:
+            break
+    return rutas
+
+
+def _recorrer(cli, rutas, cabeceras=None, antes_de_cada=None):
+    """GET de cada ruta; devuelve (segundos por página, bytes totales)."""
+    tiempos, total = [], 0
+    for ruta in rutas:
+        if antes_de_cada:
+            antes_de_cada()
+        t0 = time.perf_counter()
+        r = cli.get(ruta, headers=cabeceras or {})
+        tiempos.append(time.perf_counter() - t0)
+        assert r.status_code == 200, (ruta, r.status_code)
+        total += len(r.data)
+    return tiempos, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="10000")
+    parser.add_argument("--dir", help="base ya generada con bench.datos (se usa una copia)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+    if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+        print(f"Generando base {args.escala} en {origen}...")
+        escala = args.escala if args.escala in datos.ESCALAS else int(args.escala)
+        datos.preparar(origen, escala, salida=print)
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    salida = {}
+    try:
+        shutil.copy(os.path.join(origen, "mi_erp.db"), tmp)
+        os.chdir(tmp)
+        sys.path.insert(0, datos.RAIZ)
+        import app as erp
+
+        cli = erp.app.test_client()
+        cli.post("/", data={"username": "Administrador", "password": "1812"})
+        conn = erp._conectar()
+        n_pedidos = conn.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]
+        conn.close()
+        salida["pedidos"] = n_pedidos
+
+        rutas_pedidos = [
+            "/api/pedidos?" + "&".join(f"{k}={v}" for k, v in {**DATATABLES, "start": start}.items())
+            for start in range(0, n_pedidos, 500)
+        ]
+        rutas_movimientos = _rutas_movimientos(cli, erp.cache_filas_movimientos.maxsize // 500)
+        casos = {
+            "api_pedidos": (rutas_pedidos, None),
+            "movimientos_cache_frio": (rutas_movimientos, erp.cache_filas_movimientos.limpiar),
+            "movimientos_cache_caliente": (rutas_movimientos, None),
+        }
+        for nombre, (rutas, antes) in casos.items():
+            for sufijo, cabeceras in (("", None), ("_gzip", GZIP)):
+                tiempos, total = [], 0
+                for _ in range(args.repeticiones):
+                    t, total = _recorrer(cli, rutas, cabeceras, antes)
+                    tiempos.extend(t)
+                salida[nombre + sufijo] = {**resultados.percentiles(tiempos), "paginas": len(rutas),
+                                           "kb_recorrido": round(total / 1024, 1)}
+
+        for ruta in ("/pedidos", "/movimientos?limite=500", "/categorias"):
+            etag = cli.get(ruta, headers=GZIP).headers["ETag"]
+            tiempos = []
+            for _ in range(args.repeticiones * 20):
+                t0 = time.perf_counter()
+                r = cli.get(ruta, headers={"If-None-Match": etag, **GZIP})
+                tiempos.append(time.perf_counter() - t0)
+                assert r.status_code == 304
+            salida[f"304 {ruta}"] = {**resultados.percentiles(tiempos), "bytes": len(r.data)}
+
+        # Un despliegue nuevo invalida los ETag ya entregados aunque los datos no cambien
+        etags = {ruta: cli.get(ruta).headers["ETag"] for ruta in ("/pedidos", "/categorias")}
+        version, erp.VERSION_DESPLIEGUE = erp.VERSION_DESPLIEGUE, erp.VERSION_DESPLIEGUE + "-nueva"
+        for ruta, etag in etags.items():
+            r = cli.get(ruta, headers={"If-None-Match": etag})
+            assert r.status_code == 200 and r.headers["ETag"] != etag, (ruta, r.status_code)
+        erp.VERSION_DESPLIEGUE = version
+    finally:
+        os.chdir(datos.RAIZ)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for nombre, r in salida.items():
+        print(f"{nombre:<32} " + ("  ".join(f"{k} {v}" for k, v in r.items()) if isinstance(r, dict) else str(r)))
+    resultados.guardar(args.salida, "paginas", {"escala": args.escala, "repeticiones": args.repeticiones}, salida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark de la carga de /pedidos: bucle N+1 (antes) vs. resumen de caja + una página (después).
+
+Uso:
+    python bench/pedidos_n1.py --pedidos 20000 --ingresos 3
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from werkzeug.datastructures import MultiDict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sembrar(erp, db, n_pedidos, m_ingresos):
+    conn = sqlite3.connect(db)
+    erp.aplicar_migraciones(conn)
+    hoy = date.today()
+    conn.executemany("""
+        INSERT INTO pedidos (numero_pedido, fecha, fecha_entrega_propuesta, cliente, importe, gasto, moneda)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        (str(i), hoy.isoformat(), (hoy + timedelta(days=random.randint(-30, 30))).isoformat(),
+         f"Cliente {i % 500}", 100.0, 10.0, random.choice(("PEN", "USD")))
+        for i in range(1, n_pedidos + 1)
+    ))
+    conn.executemany("""
+        INSERT INTO ingresos (pedido_id, monto, forma_pago, fecha, depositado)
+        VALUES (?, ?, 'Efectivo', ?, ?)
+    """, (
+        (pid, 25.0, hoy.isoformat(), random.randint(0, 1))
+        for pid in range(1, n_pedidos + 1)
+        for _ in range(m_ingresos)
+    ))
+    conn.commit()
+    conn.close()
+
+
+def cargar_antes(c):
+    """Copia del bucle original: una consulta de ingresos por pedido."""
+    c.execute("""
+        SELECT p.* FROM pedidos p
+        ORDER BY CAST(p.numero_pedido AS INTEGER) DESC, p.numero_pedido DESC
+    """)
+    pedidos, ingresos_map, efectivo_pen, efectivo_usd = [], {}, 0, 0
+    for p in c.fetchall():
+        c.execute("""
+            SELECT id, pedido_id, monto, forma_pago, fecha, depositado
+            FROM ingresos WHERE pedido_id=? ORDER BY id DESC
+        """, (p["id"],))
+        ingresos_list = [dict(i) for i in c.fetchall()]
+        ingresos_map[p["id"]] = ingresos_list
+        p_dict = dict(p)
+        p_dict["total_ingresos"] = round(sum((i["monto"] or 0) for i in ingresos_list), 2)
+        p_dict["dias"] = (date.fromisoformat(p["fecha_entrega_propuesta"]) - date.today()).days
+        pedidos.append(p_dict)
+        for ing in ingresos_list:
+            if not ing["depositado"]:
+                if (p["moneda"] or "PEN") == "USD":
+                    efectivo_usd += ing["monto"] or 0
+                else:
+                    efectivo_pen += ing["monto"] or 0
+    return pedidos, ingresos_map, efectivo_pen, efectivo_usd
+
+
+def medir(db, funcion):
+    conn = sqlite3.connect(db)
+    conn.row_factory = sqlite3.Row
+    consultas = [0]
+
+    def contar(_sql):
+        consultas[0] += 1
+
+    conn.set_trace_callback(contar)
+    t0 = time.perf_counter()
+    resultado = funcion(conn.cursor())
+    segundos = time.perf_counter() - t0
+    conn.close()
+    return consultas[0], segundos, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pedidos", type=int, default=5000)
+    parser.add_argument("--ingresos", type=int, default=3, help="ingresos por pedido")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        # Importar app dentro del directorio temporal para no tocar mi_erp.db
+        os.chdir(tmp)
+        sys.path.insert(0, RAIZ)
+        import app
+
+        db = os.path.join(tmp, "bench.db")
+        sembrar(app, db, args.pedidos, args.ingresos)
+
+        q_antes, t_antes, r_antes = medir(db, cargar_antes)
+        q_despues, t_despues, r_despues = medir(db, lambda c: (
+            app._efectivo_en_caja(c), app._pagina_pedidos(c, MultiDict({"start": 0, "length": 25}))
+        ))
+        efectivo_antes = [round(x, 2) for x in r_antes[2:]]
+        efectivo_despues = [round(x, 2) for x in r_despues[0]]
+        assert efectivo_antes == efectivo_despues, "los totales de efectivo no coinciden"
+
+        print(f"{args.pedidos} pedidos x {args.ingresos} ingresos")
+        print(f"  antes:   {q_antes:>7} consultas  {t_antes * 1000:9.1f} ms")
+        print(f"  después: {q_despues:>7} consultas  {t_despues * 1000:9.1f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
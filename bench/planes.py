@@ -0,0 +1,145 @@
+"""Verifica con EXPLAIN QUERY PLAN que las consultas calientes usan índices.
+
+Crea una base temporal con todas las migraciones, la llena con datos de
+ejemplo, corre ANALYZE y falla (exit 1) si algún plan hace un SCAN completo
+o necesita un B-TREE temporal para ordenar. Además de CONSULTAS verifica
+las páginas de /api/pedidos que arma _pagina_pedidos, por cada columna
+ordenable.
+
+Uso:
+    python bench/planes.py
+"""
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (descripción, consulta, parámetros, fragmento que debe aparecer en el plan)
+CONSULTAS = [
+    ("ingresos de un pedido",
+     "SELECT id, monto FROM ingresos WHERE pedido_id=? ORDER BY id DESC", (1,),
+     "idx_ingresos_pedido"),
+    # La caja se lee de caja_saldos (dos filas, _efectivo_en_caja); lo que
+    # cuesta es mantenerla: estas son las consultas de los triggers de 0004
+    # en cada escritura de ingresos o cambio de moneda de un pedido.
+    ("caja: saldo de la moneda de un ingreso",
+     """UPDATE caja_saldos SET efectivo = efectivo + ?
+        WHERE moneda = (SELECT CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END
+                        FROM pedidos WHERE id = ?)""", (10, 1),
+     "sqlite_autoindex_caja_saldos"),
+    ("caja: efectivo pendiente de un pedido",
+     "SELECT COALESCE(SUM(monto), 0) FROM ingresos WHERE pedido_id = ? AND depositado = 0", (1,),
+     "idx_ingresos_depositado"),
+    ("subcategorías de una categoría",
+     "SELECT id, nombre FROM subcategorias WHERE categoria_id=?", (1,),
+     "idx_subcategorias_categoria"),
+    ("movimientos de una categoría",
+     "SELECT id FROM movimientos WHERE categoria_id=?", (1,),
+     "idx_movimientos_categoria"),
+    ("pedidos por # pedido",
+     """SELECT p.* FROM pedidos p
+        ORDER BY p.numero_pedido_num DESC, p.numero_pedido DESC, p.id DESC LIMIT 25""", (),
+     "idx_pedidos_numero"),
+    ("pedidos vencidos",
+     """SELECT id, fecha_entrega_propuesta FROM pedidos
+        WHERE fecha_entrega_real IS NULL AND fecha_entrega_propuesta < ?
+        ORDER BY fecha_entrega_propuesta LIMIT 50""", ("2030-01-01",),
+     "idx_pedidos_entrega_pendiente"),
+    ("pedidos que vencen en N días",
+     """SELECT id, fecha_entrega_propuesta FROM pedidos
+        WHERE fecha_entrega_real IS NULL AND fecha_entrega_propuesta > ? AND fecha_entrega_propuesta <= ?
+        ORDER BY fecha_entrega_propuesta LIMIT 50""", ("2030-01-01", "2030-01-08"),
+     "idx_pedidos_entrega_pendiente"),
+]
+
+
+def consultas_pedidos(erp):
+    """Las consultas de página de _pagina_pedidos para cada columna ordenable.
+
+    Corre _pagina_pedidos en ambas direcciones, la primera página y la
+    siguiente por keyset, y captura el SQL que emite (con los valores ya
+    expandidos por sqlite3).
+    """
+    from werkzeug.datastructures import MultiDict
+
+    conn = erp._conectar()
+    emitidas = []
+    conn.set_trace_callback(emitidas.append)
+    consultas = []
+    for columna in erp.PEDIDOS_COLUMNAS:
+        for direccion in ("asc", "desc"):
+            args = MultiDict({"draw": 1, "start": 0, "length": 25, "order[0][column]": 0,
+                              "order[0][dir]": direccion, "columns[0][data]": columna})
+            for pagina in ("primera página", "keyset"):
+                emitidas.clear()
+                resultado = erp._pagina_pedidos(conn.cursor(), args)
+                sql = next(e for e in emitidas if "ORDER BY" in e)
+                # Con cursor el índice tiene que buscar (SEARCH), no recorrer desde el principio
+                consultas.append((f"pedidos por {columna} {direccion} ({pagina})", sql, (),
+                                  "SEARCH p USING" if pagina == "keyset" else "USING INDEX"))
+                args = MultiDict({**args, "cursor": json.dumps(resultado["cursor"])})
+    conn.close()
+    return consultas
+
+
+def plan(conn, sql, params):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        fallas = verificar(tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    sys.exit(1 if fallas else 0)
+
+
+def verificar(tmp):
+    os.chdir(tmp)
+    sys.path.insert(0, RAIZ)
+    import app as erp
+
+    conn = sqlite3.connect(erp.DB_NAME)
+    conn.executemany(
+        """INSERT INTO pedidos (numero_pedido, fecha, cliente, moneda, fecha_entrega_propuesta, fecha_entrega_real)
+           VALUES (?, date('now'), 'C', 'PEN', date('now', ? || ' days'), ?)""",
+        ((str(i), i % 60 - 30, None if i % 10 == 0 else "2020-01-01") for i in range(1, 5001)),
+    )
+    conn.executemany(
+        "INSERT INTO ingresos (pedido_id, monto, fecha, depositado) VALUES (?, 10, date('now'), ?)",
+        ((i % 5000 + 1, int(i % 10 != 0)) for i in range(20000)),
+    )
+    conn.executemany(
+        "INSERT INTO subcategorias (categoria_id, nombre) VALUES (?, 'S')",
+        ((i % 4 + 1,) for i in range(400)),
+    )
+    conn.executemany(
+        "INSERT INTO movimientos (tipo, categoria_id, monto) VALUES ('egreso', ?, 1)",
+        ((i % 4 + 1,) for i in range(5000)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+    fallas = 0
+    for descripcion, sql, params, indice in CONSULTAS + consultas_pedidos(erp):
+        pasos = plan(conn, sql, params)
+        ok = (
+            any(indice in paso for paso in pasos)
+            and not any(paso.startswith("SCAN") and "INDEX" not in paso for paso in pasos)
+            and not any("TEMP B-TREE FOR ORDER BY" in paso for paso in pasos)
+        )
+        fallas += not ok
+        print(f"{'OK   ' if ok else 'FALLA'} {descripcion}")
+        for paso in pasos:
+            print(f"        {paso}")
+    conn.close()
+    return fallas
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Latencia de escritura (api_nuevo_ingreso) mientras corre un respaldo en caliente.
+
+Sobre una copia de la base de bench.datos, inflada hasta --gb con copias
+de pedidos (datos que comprimen como los reales), mide POST
+/api/nuevo_ingreso:
+- en reposo;
+- durante respaldar() en otro proceso, como lo corre worker.py, con los
+  pasos y pausas por defecto;
+- durante una copia en un solo paso (--paginas -1), para comparar.
+También informa el tamaño máximo del WAL durante cada respaldo y la
+duración de copia, verificación y compresión.
+
+Uso:
+    python -m bench.respaldo --dir /tmp/erp_100k --gb 2 --salida respaldo.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import datos, resultados
+
+RESPALDAR = (
+    "import json, sys, app; "
+    "print(json.dumps(app.respaldar(sys.argv[1], paginas=int(sys.argv[2]), pausa=float(sys.argv[3]))))"
+)
+
+
+def _inflar(origen, destino, gb):
+    """Copia la base y le agrega la tabla relleno hasta pesar ``gb`` GB."""
+    os.makedirs(destino, exist_ok=True)
+    shutil.copy(os.path.join(origen, "mi_erp.db"), destino)
+    conn = sqlite3.connect(os.path.join(destino, "mi_erp.db"))
+    conn.execute("CREATE TABLE relleno AS SELECT * FROM pedidos")
+    objetivo = gb * 1024 ** 3
+    while os.path.getsize(os.path.join(destino, "mi_erp.db")) < objetivo:
+        conn.execute("INSERT INTO relleno SELECT * FROM relleno")
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def _escribir(cli, i, n_pedidos):
+    t0 = time.perf_counter()
+    r = cli.post("/api/nuevo_ingreso", data={"pedido_id": str(i % n_pedidos + 1), "monto": "10",
+                                              "forma_pago": "Efectivo"})
+    return time.perf_counter() - t0, r.status_code == 200
+
+
+def _medir(cli, n_pedidos, mientras):
+    """Escribe en bucle mientras ``mientras()`` sea True; devuelve percentiles, errores y WAL máximo."""
+    latencias, errores, wal = [], 0, 0
+    i = 0
+    while mientras():
+        latencia, ok = _escribir(cli, i, n_pedidos)
+        latencias.append(latencia)
+        errores += not ok
+        i += 1
+        if os.path.exists("mi_erp.db-wal"):
+            wal = max(wal, os.path.getsize("mi_erp.db-wal"))
+    return {**resultados.percentiles(latencias), "errores": errores, "wal_max_mb": round(wal / 1024 ** 2, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="100k")
+    parser.add_argument("--dir", help="base ya generada con bench.datos")
+    parser.add_argument("--gb", type=float, default=2, help="tamaño de la base a respaldar")
+    parser.add_argument("--paginas", type=int, help="páginas por paso (por defecto RESPALDO_PAGINAS)")
+    parser.add_argument("--pausa", type=float, help="segundos entre pasos (por defecto RESPALDO_PAUSA)")
+    parser.add_argument("--reposo", type=float, default=10, help="segundos de escrituras sin respaldo")
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+    if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+        print(f"Generando base {args.escala} en {origen}...")
+        datos.preparar(origen, args.escala, salida=print)
+    inflada = f"{origen.rstrip(os.sep)}_{args.gb:g}gb"
+    if not os.path.exists(os.path.join(inflada, "mi_erp.db")):
+        print(f"Inflando a {args.gb:g} GB en {inflada}...")
+        _inflar(origen, inflada, args.gb)
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    salida = {}
+    try:
+        shutil.copy(os.path.join(inflada, "mi_erp.db"), tmp)
+        os.chdir(tmp)
+        sys.path.insert(0, datos.RAIZ)
+        import app as erp
+
+        cli = erp.app.test_client()
+        cli.post("/", data={"username": "Administrador", "password": "1812"})
+        conn = erp._conectar()
+        n_pedidos = conn.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]
+        paginas = args.paginas or erp.RESPALDO_PAGINAS
+        pausa = erp.RESPALDO_PAUSA if args.pausa is None else args.pausa
+        salida["base_mb"] = round(os.path.getsize("mi_erp.db") / 1024 ** 2)
+
+        fin = time.monotonic() + args.reposo
+        salida["escrituras_en_reposo"] = _medir(cli, n_pedidos, lambda: time.monotonic() < fin)
+
+        entorno = {**os.environ, "PYTHONPATH": datos.RAIZ}
+        for nombre, pag, pau in (("paginado", paginas, pausa), ("un_paso", -1, 0)):
+            print(f"Respaldo {nombre} ({pag} páginas por paso, pausa {pau} s)...")
+            proceso = subprocess.Popen([sys.executable, "-c", RESPALDAR, f"respaldos_{nombre}", str(pag), str(pau)],
+                                       env=entorno, stdout=subprocess.PIPE, text=True)
+            escrituras = _medir(cli, n_pedidos, lambda: proceso.poll() is None)
+            resumen = json.loads(proceso.stdout.read().strip().splitlines()[-1])
+            assert proceso.returncode == 0
+            salida[f"escrituras_durante_{nombre}"] = escrituras
+            salida[f"respaldo_{nombre}"] = {k: v for k, v in resumen.items() if k not in ("archivo", "rotados")}
+            shutil.rmtree(f"respaldos_{nombre}")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+    finally:
+        os.chdir(datos.RAIZ)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for nombre, r in salida.items():
+        print(f"{nombre:<28} " + ("  ".join(f"{k} {v}" for k, v in r.items()) if isinstance(r, dict) else str(r)))
+    resultados.guardar(args.salida, "respaldo", {"gb": args.gb, "paginas": paginas, "pausa": pausa}, salida)
+
+
+if __name__ == "__main__":
+    main()
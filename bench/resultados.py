@@ -0,0 +1,106 @@
+"""Resultados de benchmarks en JSON y comparación entre commits.
+
+Cada archivo tiene ``meta`` (commit, fecha, máquina, parámetros) y
+``resultados``: nombre -> métricas. Las métricas terminadas en ``_ms`` son
+mejores cuanto más bajas; ``rps`` cuanto más alta.
+
+Uso:
+    python -m bench.resultados antes.json despues.json --umbral 10
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(latencias):
+    """p50/p95/p99 y media en milisegundos de una lista de segundos."""
+    if not latencias:
+        return {"n": 0}
+    orden = sorted(latencias)
+
+    def p(q):
+        return round(orden[min(len(orden) - 1, int(len(orden) * q))] * 1000, 3)
+    return {
+        "n": len(orden),
+        "media_ms": round(sum(orden) / len(orden) * 1000, 3),
+        "p50_ms": p(0.50),
+        "p95_ms": p(0.95),
+        "p99_ms": p(0.99),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def guardar(ruta, benchmark, parametros, resultados):
+    """Escribe el JSON con metadatos y lo devuelve como dict."""
+    datos = {
+        "meta": {
+            "benchmark": benchmark,
+            "commit": _commit(),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": __import__("sqlite3").sqlite_version,
+            "maquina": platform.node(),
+            "cpus": os.cpu_count(),
+            "parametros": parametros,
+        },
+        "resultados": resultados,
+    }
+    if ruta:
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+    return datos
+
+
+def comparar(antes, despues, umbral=10.0):
+    """Filas (nombre, métrica, antes, después, % cambio, es_regresion)."""
+    filas = []
+    for nombre, metricas in despues["resultados"].items():
+        previas = antes["resultados"].get(nombre, {})
+        for metrica, valor in metricas.items():
+            anterior = previas.get(metrica)
+            if not isinstance(valor, (int, float)) or not isinstance(anterior, (int, float)) or not anterior:
+                continue
+            if not (metrica.endswith("_ms") or metrica == "rps"):
+                continue
+            cambio = (valor - anterior) / anterior * 100
+            peor = cambio > umbral if metrica.endswith("_ms") else cambio < -umbral
+            filas.append((nombre, metrica, anterior, valor, cambio, peor))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("antes")
+    parser.add_argument("despues")
+    parser.add_argument("--umbral", type=float, default=10.0, help="% de cambio que cuenta como regresión")
+    args = parser.parse_args()
+
+    with open(args.antes, encoding="utf-8") as f:
+        antes = json.load(f)
+    with open(args.despues, encoding="utf-8") as f:
+        despues = json.load(f)
+    print(f"{antes['meta'].get('commit')} -> {despues['meta'].get('commit')}")
+    filas = comparar(antes, despues, args.umbral)
+    for nombre, metrica, anterior, valor, cambio, peor in filas:
+        marca = "❌" if peor else "  "
+        print(f"{marca} {nombre:<40} {metrica:<8} {anterior:>10.2f} -> {valor:>10.2f}  {cambio:+6.1f} %")
+    regresiones = sum(1 for fila in filas if fila[-1])
+    print(f"{regresiones} regresiones por encima de {args.umbral} %")
+    sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Micro-benchmark de cada ruta de app.py con el test client de Flask.
+
+Trabaja sobre una copia de la base generada por bench.datos (las rutas de
+escritura la modifican) y reporta media/p50/p95/p99 por ruta. Avisa si hay
+rutas en app.url_map sin caso en RUTAS. Antes comprueba que las escrituras
+de RECHAZOS respondan 400 sin tocar la base.
+
+Uso:
+    python -m bench.rutas --escala 1k --repeticiones 200 --salida rutas.json
+    python -m bench.rutas --escala 100k --dir /tmp/erp_100k --solo api_pedidos,api_buscar
+"""
+import argparse
+import itertools
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from bench import datos, resultados
+
+HOY = date.today()
+HACE_UNA_SEMANA = (HOY - timedelta(days=7)).isoformat()
+
+DATATABLES = {
+    "draw": 1, "start": 0, "length": 25, "order[0][column]": 1, "order[0][dir]": "desc",
+    "columns[0][data]": "etapa", "columns[1][data]": "numero_pedido",
+    "columns[2][data]": "fecha", "columns[3][data]": "cliente",
+}
+
+
+def _pedido(i, ctx):
+    return {"numero_pedido": f"B{i}", "cliente": "Cliente bench", "descripcion": "bench",
+            "importe": "150", "gasto": "40", "moneda": "PEN", "fecha_entrega_propuesta": HOY.isoformat()}
+
+
+# (caso, endpoint, método, ruta(i, ctx), datos(i, ctx) o None, repeticiones máximas o None)
+RUTAS = [
+    ("login (página)", "login", "GET", lambda i, c: "/", None, None),
+    ("login (POST, scrypt)", "login", "POST", lambda i, c: "/",
+     lambda i, c: {"username": "Administrador", "password": "1812"}, 10),
+    ("dashboard", "dashboard", "GET", lambda i, c: "/dashboard", None, None),
+    ("api_dashboard", "api_dashboard", "GET", lambda i, c: "/api/dashboard", None, None),
+    ("movimientos_list", "movimientos_list", "GET", lambda i, c: "/movimientos", None, None),
+    ("movimientos_list filtrado", "movimientos_list", "GET",
+     lambda i, c: "/movimientos?tipo=egreso&monto_min=50", None, None),
+    ("api_movimientos", "api_movimientos", "GET", lambda i, c: "/api/movimientos?limite=100", None, None),
+    ("add_movimiento", "add_movimiento", "POST", lambda i, c: "/movimientos/add",
+     lambda i, c: {"tipo": "egreso", "categoria": "3", "descripcion": f"bench {i}", "monto": "12.5"}, None),
+    ("update_movimiento", "update_movimiento", "POST", lambda i, c: "/movimientos/update",
+     lambda i, c: {"id": str(i % c["movimientos"] + 1), "descripcion": f"editado {i}", "monto": "9"}, None),
+    ("api_movimientos_batch (200 celdas)", "api_movimientos_batch", "POST", lambda i, c: "/api/movimientos/batch",
+     lambda i, c: [{"id": (i * 100 + k) % c["movimientos"] + 1, "descripcion" if k % 2 else "monto": f"{i}.{k}"}
+                   for k in range(200)], 20),
+    ("get_categorias", "get_categorias", "GET", lambda i, c: "/api/categorias/egreso", None, None),
+    ("get_subcategorias", "get_subcategorias", "GET", lambda i, c: "/api/subcategorias/3", None, None),
+    ("pedidos_list", "pedidos_list", "GET", lambda i, c: "/pedidos", None, None),
+    ("api_pedidos", "api_pedidos", "GET", lambda i, c: "/api/pedidos", lambda i, c: DATATABLES, None),
+    ("api_pedidos búsqueda", "api_pedidos", "GET", lambda i, c: "/api/pedidos",
+     lambda i, c: {**DATATABLES, "search[value]": "polos"}, None),
+    ("api_ingresos_pedido", "api_ingresos_pedido", "GET",
+     lambda i, c: f"/api/pedidos/{i % c['pedidos'] + 1}/ingresos", None, None),
+    ("api_vencimientos", "api_vencimientos", "GET", lambda i, c: "/api/pedidos/vencimientos", None, None),
+    ("nuevo_pedido", "nuevo_pedido", "POST", lambda i, c: "/nuevo_pedido", _pedido, None),
+    ("api_nuevo_ingreso", "api_nuevo_ingreso", "POST", lambda i, c: "/api/nuevo_ingreso",
+     lambda i, c: {"pedido_id": str(i % c["pedidos"] + 1), "monto": "10", "forma_pago": "Efectivo"}, None),
+    ("api_toggle_ingreso", "api_toggle_ingreso", "POST", lambda i, c: "/api/toggle_ingreso",
+     lambda i, c: {"ingreso_id": str(i % c["ingresos"] + 1), "valor": str(i % 2)}, None),
+    ("api_editar_pedido", "api_editar_pedido", "POST", lambda i, c: f"/api/editar_pedido/{i % c['pedidos'] + 1}",
+     lambda i, c: {"cliente": "Cliente editado", "descripcion": f"editado {i}",
+                   "fecha_entrega_propuesta": HOY.isoformat()}, None),
+    ("eliminar_ingreso", "eliminar_ingreso", "POST", lambda i, c: f"/eliminar_ingreso/{c['ingresos'] - i}", None, None),
+    ("eliminar_pedido", "eliminar_pedido", "POST", lambda i, c: f"/eliminar_pedido/{c['pedidos'] - i}", None, None),
+    ("api_stream (apertura)", "api_stream", "GET", lambda i, c: "/api/stream?desde=0", None, None),
+    ("api_buscar", "api_buscar", "GET", lambda i, c: "/api/buscar?q=polos gorros", None, None),
+    ("api_buscar prefijo", "api_buscar", "GET", lambda i, c: "/api/buscar?q=cli", None, None),
+    ("api_reporte_consolidado", "api_reporte_consolidado", "GET", lambda i, c: "/api/reportes/consolidado", None, None),
+    ("exportar_pedidos (7 días)", "exportar_pedidos", "GET",
+     lambda i, c: f"/export/pedidos?desde={HACE_UNA_SEMANA}", None, 20),
+    ("exportar_ingresos (7 días)", "exportar_ingresos", "GET",
+     lambda i, c: f"/export/ingresos?desde={HACE_UNA_SEMANA}", None, 20),
+    ("exportar_movimientos (filtrado)", "exportar_movimientos", "GET",
+     lambda i, c: "/export/movimientos?tipo=ingreso&monto_min=500", None, 20),
+    ("importar_pedidos (100 filas)", "importar_pedidos", "POST", lambda i, c: "/import/pedidos",
+     lambda i, c: [_pedido(f"{i}-{k}", c) for k in range(100)], 20),
+    ("importar_ingresos (100 filas)", "importar_ingresos", "POST", lambda i, c: "/import/ingresos",
+     lambda i, c: [{"numero_pedido": str(1000 + (i * 100 + k) % c["pedidos"]), "monto": "5",
+                    "fecha": HOY.isoformat()} for k in range(100)], 20),
+    ("administracion_panel", "administracion_panel", "GET", lambda i, c: "/administracion", None, None),
+    ("perfil_usuarios", "perfil_usuarios", "GET", lambda i, c: "/usuarios", None, None),
+    ("nuevo_usuario", "nuevo_usuario", "POST", lambda i, c: "/usuarios/nuevo",
+     lambda i, c: {"username": f"bench{i}", "password": "x", "mod_pedidos": "1"}, 10),
+    ("editar_usuario", "editar_usuario", "POST", lambda i, c: "/usuarios/editar/2",
+     lambda i, c: {"username": f"bench-editado-{i}", "password": "", "mod_pedidos": "1"}, None),
+    ("eliminar_usuario", "eliminar_usuario", "POST", lambda i, c: f"/usuarios/eliminar/{i + 2}", None, 10),
+    ("categorias_list", "categorias_list", "GET", lambda i, c: "/categorias", None, None),
+    ("nueva_categoria", "nueva_categoria", "POST", lambda i, c: "/categorias/nueva",
+     lambda i, c: {"tipo": "egreso", "nombre": f"Bench {i}"}, None),
+    ("editar_categoria", "editar_categoria", "POST", lambda i, c: f"/categorias/editar/{c['categorias'] + 1}",
+     lambda i, c: {"tipo": "egreso", "nombre": f"Bench editada {i}"}, None),
+    ("nueva_subcategoria", "nueva_subcategoria", "POST", lambda i, c: "/subcategorias/nueva",
+     lambda i, c: {"categoria_id": str(c["categorias"] + 1), "nombre": f"Sub bench {i}"}, None),
+    ("editar_subcategoria", "editar_subcategoria", "POST",
+     lambda i, c: f"/subcategorias/editar/{c['subcategorias'] + 1}", lambda i, c: {"nombre": f"Sub {i}"}, None),
+    ("eliminar_subcategoria", "eliminar_subcategoria", "POST",
+     lambda i, c: f"/subcategorias/eliminar/{c['subcategorias'] + 1 + i}", None, None),
+    ("eliminar_categoria", "eliminar_categoria", "POST",
+     lambda i, c: f"/categorias/eliminar/{c['categorias'] + 1 + i}", None, None),
+    ("api_encolar_trabajo", "api_encolar_trabajo", "POST", lambda i, c: "/api/jobs",
+     lambda i, c: {"tipo": "optimizar"}, None),
+    ("api_trabajo", "api_trabajo", "GET", lambda i, c: "/api/jobs/1", None, None),
+    ("metrics", "metrics", "GET", lambda i, c: "/metrics", None, None),
+    ("logout", "logout", "GET", lambda i, c: "/logout", None, None),
+]
+
+# Escrituras con datos inválidos: se comprueban una vez antes del bench.
+# (caso, ruta(ctx), datos, código esperado)
+RECHAZOS = [
+    ("nuevo_pedido fecha inválida", lambda c: "/nuevo_pedido", {**_pedido(0, None), "fecha": "31/12/2024"}, 400),
+    ("nuevo_pedido importe inválido", lambda c: "/nuevo_pedido", {**_pedido(0, None), "importe": "mil"}, 400),
+    ("api_editar_pedido fecha inválida", lambda c: f"/api/editar_pedido/{c['pedidos']}",
+     {"cliente": "x", "descripcion": "x", "fecha_entrega_propuesta": "2024-13-45"}, 400),
+]
+
+
+def _cliente(erp):
+    cliente = erp.app.test_client()
+    with cliente.session_transaction() as s:
+        s["user_id"] = 1
+    return cliente
+
+
+def _pedir(cliente, metodo, ruta, cuerpo):
+    if metodo == "GET":
+        return cliente.get(ruta, query_string=cuerpo)
+    if isinstance(cuerpo, list):
+        return cliente.post(ruta, json=cuerpo)
+    return cliente.post(ruta, data=cuerpo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="1k")
+    parser.add_argument("--dir", help="base ya generada con bench.datos (se usa una copia)")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--solo", help="casos o endpoints separados por coma")
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+    if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+        print(f"Generando base {args.escala} en {origen}...")
+        datos.preparar(origen, args.escala, salida=print)
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    try:
+        conn = sqlite3.connect(os.path.join(origen, "mi_erp.db"))
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        shutil.copy(os.path.join(origen, "mi_erp.db"), tmp)
+        erp = datos.preparar(tmp)
+        erp.STREAM_DURACION = 0  # /api/stream: solo la apertura, sin quedarse escuchando
+
+        conn = sqlite3.connect(erp.DB_NAME)
+        ctx = {tabla: conn.execute(f"SELECT MAX(id) FROM {tabla}").fetchone()[0] or 0
+               for tabla in ("pedidos", "ingresos", "movimientos", "categorias", "subcategorias")}
+        conn.close()
+
+        endpoints = {regla.endpoint for regla in erp.app.url_map.iter_rules()} - {"static"}
+        sin_caso = endpoints - {endpoint for _, endpoint, *_ in RUTAS}
+        if sin_caso:
+            print(f"⚠️ Rutas sin caso en bench/rutas.py: {', '.join(sorted(sin_caso))}")
+        solo = set(args.solo.split(",")) if args.solo else None
+
+        conn = sqlite3.connect(erp.DB_NAME)
+        antes = conn.execute("SELECT COUNT(*), TOTAL(LENGTH(fecha_entrega_propuesta)) FROM pedidos").fetchone()
+        for caso, ruta, cuerpo, esperado in RECHAZOS:
+            resp = _pedir(_cliente(erp), "POST", ruta(ctx), cuerpo)
+            assert resp.status_code == esperado, (caso, resp.status_code)
+        despues = conn.execute("SELECT COUNT(*), TOTAL(LENGTH(fecha_entrega_propuesta)) FROM pedidos").fetchone()
+        conn.close()
+        assert antes == despues, "una escritura inválida modificó pedidos"
+
+        salida = {}
+        for caso, endpoint, metodo, ruta, cuerpo, maximo in RUTAS:
+            if endpoint not in endpoints or (solo and caso not in solo and endpoint not in solo):
+                continue
+            cliente = _cliente(erp)
+            n = min(args.repeticiones, maximo or args.repeticiones)
+            latencias = []
+            codigos = set()
+            for i in itertools.chain([n], range(n)):  # la primera (índice n) calienta cachés
+                url = ruta(i, ctx)
+                datos_peticion = cuerpo(i, ctx) if cuerpo else None
+                t0 = time.perf_counter()
+                resp = _pedir(cliente, metodo, url, datos_peticion)
+                resp.get_data()
+                if i != n or n == 0:
+                    latencias.append(time.perf_counter() - t0)
+                codigos.add(resp.status_code)
+                if endpoint == "logout":
+                    cliente = _cliente(erp)
+            salida[caso] = {"endpoint": endpoint, **resultados.percentiles(latencias), "codigos": sorted(codigos)}
+            r = salida[caso]
+            print(f"{caso:<34} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f}  "
+                  f"HTTP {','.join(map(str, r['codigos']))}")
+
+        resultados.guardar(args.salida, "rutas",
+                           {"escala": args.escala, "repeticiones": args.repeticiones, **ctx}, salida)
+    finally:
+        os.chdir(datos.RAIZ)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Suscriptores SSE ociosos contra gunicorn: costo en reposo y latencia de entrega.
+
+Levanta gunicorn (gthread o gevent) sobre una copia de la base de
+bench.datos, abre N conexiones a /api/stream y mide:
+- CPU de gunicorn con los N suscriptores abiertos y sin cambios;
+- /api/pedidos y /api/dashboard mientras tanto;
+- entrega: desde que se envía un toggle de ingreso hasta que cada
+  suscriptor recibe el evento (incluye el intervalo de sondeo).
+
+Uso:
+    python -m bench.stream --suscriptores 200 --worker-class gthread --salida stream_gthread.json
+    python -m bench.stream --suscriptores 200 --worker-class gevent --salida stream_gevent.json
+"""
+import argparse
+import math
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from bench import datos, resultados
+from bench.carga_http import _levantar_gunicorn, _pedir, _puerto_libre
+
+
+class Suscriptor(threading.Thread):
+    """Una conexión a /api/stream (HTTP/1.0: sin chunked) que anota cuándo llega cada id."""
+
+    def __init__(self, puerto, cookie):
+        super().__init__(daemon=True)
+        self.puerto = puerto
+        self.cookie = cookie
+        self.conectado = threading.Event()
+        self.inicio = None
+        self.recibidos = {}  # id -> momento
+        self.error = None
+
+    def run(self):
+        try:
+            with socket.create_connection(("127.0.0.1", self.puerto), timeout=120) as s:
+                s.sendall((f"GET /api/stream HTTP/1.0\r\nHost: 127.0.0.1\r\nCookie: {self.cookie}\r\n"
+                           "Accept: text/event-stream\r\n\r\n").encode())
+                ultimo_id = None
+                for linea in s.makefile("rb"):
+                    linea = linea.decode().rstrip("\r\n")
+                    if linea.startswith("id: "):
+                        ultimo_id = int(linea[4:])
+                    elif linea == "event: inicio":
+                        self.inicio = ultimo_id
+                        self.conectado.set()
+                    elif linea == "event: cambio":
+                        self.recibidos[ultimo_id] = time.perf_counter()
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            self.conectado.set()
+
+
+def _cpu_segundos(pid):
+    """CPU (usuario + sistema) del proceso y sus hijos directos vivos."""
+    hijos = subprocess.run(["ps", "-o", "pid=", "--ppid", str(pid)], capture_output=True, text=True).stdout.split()
+    total = 0
+    for p in [pid] + [int(h) for h in hijos]:
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+            total += int(campos[11]) + int(campos[12])
+        except OSError:
+            continue
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="1k")
+    parser.add_argument("--dir", help="base ya generada con bench.datos (se usa una copia)")
+    parser.add_argument("--suscriptores", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-class", default="gthread", choices=("gthread", "gevent"))
+    parser.add_argument("--ocioso", type=float, default=10, help="segundos midiendo en reposo")
+    parser.add_argument("--eventos", type=int, default=20)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+    if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+        print(f"Generando base {args.escala} en {origen}...")
+        datos.preparar(origen, args.escala, salida=print)
+    conn = sqlite3.connect(os.path.join(origen, "mi_erp.db"))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    n_ingresos = conn.execute("SELECT MAX(id) FROM ingresos").fetchone()[0]
+    conn.close()
+
+    # Con gthread cada stream ocupa un hilo: alcanzan los suscriptores más margen
+    hilos = math.ceil((args.suscriptores + 32) / args.workers)
+    os.environ.update({"ERP_WORKER_CLASS": args.worker_class, "ERP_HILOS": str(hilos)})
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    puerto = _puerto_libre()
+    servidor = None
+    salida = {}
+    try:
+        shutil.copy(os.path.join(origen, "mi_erp.db"), tmp)
+        servidor = _levantar_gunicorn(tmp, args.workers, puerto)
+        _, cookie = _pedir("127.0.0.1", puerto, "POST", "/", {"username": "Administrador", "password": "1812"})
+        cookie = cookie.split(";", 1)[0]
+
+        t0 = time.perf_counter()
+        suscriptores = [Suscriptor(puerto, cookie) for _ in range(args.suscriptores)]
+        for s in suscriptores:
+            s.start()
+        for s in suscriptores:
+            s.conectado.wait(60)
+        conectados = [s for s in suscriptores if s.inicio is not None]
+        salida["conexion"] = {"suscriptores": args.suscriptores, "conectados": len(conectados),
+                              "segundos": round(time.perf_counter() - t0, 2)}
+
+        cpu0, t0 = _cpu_segundos(servidor.pid), time.perf_counter()
+        time.sleep(args.ocioso)
+        cpu = (_cpu_segundos(servidor.pid) - cpu0) / (time.perf_counter() - t0)
+        salida["reposo"] = {"cpu_pct": round(cpu * 100, 2)}
+
+        for nombre, ruta in (("api_pedidos", "/api/pedidos?draw=1&start=0&length=25"),
+                             ("api_dashboard", "/api/dashboard")):
+            latencias = []
+            for _ in range(50):
+                t = time.perf_counter()
+                estado, _ = _pedir("127.0.0.1", puerto, "GET", ruta, cookie=cookie)
+                latencias.append(time.perf_counter() - t)
+                assert estado == 200, estado
+            salida[f"{nombre}_con_suscriptores"] = resultados.percentiles(latencias)
+
+        base = max(s.inicio for s in conectados)
+        enviados = []
+        for k in range(args.eventos):
+            enviados.append(time.perf_counter())
+            cuerpo = {"ingreso_id": k % n_ingresos + 1, "valor": k % 2}
+            estado, _ = _pedir("127.0.0.1", puerto, "POST", "/api/toggle_ingreso", cuerpo, cookie)
+            assert estado == 200, estado
+            time.sleep(0.25)
+        time.sleep(3)
+
+        entregas, perdidos = [], 0
+        for s in conectados:
+            for k, enviado in enumerate(enviados):
+                recibido = s.recibidos.get(base + k + 1)
+                if recibido is None:
+                    perdidos += 1
+                else:
+                    entregas.append(recibido - enviado)
+        salida["entrega"] = {**resultados.percentiles(entregas), "perdidos": perdidos}
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for nombre, r in salida.items():
+        print(f"{nombre:<30} " + "  ".join(f"{k} {v}" for k, v in r.items()))
+    resultados.guardar(args.salida, "stream", {
+        "escala": args.escala, "suscriptores": args.suscriptores, "workers": args.workers,
+        "worker_class": args.worker_class, "hilos": hilos, "eventos": args.eventos,
+    }, salida)
+    return 1 if perdidos or len(conectados) < args.suscriptores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Cola de trabajos: lo que cuesta encolar frente a lo que tardaría en línea.
+
+Sobre una copia de la base de bench.datos mide:
+- POST /api/jobs (lo que ahora espera la petición);
+- recalcular_resumenes ejecutado por un hilo worker (lo que antes habría
+  bloqueado un worker de gunicorn), con su avance;
+- /api/dashboard y /api/pedidos en reposo y mientras el trabajo corre.
+
+Uso:
+    python -m bench.trabajos --escala 100k --dir /tmp/erp_100k --salida trabajos.json
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from bench import datos, resultados
+
+LECTURAS = ("/api/dashboard", "/api/pedidos?draw=1&start=0&length=25")
+
+
+def _leer(cli, latencias):
+    for ruta in LECTURAS:
+        t0 = time.perf_counter()
+        assert cli.get(ruta).status_code == 200
+        latencias.append(time.perf_counter() - t0)
+
+
+def _trabajar(erp):
+    conn = erp._conectar()
+    erp.ejecutar_trabajo(conn, erp.tomar_trabajo(conn))
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="1k")
+    parser.add_argument("--dir", help="base ya generada con bench.datos (se usa una copia)")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    origen = args.dir or os.path.join(tempfile.gettempdir(), f"erp_bench_{args.escala}")
+    if not os.path.exists(os.path.join(origen, "mi_erp.db")):
+        print(f"Generando base {args.escala} en {origen}...")
+        datos.preparar(origen, args.escala, salida=print)
+    conn = sqlite3.connect(os.path.join(origen, "mi_erp.db"))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    tmp = tempfile.mkdtemp(prefix="bench_erp_")
+    salida = {}
+    try:
+        shutil.copy(os.path.join(origen, "mi_erp.db"), tmp)
+        os.chdir(tmp)
+        sys.path.insert(0, datos.RAIZ)
+        import app as erp
+
+        cli = erp.app.test_client()
+        cli.post("/", data={"username": "Administrador", "password": "1812"})
+
+        encolar = []
+        for _ in range(args.repeticiones):
+            t0 = time.perf_counter()
+            r = cli.post("/api/jobs", data={"tipo": "recalcular_resumenes"})
+            encolar.append(time.perf_counter() - t0)
+            assert r.status_code == 202, r.json
+        salida["encolar"] = resultados.percentiles(encolar)
+        trabajo_id = r.json["id"]
+
+        reposo = []
+        fin = time.monotonic() + 3
+        while time.monotonic() < fin:
+            _leer(cli, reposo)
+        salida["lecturas_en_reposo"] = resultados.percentiles(reposo)
+
+        avance, lecturas = [], []
+        hilo = threading.Thread(target=_trabajar, args=(erp,))
+        t0 = time.perf_counter()
+        hilo.start()
+        while hilo.is_alive():
+            _leer(cli, lecturas)
+            t = cli.get(f"/api/jobs/{trabajo_id}").json["trabajo"]
+            if not avance or avance[-1][1:] != (t["progreso"], t["mensaje"]):
+                avance.append((round(time.perf_counter() - t0, 3), t["progreso"], t["mensaje"]))
+        hilo.join()
+        duracion = time.perf_counter() - t0
+        t = cli.get(f"/api/jobs/{trabajo_id}").json["trabajo"]
+        assert t["estado"] == "terminado", t
+        salida["recalcular_resumenes"] = {"duracion_ms": round(duracion * 1000, 2), "filas": t["resultado"]["filas"]}
+        salida["lecturas_durante_trabajo"] = resultados.percentiles(lecturas)
+    finally:
+        os.chdir(datos.RAIZ)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for nombre, r in salida.items():
+        print(f"{nombre:<28} " + "  ".join(f"{k} {v}" for k, v in r.items()))
+    print("avance (s, progreso, paso):", avance)
+    resultados.guardar(args.salida, "trabajos", {"escala": args.escala, "repeticiones": args.repeticiones}, salida)
+
+
+if __name__ == "__main__":
+    main()
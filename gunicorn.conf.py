@@ -0,0 +1,33 @@
+"""Configuración de gunicorn (se lee sola desde el directorio de trabajo).
+
+Puerto y cantidad de workers siguen viniendo de PORT y WEB_CONCURRENCY.
+"""
+import importlib.util
+import os
+
+# Cada página con /api/stream abierto ocupa una conexión todo el tiempo: con
+# workers sync bastarían unas pocas pestañas para bloquear la app. Si gevent
+# está instalado (pip install gevent) se usa por defecto y cada worker
+# atiende hasta ERP_CONEXIONES conexiones; si no, gthread. ERP_WORKER_CLASS
+# fuerza uno u otro (bench/stream.py --worker-class compara los dos).
+worker_class = os.environ.get("ERP_WORKER_CLASS") or (
+    "gevent" if importlib.util.find_spec("gevent") else "gthread")
+# Con gthread cada pestaña de /pedidos abierta retiene un hilo mientras
+# dure (se reconecta cada app.STREAM_DURACION segundos): pasadas unas
+# ERP_HILOS - 4 pestañas por worker, el resto de las peticiones espera un
+# hilo libre. Los logins retienen a lo sumo app.LOGIN_HILOS + app.LOGIN_COLA
+# hilos (4). Con más pestañas que eso: gevent, más workers o más hilos.
+threads = int(os.environ.get("ERP_HILOS", "64"))  # solo gthread
+worker_connections = int(os.environ.get("ERP_CONEXIONES", "1000"))  # solo gevent
+
+
+def on_starting(server):
+    """Prepara la base en el master, una sola vez y antes de crear workers.
+
+    Importar app ejecuta preparar_base(); los workers heredan el módulo ya
+    cargado (como con preload_app) y arrancan sin tocar la base. El pool de
+    login se crea en cada worker, después del fork (y del monkey-patching
+    de gevent).
+    """
+    import app
+    app._hash_ficticio()  # scrypt una vez aquí y no en cada worker
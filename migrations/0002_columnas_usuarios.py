@@ -0,0 +1,33 @@
+"""Migración 0002: columnas de permisos en 'usuarios' (antes ensure_user_columns).
+
+Bases creadas antes de los permisos por módulo no tienen estas columnas; se
+agregan las que falten y se normalizan los NULL a sus defaults una sola vez.
+"""
+
+
+def upgrade(conn):
+    c = conn.cursor()
+    c.execute("PRAGMA table_info(usuarios)")
+    cols = {row[1] for row in c.fetchall()}
+
+    def add_col(name, ddl):
+        if name not in cols:
+            c.execute(f"ALTER TABLE usuarios ADD COLUMN {name} {ddl}")
+
+    add_col("password", "TEXT DEFAULT ''")
+    add_col("is_admin", "INTEGER DEFAULT 0")
+    add_col("mod_pedidos", "INTEGER DEFAULT 1")
+    add_col("mod_movimientos", "INTEGER DEFAULT 1")
+    add_col("mod_admin", "INTEGER DEFAULT 0")
+    add_col("mod_usuarios", "INTEGER DEFAULT 0")
+
+    # Normalizar NULLs a sus defaults
+    c.execute("""
+        UPDATE usuarios SET
+            password = COALESCE(password, ''),
+            is_admin = COALESCE(is_admin, 0),
+            mod_pedidos = COALESCE(mod_pedidos, 1),
+            mod_movimientos = COALESCE(mod_movimientos, 1),
+            mod_admin = COALESCE(mod_admin, 0),
+            mod_usuarios = COALESCE(mod_usuarios, 0)
+    """)
@@ -0,0 +1,22 @@
+-- ==========================
+-- Migración 0003: índices secundarios
+-- ==========================
+
+-- Ingresos por pedido (totales, detalle de la fila, borrado de pedidos)
+CREATE INDEX IF NOT EXISTS idx_ingresos_pedido ON ingresos(pedido_id);
+
+-- Efectivo en caja: solo ingresos no depositados
+UPDATE ingresos SET depositado = 0 WHERE depositado IS NULL;
+CREATE INDEX IF NOT EXISTS idx_ingresos_depositado ON ingresos(depositado, pedido_id);
+
+-- Subcategorías por categoría (API de combos y FK)
+CREATE INDEX IF NOT EXISTS idx_subcategorias_categoria ON subcategorias(categoria_id);
+
+-- Movimientos por categoría/subcategoría (filtros y FK al borrar)
+CREATE INDEX IF NOT EXISTS idx_movimientos_categoria ON movimientos(categoria_id);
+CREATE INDEX IF NOT EXISTS idx_movimientos_subcategoria ON movimientos(subcategoria_id);
+
+-- Orden por # Pedido numérico sin CAST en cada fila
+ALTER TABLE pedidos ADD COLUMN numero_pedido_num INTEGER
+    GENERATED ALWAYS AS (CAST(numero_pedido AS INTEGER)) VIRTUAL;
+CREATE INDEX IF NOT EXISTS idx_pedidos_numero ON pedidos(numero_pedido_num, numero_pedido);
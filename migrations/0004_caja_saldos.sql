@@ -0,0 +1,88 @@
+-- ==========================
+-- Migración 0004: efectivo en caja y total de ingresos materializados
+-- ==========================
+-- caja_saldos guarda el efectivo no depositado por moneda y
+-- pedidos.total_ingresos la suma de ingresos de cada pedido. Los mantienen
+-- los triggers de abajo en la misma transacción que cada escritura, así que
+-- leer la caja es O(1). `flask conciliar-caja` los recalcula desde cero.
+
+ALTER TABLE pedidos ADD COLUMN total_ingresos REAL NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS caja_saldos (
+    moneda TEXT PRIMARY KEY,  -- 'PEN' o 'USD' (todo lo que no es USD cuenta como PEN)
+    efectivo REAL NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO caja_saldos (moneda, efectivo) VALUES ('PEN', 0), ('USD', 0);
+
+-- Carga inicial desde los datos existentes
+UPDATE pedidos SET total_ingresos = (
+    SELECT COALESCE(SUM(i.monto), 0) FROM ingresos i WHERE i.pedido_id = pedidos.id
+);
+UPDATE caja_saldos SET efectivo = (
+    SELECT COALESCE(SUM(i.monto), 0)
+    FROM ingresos i JOIN pedidos p ON p.id = i.pedido_id
+    WHERE i.depositado = 0
+      AND (CASE WHEN p.moneda = 'USD' THEN 'USD' ELSE 'PEN' END) = caja_saldos.moneda
+);
+
+-- --------------------------
+-- Triggers de ingresos
+-- --------------------------
+-- Si el pedido ya no existe (borrado en cascada) la subconsulta de moneda da
+-- NULL y la caja no se toca: ese caso lo descuenta pedidos_caja_bd.
+CREATE TRIGGER IF NOT EXISTS ingresos_caja_ai AFTER INSERT ON ingresos
+BEGIN
+    UPDATE pedidos SET total_ingresos = total_ingresos + NEW.monto WHERE id = NEW.pedido_id;
+    UPDATE caja_saldos SET efectivo = efectivo + NEW.monto
+    WHERE NEW.depositado = 0
+      AND moneda = (SELECT CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END
+                    FROM pedidos WHERE id = NEW.pedido_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ingresos_caja_ad AFTER DELETE ON ingresos
+BEGIN
+    UPDATE pedidos SET total_ingresos = total_ingresos - OLD.monto WHERE id = OLD.pedido_id;
+    UPDATE caja_saldos SET efectivo = efectivo - OLD.monto
+    WHERE OLD.depositado = 0
+      AND moneda = (SELECT CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END
+                    FROM pedidos WHERE id = OLD.pedido_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ingresos_caja_au AFTER UPDATE OF pedido_id, monto, depositado ON ingresos
+BEGIN
+    UPDATE pedidos SET total_ingresos = total_ingresos - OLD.monto WHERE id = OLD.pedido_id;
+    UPDATE pedidos SET total_ingresos = total_ingresos + NEW.monto WHERE id = NEW.pedido_id;
+    UPDATE caja_saldos SET efectivo = efectivo - OLD.monto
+    WHERE OLD.depositado = 0
+      AND moneda = (SELECT CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END
+                    FROM pedidos WHERE id = OLD.pedido_id);
+    UPDATE caja_saldos SET efectivo = efectivo + NEW.monto
+    WHERE NEW.depositado = 0
+      AND moneda = (SELECT CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END
+                    FROM pedidos WHERE id = NEW.pedido_id);
+END;
+
+-- --------------------------
+-- Triggers de pedidos
+-- --------------------------
+-- Cambio de moneda: el efectivo pendiente del pedido pasa a la otra caja
+CREATE TRIGGER IF NOT EXISTS pedidos_caja_au AFTER UPDATE OF moneda ON pedidos
+WHEN (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+  <> (CASE WHEN NEW.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+BEGIN
+    UPDATE caja_saldos SET efectivo = efectivo + (
+        CASE WHEN moneda = 'USD' THEN 1 ELSE -1 END
+        * (CASE WHEN NEW.moneda = 'USD' THEN 1 ELSE -1 END)
+        * (SELECT COALESCE(SUM(monto), 0) FROM ingresos WHERE pedido_id = NEW.id AND depositado = 0)
+    );
+END;
+
+-- Borrado de un pedido con ingresos pendientes (p. ej. por cascada)
+CREATE TRIGGER IF NOT EXISTS pedidos_caja_bd BEFORE DELETE ON pedidos
+BEGIN
+    UPDATE caja_saldos SET efectivo = efectivo - (
+        SELECT COALESCE(SUM(monto), 0) FROM ingresos WHERE pedido_id = OLD.id AND depositado = 0
+    )
+    WHERE moneda = (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END);
+END;
@@ -0,0 +1,45 @@
+-- ==========================
+-- Migración 0005: contadores de versión de datos
+-- ==========================
+-- Cada clave se incrementa cuando cambian los datos que representa. Los
+-- cachés de cada worker comparan su versión con esta fila (una búsqueda por
+-- PK) para saber si siguen vigentes, aunque la escritura la haya hecho otro
+-- worker de gunicorn.
+
+CREATE TABLE IF NOT EXISTS versiones (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO versiones (clave, valor) VALUES ('catalogo', 0);
+
+-- 'catalogo': categorías y subcategorías
+CREATE TRIGGER IF NOT EXISTS categorias_version_ai AFTER INSERT ON categorias
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'catalogo';
+END;
+
+CREATE TRIGGER IF NOT EXISTS categorias_version_au AFTER UPDATE ON categorias
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'catalogo';
+END;
+
+CREATE TRIGGER IF NOT EXISTS categorias_version_ad AFTER DELETE ON categorias
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'catalogo';
+END;
+
+CREATE TRIGGER IF NOT EXISTS subcategorias_version_ai AFTER INSERT ON subcategorias
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'catalogo';
+END;
+
+CREATE TRIGGER IF NOT EXISTS subcategorias_version_au AFTER UPDATE ON subcategorias
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'catalogo';
+END;
+
+CREATE TRIGGER IF NOT EXISTS subcategorias_version_ad AFTER DELETE ON subcategorias
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'catalogo';
+END;
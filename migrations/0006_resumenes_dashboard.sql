@@ -0,0 +1,169 @@
+-- ==========================
+-- Migración 0006: resúmenes diarios para el dashboard
+-- ==========================
+-- Tablas agregadas que mantienen los triggers en cada escritura, para que
+-- /api/dashboard lea cientos de filas y no millones.
+--   resumen_pedidos_diario: por fecha del pedido, moneda, canal y etapa.
+--     Los ingresos se atribuyen a la fecha del pedido (vía total_ingresos).
+--   resumen_entregas_pendientes: pedidos sin entrega real, por fecha
+--     propuesta; "vencidos" = fechas anteriores a hoy.
+--   resumen_movimientos: por tipo y categoría (movimientos no tiene fecha).
+-- moneda se normaliza como en caja_saldos y canal NULL se guarda como ''.
+
+CREATE TABLE IF NOT EXISTS resumen_pedidos_diario (
+    fecha TEXT NOT NULL,
+    moneda TEXT NOT NULL,
+    canal TEXT NOT NULL,
+    etapa TEXT NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    importe REAL NOT NULL DEFAULT 0,
+    gasto REAL NOT NULL DEFAULT 0,
+    ingresos REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, moneda, canal, etapa)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS resumen_entregas_pendientes (
+    fecha_entrega_propuesta TEXT NOT NULL,
+    moneda TEXT NOT NULL,
+    canal TEXT NOT NULL,
+    etapa TEXT NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha_entrega_propuesta, moneda, canal, etapa)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS resumen_movimientos (
+    tipo TEXT NOT NULL,
+    categoria_id INTEGER NOT NULL,  -- 0 = sin categoría
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (tipo, categoria_id)
+) WITHOUT ROWID;
+
+-- Carga inicial
+INSERT INTO resumen_pedidos_diario (fecha, moneda, canal, etapa, cantidad, importe, gasto, ingresos)
+SELECT fecha, CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END, COALESCE(canal, ''), COALESCE(etapa, ''),
+       COUNT(*), COALESCE(SUM(importe), 0), COALESCE(SUM(gasto), 0), COALESCE(SUM(total_ingresos), 0)
+FROM pedidos
+GROUP BY 1, 2, 3, 4;
+
+INSERT INTO resumen_entregas_pendientes (fecha_entrega_propuesta, moneda, canal, etapa, cantidad)
+SELECT fecha_entrega_propuesta, CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END,
+       COALESCE(canal, ''), COALESCE(etapa, ''), COUNT(*)
+FROM pedidos
+WHERE fecha_entrega_real IS NULL AND fecha_entrega_propuesta IS NOT NULL
+GROUP BY 1, 2, 3, 4;
+
+INSERT INTO resumen_movimientos (tipo, categoria_id, cantidad, total)
+SELECT tipo, COALESCE(categoria_id, 0), COUNT(*), COALESCE(SUM(monto), 0)
+FROM movimientos
+GROUP BY 1, 2;
+
+-- --------------------------
+-- Triggers de pedidos
+-- --------------------------
+CREATE TRIGGER IF NOT EXISTS pedidos_resumen_ai AFTER INSERT ON pedidos
+BEGIN
+    INSERT INTO resumen_pedidos_diario (fecha, moneda, canal, etapa, cantidad, importe, gasto, ingresos)
+    VALUES (NEW.fecha, CASE WHEN NEW.moneda = 'USD' THEN 'USD' ELSE 'PEN' END,
+            COALESCE(NEW.canal, ''), COALESCE(NEW.etapa, ''),
+            1, COALESCE(NEW.importe, 0), COALESCE(NEW.gasto, 0), NEW.total_ingresos)
+    ON CONFLICT (fecha, moneda, canal, etapa) DO UPDATE SET
+        cantidad = cantidad + 1,
+        importe = importe + excluded.importe,
+        gasto = gasto + excluded.gasto,
+        ingresos = ingresos + excluded.ingresos;
+
+    INSERT INTO resumen_entregas_pendientes (fecha_entrega_propuesta, moneda, canal, etapa, cantidad)
+    SELECT NEW.fecha_entrega_propuesta, CASE WHEN NEW.moneda = 'USD' THEN 'USD' ELSE 'PEN' END,
+           COALESCE(NEW.canal, ''), COALESCE(NEW.etapa, ''), 1
+    WHERE NEW.fecha_entrega_real IS NULL AND NEW.fecha_entrega_propuesta IS NOT NULL
+    ON CONFLICT (fecha_entrega_propuesta, moneda, canal, etapa) DO UPDATE SET cantidad = cantidad + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS pedidos_resumen_ad AFTER DELETE ON pedidos
+BEGIN
+    UPDATE resumen_pedidos_diario SET
+        cantidad = cantidad - 1,
+        importe = importe - COALESCE(OLD.importe, 0),
+        gasto = gasto - COALESCE(OLD.gasto, 0),
+        ingresos = ingresos - OLD.total_ingresos
+    WHERE fecha = OLD.fecha
+      AND moneda = (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+      AND canal = COALESCE(OLD.canal, '') AND etapa = COALESCE(OLD.etapa, '');
+
+    UPDATE resumen_entregas_pendientes SET cantidad = cantidad - 1
+    WHERE OLD.fecha_entrega_real IS NULL
+      AND fecha_entrega_propuesta = OLD.fecha_entrega_propuesta
+      AND moneda = (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+      AND canal = COALESCE(OLD.canal, '') AND etapa = COALESCE(OLD.etapa, '');
+END;
+
+-- También se dispara cuando los triggers de ingresos actualizan total_ingresos
+CREATE TRIGGER IF NOT EXISTS pedidos_resumen_au
+AFTER UPDATE OF fecha, moneda, canal, etapa, importe, gasto, total_ingresos ON pedidos
+BEGIN
+    UPDATE resumen_pedidos_diario SET
+        cantidad = cantidad - 1,
+        importe = importe - COALESCE(OLD.importe, 0),
+        gasto = gasto - COALESCE(OLD.gasto, 0),
+        ingresos = ingresos - OLD.total_ingresos
+    WHERE fecha = OLD.fecha
+      AND moneda = (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+      AND canal = COALESCE(OLD.canal, '') AND etapa = COALESCE(OLD.etapa, '');
+
+    INSERT INTO resumen_pedidos_diario (fecha, moneda, canal, etapa, cantidad, importe, gasto, ingresos)
+    VALUES (NEW.fecha, CASE WHEN NEW.moneda = 'USD' THEN 'USD' ELSE 'PEN' END,
+            COALESCE(NEW.canal, ''), COALESCE(NEW.etapa, ''),
+            1, COALESCE(NEW.importe, 0), COALESCE(NEW.gasto, 0), NEW.total_ingresos)
+    ON CONFLICT (fecha, moneda, canal, etapa) DO UPDATE SET
+        cantidad = cantidad + 1,
+        importe = importe + excluded.importe,
+        gasto = gasto + excluded.gasto,
+        ingresos = ingresos + excluded.ingresos;
+END;
+
+CREATE TRIGGER IF NOT EXISTS pedidos_entregas_au
+AFTER UPDATE OF fecha_entrega_propuesta, fecha_entrega_real, moneda, canal, etapa ON pedidos
+BEGIN
+    UPDATE resumen_entregas_pendientes SET cantidad = cantidad - 1
+    WHERE OLD.fecha_entrega_real IS NULL
+      AND fecha_entrega_propuesta = OLD.fecha_entrega_propuesta
+      AND moneda = (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+      AND canal = COALESCE(OLD.canal, '') AND etapa = COALESCE(OLD.etapa, '');
+
+    INSERT INTO resumen_entregas_pendientes (fecha_entrega_propuesta, moneda, canal, etapa, cantidad)
+    SELECT NEW.fecha_entrega_propuesta, CASE WHEN NEW.moneda = 'USD' THEN 'USD' ELSE 'PEN' END,
+           COALESCE(NEW.canal, ''), COALESCE(NEW.etapa, ''), 1
+    WHERE NEW.fecha_entrega_real IS NULL AND NEW.fecha_entrega_propuesta IS NOT NULL
+    ON CONFLICT (fecha_entrega_propuesta, moneda, canal, etapa) DO UPDATE SET cantidad = cantidad + 1;
+END;
+
+-- --------------------------
+-- Triggers de movimientos
+-- --------------------------
+CREATE TRIGGER IF NOT EXISTS movimientos_resumen_ai AFTER INSERT ON movimientos
+BEGIN
+    INSERT INTO resumen_movimientos (tipo, categoria_id, cantidad, total)
+    VALUES (NEW.tipo, COALESCE(NEW.categoria_id, 0), 1, NEW.monto)
+    ON CONFLICT (tipo, categoria_id) DO UPDATE SET
+        cantidad = cantidad + 1,
+        total = total + excluded.total;
+END;
+
+CREATE TRIGGER IF NOT EXISTS movimientos_resumen_ad AFTER DELETE ON movimientos
+BEGIN
+    UPDATE resumen_movimientos SET cantidad = cantidad - 1, total = total - OLD.monto
+    WHERE tipo = OLD.tipo AND categoria_id = COALESCE(OLD.categoria_id, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS movimientos_resumen_au AFTER UPDATE OF tipo, categoria_id, monto ON movimientos
+BEGIN
+    UPDATE resumen_movimientos SET cantidad = cantidad - 1, total = total - OLD.monto
+    WHERE tipo = OLD.tipo AND categoria_id = COALESCE(OLD.categoria_id, 0);
+
+    INSERT INTO resumen_movimientos (tipo, categoria_id, cantidad, total)
+    VALUES (NEW.tipo, COALESCE(NEW.categoria_id, 0), 1, NEW.monto)
+    ON CONFLICT (tipo, categoria_id) DO UPDATE SET
+        cantidad = cantidad + 1,
+        total = total + excluded.total;
+END;
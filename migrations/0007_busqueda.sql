@@ -0,0 +1,66 @@
+-- ==========================
+-- Migración 0007: búsqueda de texto completo (FTS5)
+-- ==========================
+-- Índices FTS con contenido externo: no duplican el texto, solo el índice.
+-- Los triggers los mantienen sincronizados y `flask reconstruir-busqueda`
+-- los rehace desde las tablas.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS pedidos_fts USING fts5(
+    cliente, descripcion, oc, doc_venta, numero_pedido, motivo_retraso,
+    content='pedidos', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS movimientos_fts USING fts5(
+    descripcion,
+    content='movimientos', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+INSERT INTO pedidos_fts(pedidos_fts) VALUES ('rebuild');
+INSERT INTO movimientos_fts(movimientos_fts) VALUES ('rebuild');
+
+-- --------------------------
+-- Triggers de pedidos
+-- --------------------------
+CREATE TRIGGER IF NOT EXISTS pedidos_fts_ai AFTER INSERT ON pedidos
+BEGIN
+    INSERT INTO pedidos_fts (rowid, cliente, descripcion, oc, doc_venta, numero_pedido, motivo_retraso)
+    VALUES (NEW.id, NEW.cliente, NEW.descripcion, NEW.oc, NEW.doc_venta, NEW.numero_pedido, NEW.motivo_retraso);
+END;
+
+CREATE TRIGGER IF NOT EXISTS pedidos_fts_ad AFTER DELETE ON pedidos
+BEGIN
+    INSERT INTO pedidos_fts (pedidos_fts, rowid, cliente, descripcion, oc, doc_venta, numero_pedido, motivo_retraso)
+    VALUES ('delete', OLD.id, OLD.cliente, OLD.descripcion, OLD.oc, OLD.doc_venta, OLD.numero_pedido, OLD.motivo_retraso);
+END;
+
+CREATE TRIGGER IF NOT EXISTS pedidos_fts_au
+AFTER UPDATE OF cliente, descripcion, oc, doc_venta, numero_pedido, motivo_retraso ON pedidos
+BEGIN
+    INSERT INTO pedidos_fts (pedidos_fts, rowid, cliente, descripcion, oc, doc_venta, numero_pedido, motivo_retraso)
+    VALUES ('delete', OLD.id, OLD.cliente, OLD.descripcion, OLD.oc, OLD.doc_venta, OLD.numero_pedido, OLD.motivo_retraso);
+    INSERT INTO pedidos_fts (rowid, cliente, descripcion, oc, doc_venta, numero_pedido, motivo_retraso)
+    VALUES (NEW.id, NEW.cliente, NEW.descripcion, NEW.oc, NEW.doc_venta, NEW.numero_pedido, NEW.motivo_retraso);
+END;
+
+-- --------------------------
+-- Triggers de movimientos
+-- --------------------------
+CREATE TRIGGER IF NOT EXISTS movimientos_fts_ai AFTER INSERT ON movimientos
+BEGIN
+    INSERT INTO movimientos_fts (rowid, descripcion) VALUES (NEW.id, NEW.descripcion);
+END;
+
+CREATE TRIGGER IF NOT EXISTS movimientos_fts_ad AFTER DELETE ON movimientos
+BEGIN
+    INSERT INTO movimientos_fts (movimientos_fts, rowid, descripcion) VALUES ('delete', OLD.id, OLD.descripcion);
+END;
+
+CREATE TRIGGER IF NOT EXISTS movimientos_fts_au AFTER UPDATE OF descripcion ON movimientos
+BEGIN
+    INSERT INTO movimientos_fts (movimientos_fts, rowid, descripcion) VALUES ('delete', OLD.id, OLD.descripcion);
+    INSERT INTO movimientos_fts (rowid, descripcion) VALUES (NEW.id, NEW.descripcion);
+END;
@@ -0,0 +1,9 @@
+-- ==========================
+-- Migración 0008: índice de entregas pendientes
+-- ==========================
+-- Índice parcial solo con los pedidos sin entrega real, ordenado por fecha
+-- propuesta: "vencidos", "vencen hoy" y "vencen en N días" son rangos sobre
+-- este índice y no recorren la tabla de pedidos.
+CREATE INDEX IF NOT EXISTS idx_pedidos_entrega_pendiente
+    ON pedidos(fecha_entrega_propuesta)
+    WHERE fecha_entrega_real IS NULL;
@@ -0,0 +1,122 @@
+-- ==========================
+-- Migración 0009: tipos de cambio y resumen diario de ingresos
+-- ==========================
+-- tipos_cambio: tasa diaria de cada moneda extranjera en soles (PEN por 1
+-- unidad). Se carga con `flask cargar-tipos-cambio archivo.csv`; para una
+-- fecha sin tasa se usa la última anterior.
+-- resumen_ingresos_diario: ingresos por fecha del ingreso y moneda del
+-- pedido, para convertirlos con la tasa de su propia fecha sin recorrer la
+-- tabla de ingresos. Lo mantienen los triggers como a caja_saldos (0004).
+
+CREATE TABLE IF NOT EXISTS tipos_cambio (
+    moneda TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    tasa REAL NOT NULL,
+    PRIMARY KEY (moneda, fecha)
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO versiones (clave, valor) VALUES ('tipos_cambio', 0);
+
+CREATE TRIGGER IF NOT EXISTS tipos_cambio_version_ai AFTER INSERT ON tipos_cambio
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'tipos_cambio';
+END;
+
+CREATE TRIGGER IF NOT EXISTS tipos_cambio_version_au AFTER UPDATE ON tipos_cambio
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'tipos_cambio';
+END;
+
+CREATE TRIGGER IF NOT EXISTS tipos_cambio_version_ad AFTER DELETE ON tipos_cambio
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'tipos_cambio';
+END;
+
+CREATE TABLE IF NOT EXISTS resumen_ingresos_diario (
+    fecha TEXT NOT NULL,
+    moneda TEXT NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    monto REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, moneda)
+) WITHOUT ROWID;
+
+-- Carga inicial
+INSERT INTO resumen_ingresos_diario (fecha, moneda, cantidad, monto)
+SELECT i.fecha, CASE WHEN p.moneda = 'USD' THEN 'USD' ELSE 'PEN' END, COUNT(*), SUM(i.monto)
+FROM ingresos i JOIN pedidos p ON p.id = i.pedido_id
+GROUP BY 1, 2;
+
+-- --------------------------
+-- Triggers de ingresos
+-- --------------------------
+-- Igual que en caja_saldos: si el pedido ya no existe (cascada) no se toca
+-- nada y lo descuenta pedidos_ingresos_diario_bd.
+CREATE TRIGGER IF NOT EXISTS ingresos_diario_ai AFTER INSERT ON ingresos
+BEGIN
+    INSERT INTO resumen_ingresos_diario (fecha, moneda, cantidad, monto)
+    SELECT NEW.fecha, CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END, 1, NEW.monto
+    FROM pedidos WHERE id = NEW.pedido_id
+    ON CONFLICT (fecha, moneda) DO UPDATE SET
+        cantidad = cantidad + 1,
+        monto = monto + excluded.monto;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ingresos_diario_ad AFTER DELETE ON ingresos
+BEGIN
+    UPDATE resumen_ingresos_diario SET cantidad = cantidad - 1, monto = monto - OLD.monto
+    WHERE fecha = OLD.fecha
+      AND moneda = (SELECT CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END
+                    FROM pedidos WHERE id = OLD.pedido_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ingresos_diario_au AFTER UPDATE OF pedido_id, monto, fecha ON ingresos
+BEGIN
+    UPDATE resumen_ingresos_diario SET cantidad = cantidad - 1, monto = monto - OLD.monto
+    WHERE fecha = OLD.fecha
+      AND moneda = (SELECT CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END
+                    FROM pedidos WHERE id = OLD.pedido_id);
+
+    INSERT INTO resumen_ingresos_diario (fecha, moneda, cantidad, monto)
+    SELECT NEW.fecha, CASE WHEN moneda = 'USD' THEN 'USD' ELSE 'PEN' END, 1, NEW.monto
+    FROM pedidos WHERE id = NEW.pedido_id
+    ON CONFLICT (fecha, moneda) DO UPDATE SET
+        cantidad = cantidad + 1,
+        monto = monto + excluded.monto;
+END;
+
+-- --------------------------
+-- Triggers de pedidos
+-- --------------------------
+-- Cambio de moneda: los ingresos del pedido pasan a la otra moneda, por fecha
+CREATE TRIGGER IF NOT EXISTS pedidos_ingresos_diario_au AFTER UPDATE OF moneda ON pedidos
+WHEN (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+  <> (CASE WHEN NEW.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+BEGIN
+    UPDATE resumen_ingresos_diario SET
+        cantidad = cantidad - (SELECT COUNT(*) FROM ingresos
+                               WHERE pedido_id = OLD.id AND fecha = resumen_ingresos_diario.fecha),
+        monto = monto - (SELECT COALESCE(SUM(monto), 0) FROM ingresos
+                         WHERE pedido_id = OLD.id AND fecha = resumen_ingresos_diario.fecha)
+    WHERE moneda = (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+      AND fecha IN (SELECT fecha FROM ingresos WHERE pedido_id = OLD.id);
+
+    INSERT INTO resumen_ingresos_diario (fecha, moneda, cantidad, monto)
+    SELECT fecha, CASE WHEN NEW.moneda = 'USD' THEN 'USD' ELSE 'PEN' END, COUNT(*), SUM(monto)
+    FROM ingresos WHERE pedido_id = NEW.id
+    GROUP BY fecha
+    ON CONFLICT (fecha, moneda) DO UPDATE SET
+        cantidad = cantidad + excluded.cantidad,
+        monto = monto + excluded.monto;
+END;
+
+-- Borrado de un pedido con ingresos (p. ej. por cascada)
+CREATE TRIGGER IF NOT EXISTS pedidos_ingresos_diario_bd BEFORE DELETE ON pedidos
+BEGIN
+    UPDATE resumen_ingresos_diario SET
+        cantidad = cantidad - (SELECT COUNT(*) FROM ingresos
+                               WHERE pedido_id = OLD.id AND fecha = resumen_ingresos_diario.fecha),
+        monto = monto - (SELECT COALESCE(SUM(monto), 0) FROM ingresos
+                         WHERE pedido_id = OLD.id AND fecha = resumen_ingresos_diario.fecha)
+    WHERE moneda = (CASE WHEN OLD.moneda = 'USD' THEN 'USD' ELSE 'PEN' END)
+      AND fecha IN (SELECT fecha FROM ingresos WHERE pedido_id = OLD.id);
+END;
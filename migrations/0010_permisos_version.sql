@@ -0,0 +1,21 @@
+-- ==========================
+-- Migración 0010: versión de permisos de usuarios
+-- ==========================
+-- 'permisos' se incrementa cuando cambia o se borra un usuario. El caché de
+-- permisos de cada worker (requires() en app.py) compara contra esta fila,
+-- así una revocación vale desde la siguiente petición en todos los workers.
+-- El cambio de contraseña (incluida la actualización a hash en el login) no
+-- cambia permisos y no invalida nada.
+
+INSERT OR IGNORE INTO versiones (clave, valor) VALUES ('permisos', 0);
+
+CREATE TRIGGER IF NOT EXISTS usuarios_version_au
+AFTER UPDATE OF username, is_admin, mod_pedidos, mod_movimientos, mod_admin, mod_usuarios ON usuarios
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'permisos';
+END;
+
+CREATE TRIGGER IF NOT EXISTS usuarios_version_ad AFTER DELETE ON usuarios
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'permisos';
+END;
@@ -0,0 +1,33 @@
+-- ==========================
+-- Migración 0011: cola de trabajos en segundo plano
+-- ==========================
+-- La app encola (INSERT) y responde; worker.py toma los pendientes con un
+-- UPDATE ... RETURNING atómico (SQLite 3.35+), reporta progreso en la misma
+-- fila y reintenta con espera creciente hasta max_intentos.
+-- estado: pendiente | en_curso | terminado | fallido. Fechas en UTC.
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    parametros TEXT NOT NULL DEFAULT '{}',
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    max_intentos INTEGER NOT NULL DEFAULT 3,
+    progreso REAL NOT NULL DEFAULT 0,
+    mensaje TEXT,
+    resultado TEXT,
+    error TEXT,
+    usuario_id INTEGER,
+    creado_en TEXT NOT NULL DEFAULT (datetime('now')),
+    disponible_en TEXT NOT NULL DEFAULT (datetime('now')),
+    iniciado_en TEXT,
+    actualizado_en TEXT,
+    terminado_en TEXT
+);
+
+-- Próximo pendiente disponible: rango sobre un índice chico
+CREATE INDEX IF NOT EXISTS idx_trabajos_pendientes
+    ON trabajos(disponible_en)
+    WHERE estado = 'pendiente';
+
+-- Último de cada tipo (mantenimiento periódico, encolar sin duplicar)
+CREATE INDEX IF NOT EXISTS idx_trabajos_tipo ON trabajos(tipo, creado_en);
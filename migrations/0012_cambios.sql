@@ -0,0 +1,16 @@
+-- ==========================
+-- Migración 0012: feed de cambios de pedidos e ingresos
+-- ==========================
+-- Registro de solo inserción que escriben las rutas de pedidos e ingresos
+-- en la misma transacción que el cambio; /api/stream lo sigue por id y lo
+-- envía como Server-Sent Events. datos es el JSON que la página aplica
+-- (el mismo delta que devuelven las APIs de ingresos). El trabajo
+-- periódico podar_cambios borra lo que tenga más de unos días.
+CREATE TABLE IF NOT EXISTS cambios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tabla TEXT NOT NULL,     -- 'pedidos' | 'ingresos'
+    accion TEXT NOT NULL,    -- 'alta' | 'edicion' | 'baja'
+    registro_id INTEGER NOT NULL,
+    datos TEXT NOT NULL DEFAULT '{}',
+    fecha TEXT NOT NULL DEFAULT (datetime('now'))
+);
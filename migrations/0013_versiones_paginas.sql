@@ -0,0 +1,30 @@
+-- ==========================
+-- Migración 0013: versiones de las páginas de movimientos y pedidos
+-- ==========================
+-- El ETag de cada página HTML se arma con las versiones de los datos que
+-- muestra (condicional() en app.py). 'movimientos' cambia con cualquier
+-- escritura en movimientos; 'caja' con cada cambio de caja_saldos, que es
+-- lo único de la base que renderiza /pedidos (la tabla llega por
+-- /api/pedidos).
+
+INSERT OR IGNORE INTO versiones (clave, valor) VALUES ('movimientos', 0), ('caja', 0);
+
+CREATE TRIGGER IF NOT EXISTS movimientos_version_ai AFTER INSERT ON movimientos
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'movimientos';
+END;
+
+CREATE TRIGGER IF NOT EXISTS movimientos_version_au AFTER UPDATE ON movimientos
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'movimientos';
+END;
+
+CREATE TRIGGER IF NOT EXISTS movimientos_version_ad AFTER DELETE ON movimientos
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'movimientos';
+END;
+
+CREATE TRIGGER IF NOT EXISTS caja_saldos_version_au AFTER UPDATE ON caja_saldos
+BEGIN
+    UPDATE versiones SET valor = valor + 1 WHERE clave = 'caja';
+END;
@@ -0,0 +1,21 @@
+-- ==========================
+-- Migración 0014: índices de orden de /api/pedidos
+-- ==========================
+-- La tabla de pedidos se ordena y pagina por keyset sobre (clave, id) para
+-- cada columna de PEDIDOS_COLUMNAS en app.py. Sin un índice con esa misma
+-- clave cada página es un SCAN de pedidos más un B-TREE temporal para
+-- ordenar. # Pedido ya tiene idx_pedidos_numero (0003).
+--
+-- Etapa y moneda se ordenan con su valor por defecto (COALESCE): como con
+-- numero_pedido_num, van en columnas generadas para que el cursor de
+-- keyset pueda buscar en el índice (sobre una expresión SQLite no lo hace).
+
+ALTER TABLE pedidos ADD COLUMN etapa_orden TEXT
+    GENERATED ALWAYS AS (COALESCE(etapa, '')) VIRTUAL;
+ALTER TABLE pedidos ADD COLUMN moneda_orden TEXT
+    GENERATED ALWAYS AS (COALESCE(moneda, 'PEN')) VIRTUAL;
+
+CREATE INDEX IF NOT EXISTS idx_pedidos_fecha ON pedidos(fecha, id);
+CREATE INDEX IF NOT EXISTS idx_pedidos_cliente ON pedidos(cliente, id);
+CREATE INDEX IF NOT EXISTS idx_pedidos_etapa ON pedidos(etapa_orden, id);
+CREATE INDEX IF NOT EXISTS idx_pedidos_moneda ON pedidos(moneda_orden, id);
@@ -0,0 +1,60 @@
+"""Worker de la cola de trabajos (ver COLA DE TRABAJOS en app.py).
+
+    python worker.py
+
+Corre ERP_TRABAJOS_CONCURRENCIA hilos (1 por defecto), cada uno con su
+conexión; SQLite admite un solo escritor, así que más de 2-3 rara vez
+ayuda. También encola el mantenimiento periódico y libera trabajos de
+workers caídos. SIGTERM/SIGINT dejan terminar el trabajo en curso.
+"""
+import logging
+import os
+import signal
+import threading
+
+import app as erp
+
+ESPERA = 2.0  # segundos entre consultas con la cola vacía
+REVISION = 300  # segundos entre revisiones de periódicos y trabajos caídos
+
+
+def _procesar(parar):
+    conn = erp._conectar()
+    try:
+        while not parar.is_set():
+            fila = erp.tomar_trabajo(conn)
+            if fila is None:
+                parar.wait(ESPERA)
+                continue
+            erp.ejecutar_trabajo(conn, fila)
+    finally:
+        conn.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+    concurrencia = max(1, int(os.environ.get("ERP_TRABAJOS_CONCURRENCIA", "1")))
+    parar = threading.Event()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(senal, lambda *_: parar.set())
+
+    hilos = [threading.Thread(target=_procesar, args=(parar,), name=f"trabajos-{i}") for i in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    logging.info("Worker de trabajos iniciado con %s hilo(s)", concurrencia)
+
+    conn = erp._conectar()
+    try:
+        while not parar.is_set():
+            if erp.recuperar_trabajos(conn):
+                logging.warning("Trabajos sin avance liberados")
+            erp.encolar_periodicos(conn)
+            parar.wait(REVISION)
+    finally:
+        conn.close()
+        for hilo in hilos:
+            hilo.join()
+
+
+if __name__ == "__main__":
+    main()